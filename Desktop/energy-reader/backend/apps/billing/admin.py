@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Bill
+from .events import publish_status
+from .models import Bill, BillBatch, LayoutFingerprint, OCRCacheEntry
 
 
 @admin.register(Bill)
@@ -20,8 +22,9 @@ class BillAdmin(admin.ModelAdmin):
         'instalacao', 'file_hash'
     ]
     readonly_fields = [
-        'file_hash', 'parsed_json', 'created_at', 'updated_at', 
-        'processed_at', 'total_impostos', 'custo_kwh_efetivo'
+        'file_hash', 'parsed_json', 'parser_version', 'created_at', 'updated_at', 
+        'processed_at', 'total_impostos', 'custo_kwh_efetivo',
+        'processing_started_at', 'processing_attempts'
     ]
     ordering = ['-created_at']
     
@@ -53,11 +56,14 @@ class BillAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Dados Brutos', {
-            'fields': ('parsed_json',),
+            'fields': ('parsed_json', 'parser_version'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
-            'fields': ('created_at', 'updated_at', 'processed_at'),
+            'fields': (
+                'created_at', 'updated_at', 'processed_at',
+                'processing_started_at', 'processing_attempts'
+            ),
             'classes': ('collapse',)
         }),
     )
@@ -79,19 +85,66 @@ class BillAdmin(admin.ModelAdmin):
     
     def reprocess_bills(self, request, queryset):
         """Action to reprocess selected bills"""
-        from .tasks import process_bill_task
+        from .scheduling import enqueue_bulk
+        from .tasks import unclaimed
+        
+        # Bills a live worker holds right now are left to finish; stale claims are reset
+        queryset = queryset.filter(unclaimed())
+        by_user = {}
+        for bill_id, user_id in queryset.values_list('id', 'user_id'):
+            by_user.setdefault(user_id, []).append(bill_id)
+        now = timezone.now()
+        count = queryset.update(status=Bill.Status.UPLOADED, error_message='', updated_at=now)
         
-        count = 0
-        for bill in queryset:
-            bill.status = Bill.Status.UPLOADED
-            bill.error_message = ''
-            bill.save()
-            process_bill_task.delay(bill.id)
-            count += 1
+        # Wake status long-polls of the owners (update() sends no signals)
+        for user_id, bill_ids in by_user.items():
+            for bill_id in bill_ids:
+                publish_status(Bill(id=bill_id, user_id=user_id, status=Bill.Status.UPLOADED,
+                                    error_message='', updated_at=now))
+        
+        # Bulk lane, so mass reprocessing does not delay interactive uploads
+        for user_id, bill_ids in by_user.items():
+            enqueue_bulk(user_id, bill_ids)
         
         self.message_user(
             request, 
             f'{count} conta(s) enviada(s) para reprocessamento.'
         )
     
-    reprocess_bills.short_description = 'Reprocessar contas selecionadas'
\ No newline at end of file
+    reprocess_bills.short_description = 'Reprocessar contas selecionadas'
+
+
+@admin.register(OCRCacheEntry)
+class OCRCacheEntryAdmin(admin.ModelAdmin):
+    """Admin for cached OCR results"""
+    
+    list_display = ['id', 'file_hash', 'engine_version', 'created_at']
+    list_filter = ['engine_version', 'created_at']
+    search_fields = ['file_hash']
+    readonly_fields = ['file_hash', 'engine_version', 'text', 'barcodes', 'pages', 'words', 'created_at']
+    ordering = ['-created_at']
+
+
+@admin.register(LayoutFingerprint)
+class LayoutFingerprintAdmin(admin.ModelAdmin):
+    """Admin for known bill layout fingerprints"""
+    
+    list_display = ['layout_hash', 'distributor', 'template_version', 'preprocessing_profile', 'created_at']
+    list_filter = ['distributor']
+    search_fields = ['layout_hash', 'distributor']
+    ordering = ['distributor', 'template_version']
+    
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        from .ocr.fingerprint import invalidate_layout_cache
+        invalidate_layout_cache()
+
+
+@admin.register(BillBatch)
+class BillBatchAdmin(admin.ModelAdmin):
+    """Admin for batch uploads"""
+    
+    list_display = ['id', 'user', 'total', 'created_at']
+    search_fields = ['user__email']
+    readonly_fields = ['user', 'total', 'created_at']
+    ordering = ['-created_at']
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class BillingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.billing'
-    verbose_name = 'Contas de Energia'
\ No newline at end of file
+    verbose_name = 'Contas de Energia'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
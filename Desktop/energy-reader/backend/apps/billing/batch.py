@@ -0,0 +1,183 @@
+import hashlib
+import os
+import zipfile
+from dataclasses import dataclass, field
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+from .models import Bill, BillBatch
+from .uploads import file_sha256
+
+BILL_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png')
+
+_COPY_CHUNK = 64 * 1024
+
+
+@dataclass
+class BatchResult:
+    batch: BillBatch
+    bills: List[Bill] = field(default_factory=list)
+    # (file name, existing bill id)
+    duplicates: List[Tuple[str, int]] = field(default_factory=list)
+    # (file name, reason)
+    skipped: List[Tuple[str, str]] = field(default_factory=list)
+    # Bill id -> uploaded file name
+    names: Dict[int, str] = field(default_factory=dict)
+
+
+def iter_batch_files(uploads: Iterable, skipped: List[Tuple[str, str]]) -> Iterator[File]:
+    """Yield bill files from uploads, expanding zips member by member.
+
+    Every yielded file carries its SHA-256 as ``sha256``. Zip members are
+    decompressed once, hashed on the way into a spooled temporary file, and
+    checked against the batch limits using the bytes actually read rather
+    than the sizes the archive claims.
+    """
+    count = 0
+    total_size = 0
+    for upload in uploads:
+        if upload.name.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(upload)
+            except zipfile.BadZipFile:
+                skipped.append((upload.name, 'zip inválido'))
+                continue
+            with archive:
+                for info in archive.infolist():
+                    name = os.path.basename(info.filename)
+                    if info.is_dir() or not name or name.startswith('.'):
+                        continue
+                    if not name.lower().endswith(BILL_EXTENSIONS):
+                        skipped.append((name, 'formato não suportado'))
+                        continue
+                    if info.file_size > settings.BILL_BATCH_MAX_FILE_SIZE:
+                        skipped.append((name, 'arquivo muito grande'))
+                        continue
+                    count += 1
+                    _check_count(count)
+                    member = _extract_member(archive, info, settings.BILL_BATCH_MAX_TOTAL_SIZE - total_size)
+                    if member is None:
+                        # Larger than its header claimed
+                        skipped.append((name, 'arquivo muito grande'))
+                        continue
+                    member.name = name
+                    total_size += member.size
+                    yield member
+                    member.close()
+            continue
+
+        if not upload.name.lower().endswith(BILL_EXTENSIONS):
+            skipped.append((upload.name, 'formato não suportado'))
+            continue
+        if upload.size > settings.BILL_BATCH_MAX_FILE_SIZE:
+            skipped.append((upload.name, 'arquivo muito grande'))
+            continue
+        count += 1
+        _check_count(count)
+        total_size += upload.size
+        if total_size > settings.BILL_BATCH_MAX_TOTAL_SIZE:
+            raise ValidationError('Lote excede o tamanho máximo permitido')
+        upload.sha256 = file_sha256(upload)
+        yield upload
+
+
+def _check_count(count: int):
+    if count > settings.BILL_BATCH_MAX_FILES:
+        raise ValidationError(f'Lote excede o máximo de {settings.BILL_BATCH_MAX_FILES} arquivos')
+
+
+def _extract_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, remaining: int) -> Optional[File]:
+    """Decompress one member into a spooled file, hashing it and enforcing size limits.
+
+    Returns None for a member over the per-file limit; going past the
+    ``remaining`` batch size rejects the whole batch.
+    """
+    sha256 = hashlib.sha256()
+    spooled = SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    size = 0
+    with archive.open(info) as source:
+        while True:
+            chunk = source.read(_COPY_CHUNK)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > settings.BILL_BATCH_MAX_FILE_SIZE:
+                spooled.close()
+                return None
+            if size > remaining:
+                spooled.close()
+                raise ValidationError('Lote excede o tamanho máximo permitido')
+            sha256.update(chunk)
+            spooled.write(chunk)
+    spooled.seek(0)
+    member = File(spooled)
+    member.size = size
+    member.sha256 = sha256.hexdigest()
+    return member
+
+
+def create_batch(user, uploads: Iterable) -> BatchResult:
+    """Store a batch of uploads and create their bills in one insert.
+
+    Content the user already uploaded, before or earlier in the same batch,
+    is reported as a duplicate of the existing bill and not stored or
+    queued again.
+    """
+    batch = BillBatch(user=user)
+    result = BatchResult(batch=batch)
+    stored = {}
+    names = {}
+    existing = {}
+    repeated = []
+
+    try:
+        for upload in iter_batch_files(uploads, result.skipped):
+            if upload.sha256 in stored or upload.sha256 in existing:
+                repeated.append((upload.name, upload.sha256))
+                continue
+            # Checked before storing, so content the user already has is never written
+            bill_id = Bill.objects.filter(user=user, file_hash=upload.sha256).values_list('id', flat=True).first()
+            if bill_id is not None:
+                existing[upload.sha256] = bill_id
+                result.duplicates.append((upload.name, bill_id))
+                continue
+            bill = Bill(user=user, file_hash=upload.sha256)
+            bill.raw_file.save(upload.name, upload, save=False)
+            stored[upload.sha256] = bill
+            names[upload.sha256] = upload.name
+
+        while True:
+            try:
+                with transaction.atomic():
+                    batch.total = len(stored)
+                    batch.save()
+                    for bill in stored.values():
+                        bill.batch = batch
+                    result.bills = Bill.objects.bulk_create(list(stored.values()))
+                break
+            except IntegrityError:
+                # A concurrent upload inserted some of the same files first; insert the rest
+                raced = dict(
+                    Bill.objects.filter(user=user, file_hash__in=list(stored)).values_list('file_hash', 'id')
+                )
+                if not raced:
+                    raise
+                batch.pk = None
+                for file_hash, bill_id in raced.items():
+                    stored.pop(file_hash).raw_file.delete(save=False)
+                    result.duplicates.append((names[file_hash], bill_id))
+                existing.update(raced)
+    except Exception:
+        # Nothing references the stored files once the batch is rejected
+        for bill in stored.values():
+            bill.raw_file.delete(save=False)
+        raise
+
+    bill_ids = {bill.file_hash: bill.id for bill in result.bills}
+    bill_ids.update(existing)
+    result.duplicates += [(name, bill_ids[file_hash]) for name, file_hash in repeated]
+    result.names = {bill.id: names[bill.file_hash] for bill in result.bills}
+    return result
@@ -0,0 +1,152 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional, Tuple
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from .models import Bill
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# One pub/sub channel per user: "bill-status:<user id>"
+CHANNEL_PREFIX = 'bill-status'
+# Most status deltas returned by one long-poll
+MAX_CHANGES = 50
+
+# Long-polls currently held by this process, per user
+_waiters = Counter()
+_waiters_lock = threading.Lock()
+
+# (updated_at, bill id) watermark; a bare timestamp (id None) means strictly after it
+Position = Tuple[datetime, Optional[int]]
+
+
+def status_channel(user_id: int) -> str:
+    return f'{CHANNEL_PREFIX}:{user_id}'
+
+
+def _delta(bill_id: int, status: str, error_message: str, updated_at: datetime) -> dict:
+    return {
+        'id': bill_id,
+        'status': status,
+        'error_message': error_message,
+        'updated_at': updated_at.isoformat(),
+    }
+
+
+def publish_status(bill: Bill):
+    """Wake long-polls waiting on the bill's owner (never fails the caller)"""
+    client = get_redis()
+    if client is None:
+        return
+    message = _delta(bill.id, bill.status, bill.error_message, bill.updated_at)
+    try:
+        client.publish(status_channel(bill.user_id), json.dumps(message))
+    except Exception as e:
+        logger.warning(f"Bill status publish failed: {type(e).__name__}")
+
+
+def changes_since(user_id: int, since: Position, bill_id: Optional[int] = None) -> List[dict]:
+    """Status deltas of the user's bills after the ``since`` watermark, oldest first.
+
+    Read in (updated_at, id) order like the delta sync, so bills sharing an
+    updated_at are not lost when a response stops at MAX_CHANGES.
+    """
+    timestamp, pk = since
+    bills = Bill.objects.filter(user_id=user_id)
+    if pk is None:
+        bills = bills.filter(updated_at__gt=timestamp)
+    else:
+        bills = bills.filter(Q(updated_at__gt=timestamp) | Q(updated_at=timestamp, id__gt=pk))
+    if bill_id is not None:
+        bills = bills.filter(id=bill_id)
+    rows = bills.order_by('updated_at', 'id').values_list('id', 'status', 'error_message', 'updated_at')
+    return [_delta(*row) for row in rows[:MAX_CHANGES]]
+
+
+def next_position(changes: List[dict], since: Position) -> Position:
+    """Watermark after the returned deltas: the last one's (updated_at, id)"""
+    if not changes:
+        return since
+    return parse_datetime(changes[-1]['updated_at']), changes[-1]['id']
+
+
+def wait_for_changes(user_id: int, since: Position, bill_id: Optional[int] = None,
+                     timeout: float = 25) -> List[dict]:
+    """Block until a bill of the user changes after ``since`` or the timeout ends.
+
+    The channel is subscribed before the database is checked, so a
+    transition is either already visible to the query or delivered on the
+    channel. Without Redis, or when this process already holds its share
+    of waiters (BILL_STATUS_MAX_WAITERS, BILL_STATUS_MAX_WAITERS_PER_USER),
+    this degrades to a single check and the client falls back to polling.
+    """
+    if not _acquire_waiter(user_id):
+        return changes_since(user_id, since, bill_id)
+    try:
+        return _wait(user_id, since, bill_id, timeout)
+    finally:
+        _release_waiter(user_id)
+
+
+def _acquire_waiter(user_id: int) -> bool:
+    with _waiters_lock:
+        if (sum(_waiters.values()) >= settings.BILL_STATUS_MAX_WAITERS
+                or _waiters[user_id] >= settings.BILL_STATUS_MAX_WAITERS_PER_USER):
+            return False
+        _waiters[user_id] += 1
+        return True
+
+
+def _release_waiter(user_id: int):
+    with _waiters_lock:
+        _waiters[user_id] -= 1
+        if _waiters[user_id] <= 0:
+            del _waiters[user_id]
+
+
+def _wait(user_id: int, since: Position, bill_id: Optional[int], timeout: float) -> List[dict]:
+    pubsub = None
+    client = get_redis()
+    if client is not None:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(status_channel(user_id))
+        except Exception as e:
+            logger.warning(f"Bill status subscribe failed: {type(e).__name__}")
+            pubsub = None
+
+    try:
+        changes = changes_since(user_id, since, bill_id)
+        if changes or pubsub is None:
+            return changes
+        # Don't hold a database connection per waiter; the re-read reconnects
+        if not connection.in_atomic_block:
+            connection.close()
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            message = pubsub.get_message(timeout=remaining)
+            if message is None:
+                continue
+            if bill_id is not None and json.loads(message['data'])['id'] != bill_id:
+                continue
+            # Re-read rather than trust the message: concurrent transitions come back together
+            changes = changes_since(user_id, since, bill_id)
+            if changes:
+                return changes
+    except Exception as e:
+        logger.warning(f"Bill status wait failed: {type(e).__name__}")
+        return []
+    finally:
+        if pubsub is not None:
+            pubsub.close()
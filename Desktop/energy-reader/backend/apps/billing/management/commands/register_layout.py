@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.billing.models import LayoutFingerprint
+from apps.billing.ocr.fingerprint import layout_hash, render_first_page
+from apps.billing.ocr.preprocessing import PROFILES
+from apps.billing.ocr.templates import get_template
+
+
+class Command(BaseCommand):
+    help = 'Register sample bills as a known distributor layout for pre-OCR identification'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Sample bills (PDF or image) of the layout')
+        parser.add_argument('--distributor', required=True)
+        parser.add_argument('--template-version', default='', help='Region template version (ocr/templates.py)')
+        parser.add_argument('--profile', default='', choices=[''] + list(PROFILES), help='Preprocessing profile')
+
+    def handle(self, *args, **options):
+        distributor = options['distributor']
+        template_version = options['template_version']
+        if template_version and get_template(distributor, template_version) is None:
+            raise CommandError(f'No template {distributor}:{template_version} is registered')
+
+        for file_path in options['files']:
+            gray = render_first_page(file_path)
+            if gray is None or not gray.size:
+                raise CommandError(f'Could not render {file_path}')
+
+            fingerprint, created = LayoutFingerprint.objects.update_or_create(
+                layout_hash=layout_hash(gray),
+                defaults={
+                    'distributor': distributor,
+                    'template_version': template_version,
+                    'preprocessing_profile': options['profile'],
+                }
+            )
+            action = 'Registered' if created else 'Updated'
+            self.stdout.write(self.style.SUCCESS(f'{action} {fingerprint} from {file_path}'))
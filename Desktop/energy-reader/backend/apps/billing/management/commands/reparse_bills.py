@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.billing.parsers import PARSER_VERSION
+from apps.billing.reparse import reparse_stale_bills, stale_bills
+
+
+class Command(BaseCommand):
+    help = 'Re-parse stored OCR output of bills parsed by an older parser version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=settings.REPARSE_CHUNK_SIZE)
+        parser.add_argument('--workers', type=int, default=settings.REPARSE_WORKERS, help='Parser processes')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many bills')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{stale_bills().count()} bills below parser version {PARSER_VERSION}')
+        stats = reparse_stale_bills(
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            limit=options['limit']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-parsed {stats['reparsed']} bills ({stats['failed']} failed, {stats['skipped']} without stored OCR, "
+            f"{stats['changed']} changed meanwhile)"
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=64)),
+                ('engine_version', models.CharField(max_length=64)),
+                ('text', models.TextField(blank=True)),
+                ('barcodes', models.JSONField(blank=True, default=list)),
+                ('pages', models.JSONField(blank=True, default=list)),
+                ('words', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Cache de OCR',
+                'verbose_name_plural': 'Cache de OCR',
+                'db_table': 'ocr_cache_entries',
+                'indexes': [models.Index(fields=['engine_version'], name='ocr_cache_e_engine__233511_idx')],
+                'unique_together': {('file_hash', 'engine_version')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0002_ocr_cache_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LayoutFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('layout_hash', models.CharField(max_length=16, unique=True)),
+                ('distributor', models.CharField(max_length=100)),
+                ('template_version', models.CharField(blank=True, max_length=20)),
+                ('preprocessing_profile', models.CharField(blank=True, max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Assinatura de Layout',
+                'verbose_name_plural': 'Assinaturas de Layout',
+                'db_table': 'layout_fingerprints',
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0003_layout_fingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='ocr_barcodes',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='ocr_text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='ocr_words',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='parser_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['parser_version'], name='bills_parser__e7a736_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0004_bill_stored_ocr'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bill',
+            name='file_hash',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='bill',
+            constraint=models.UniqueConstraint(condition=models.Q(('file_hash', ''), _negated=True), fields=('user', 'file_hash'), name='unique_bill_file_per_user'),
+        ),
+    ]
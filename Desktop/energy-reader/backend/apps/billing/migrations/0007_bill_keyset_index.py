@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0006_bill_batch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='bills_user_id_6ef9e9_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0007_bill_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bill_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Conta Excluída',
+                'verbose_name_plural': 'Contas Excluídas',
+                'db_table': 'bill_tombstones',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='bills_user_id_5d32aa_idx'),
+        ),
+        migrations.AddField(
+            model_name='billtombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bill_tombstones', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='billtombstone',
+            index=models.Index(fields=['user', 'deleted_at'], name='bill_tombst_user_id_77d8c4_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0008_bill_tombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='processing_attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='processing_token',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
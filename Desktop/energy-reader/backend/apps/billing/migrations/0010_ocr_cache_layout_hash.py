@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 21:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0009_bill_processing_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrcacheentry',
+            name='layout_hash',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+    ]
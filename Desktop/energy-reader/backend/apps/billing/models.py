@@ -3,6 +3,7 @@ import os
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import FileExtensionValidator
+from .uploads import file_sha256
 
 User = get_user_model()
 
@@ -10,10 +11,39 @@ User = get_user_model()
 def bill_upload_path(instance, filename):
     """Generate upload path for bill files"""
     user_id = instance.user.id
-    file_hash = hashlib.sha256(filename.encode()).hexdigest()[:16]
+    # Content hash, set by Bill.save before the file is stored
+    file_hash = (instance.file_hash or hashlib.sha256(filename.encode()).hexdigest())[:16]
     return f'bills/{user_id}/{file_hash}_{filename}'
 
 
+# Results of processing a bill: raw OCR output and the fields parsed from it
+STORED_OCR_FIELDS = ['ocr_text', 'ocr_barcodes', 'ocr_words', 'parser_version', 'parsed_json']
+EXTRACTED_FIELDS = [
+    'fornecedor', 'numero_cliente', 'unidade_consumidora', 'instalacao', 'endereco',
+    'period_start', 'period_end', 'issue_date', 'due_date',
+    'consumo_kwh', 'tarifa_kwh', 'valor_total', 'bandeira_tarifaria',
+    'icms', 'pis', 'cofins', 'outros_impostos',
+    'linha_digitavel', 'codigo_de_barras',
+]
+
+
+class BillBatch(models.Model):
+    """Bills uploaded together in one request (multiple files or a zip)"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bill_batches')
+    total = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'bill_batches'
+        verbose_name = 'Lote de Contas'
+        verbose_name_plural = 'Lotes de Contas'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f'Lote {self.id} ({self.total} contas)'
+
+
 class Bill(models.Model):
     """Model for energy bills"""
     
@@ -32,17 +62,32 @@ class Bill(models.Model):
     
     # Basic fields
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bills')
+    batch = models.ForeignKey(
+        BillBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='bills'
+    )
     raw_file = models.FileField(
         upload_to=bill_upload_path,
         validators=[FileExtensionValidator(['pdf', 'jpg', 'jpeg', 'png'])]
     )
-    file_hash = models.CharField(max_length=64, unique=True)
+    file_hash = models.CharField(max_length=64)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.UPLOADED)
     error_message = models.TextField(blank=True)
     
+    # Claim of the task run currently processing the bill (see tasks.claim_bill)
+    processing_token = models.CharField(max_length=32, blank=True)
+    processing_started_at = models.DateTimeField(null=True, blank=True)
+    processing_attempts = models.PositiveIntegerField(default=0)
+    
     # Parsed data (JSON schema)
     parsed_json = models.JSONField(null=True, blank=True)
     
+    # Raw OCR output, kept so bills can be re-parsed without running OCR again
+    ocr_text = models.TextField(blank=True)
+    ocr_barcodes = models.JSONField(default=list, blank=True)
+    ocr_words = models.JSONField(null=True, blank=True)
+    # parsers.PARSER_VERSION that produced parsed_json (0 = never parsed)
+    parser_version = models.PositiveIntegerField(default=0)
+    
     # Extracted fields (for easier querying)
     fornecedor = models.CharField(max_length=100, blank=True)
     numero_cliente = models.CharField(max_length=50, blank=True)
@@ -88,8 +133,21 @@ class Bill(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', 'status']),
+            # Keyset pagination of a user's bills (BillCursorPagination)
+            models.Index(fields=['user', '-created_at', '-id']),
+            # Delta sync: range scan of a user's bills changed after a watermark
+            models.Index(fields=['user', 'updated_at', 'id']),
             models.Index(fields=['period_start', 'period_end']),
             models.Index(fields=['file_hash']),
+            models.Index(fields=['parser_version']),
+        ]
+        constraints = [
+            # Same content twice for one user returns the existing bill (see BillUploadView)
+            models.UniqueConstraint(
+                fields=['user', 'file_hash'],
+                condition=~models.Q(file_hash=''),
+                name='unique_bill_file_per_user'
+            ),
         ]
     
     def __str__(self):
@@ -98,13 +156,19 @@ class Bill(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.file_hash and self.raw_file:
-            # Generate file hash
-            self.raw_file.seek(0)
-            file_content = self.raw_file.read()
-            self.file_hash = hashlib.sha256(file_content).hexdigest()
-            self.raw_file.seek(0)
+            # Hashed while the upload streamed in (see uploads.py), else in chunks
+            self.file_hash = file_sha256(self.raw_file)
         super().save(*args, **kwargs)
     
+    def copy_results_from(self, source: 'Bill'):
+        """Take over another bill's stored file, OCR output and extracted data"""
+        self.raw_file = source.raw_file.name
+        self.file_hash = source.file_hash
+        self.status = source.status
+        self.processed_at = source.processed_at
+        for field in STORED_OCR_FIELDS + EXTRACTED_FIELDS:
+            setattr(self, field, getattr(source, field))
+    
     @property
     def total_impostos(self):
         """Calculate total taxes"""
@@ -116,4 +180,78 @@ class Bill(models.Model):
         """Calculate effective cost per kWh including taxes"""
         if self.consumo_kwh and self.valor_total:
             return self.valor_total / self.consumo_kwh
-        return None
\ No newline at end of file
+        return None
+
+
+class BillTombstone(models.Model):
+    """Record of a deleted bill, so syncing clients can drop it"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bill_tombstones')
+    bill_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'bill_tombstones'
+        verbose_name = 'Conta Excluída'
+        verbose_name_plural = 'Contas Excluídas'
+        indexes = [
+            models.Index(fields=['user', 'deleted_at']),
+        ]
+    
+    def __str__(self):
+        return f'Conta {self.bill_id} excluída em {self.deleted_at}'
+
+
+class OCRCacheEntry(models.Model):
+    """OCR output cached by file content and OCR engine configuration"""
+    
+    file_hash = models.CharField(max_length=64)
+    engine_version = models.CharField(max_length=64)
+    # Page-1 layout hash of the file, so a cache hit needs no fingerprint render
+    layout_hash = models.CharField(max_length=16, blank=True)
+    text = models.TextField(blank=True)
+    barcodes = models.JSONField(default=list, blank=True)
+    pages = models.JSONField(default=list, blank=True)
+    words = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'ocr_cache_entries'
+        verbose_name = 'Cache de OCR'
+        verbose_name_plural = 'Cache de OCR'
+        unique_together = ['file_hash', 'engine_version']
+        indexes = [
+            models.Index(fields=['engine_version']),
+        ]
+    
+    def __str__(self):
+        return f'OCR {self.file_hash[:12]} ({self.engine_version})'
+
+
+class LayoutFingerprint(models.Model):
+    """Page-1 header hash of a known bill layout, matched before OCR"""
+    
+    layout_hash = models.CharField(max_length=16, unique=True)
+    distributor = models.CharField(max_length=100)
+    template_version = models.CharField(max_length=20, blank=True)
+    preprocessing_profile = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'layout_fingerprints'
+        verbose_name = 'Assinatura de Layout'
+        verbose_name_plural = 'Assinaturas de Layout'
+    
+    def __str__(self):
+        return f'{self.distributor} {self.template_version} ({self.layout_hash})'
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .ocr.fingerprint import invalidate_layout_cache
+        invalidate_layout_cache()
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        from .ocr.fingerprint import invalidate_layout_cache
+        invalidate_layout_cache()
+        return result
@@ -0,0 +1,137 @@
+import cv2
+import logging
+import numpy as np
+from pyzbar import pyzbar
+from pyzbar.pyzbar import ZBarSymbol
+from typing import List, Tuple
+from .boleto import is_valid_boleto_barcode
+
+logger = logging.getLogger(__name__)
+
+# Boletos are ITF (Interleaved 2 of 5); CODE128 kept for older layouts
+BARCODE_SYMBOLS = [ZBarSymbol.I25, ZBarSymbol.CODE128]
+# Pix payment QR codes are square and can sit anywhere, so the whole page is scanned for them
+QR_SYMBOLS = [ZBarSymbol.QRCODE]
+# QR modules are large: the page-wide QR pass runs on a copy downscaled by this factor
+QR_SCALE = 2
+
+# Regions are located on a copy downscaled by this factor
+LOCATE_SCALE = 4
+# Fraction of the page height searched when no candidate region is found
+BOTTOM_BAND = 0.35
+# Candidate regions tried per page
+MAX_REGIONS = 4
+
+Region = Tuple[int, int, int, int]
+
+
+def find_barcode_regions(gray: np.ndarray) -> List[Region]:
+    """Locate barcode-like regions on a downscaled page.
+    
+    Barcodes have strong horizontal gradients and weak vertical ones, so
+    closing the gradient difference with a wide kernel leaves blobs where
+    the bars are. Regions are returned in page coordinates, bottom-most
+    first, since the boleto barcode sits at the foot of the bill.
+    """
+    height, width = gray.shape[:2]
+    small = cv2.resize(
+        gray, (max(width // LOCATE_SCALE, 1), max(height // LOCATE_SCALE, 1)),
+        interpolation=cv2.INTER_AREA
+    )
+    
+    grad_x = cv2.Sobel(small, cv2.CV_16S, 1, 0, ksize=3)
+    grad_y = cv2.Sobel(small, cv2.CV_16S, 0, 1, ksize=3)
+    gradient = cv2.convertScaleAbs(cv2.subtract(cv2.convertScaleAbs(grad_x), cv2.convertScaleAbs(grad_y)))
+    gradient = cv2.blur(gradient, (5, 5))
+    _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 5)))
+    mask = cv2.erode(mask, None, iterations=2)
+    mask = cv2.dilate(mask, None, iterations=2)
+    
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_width = small.shape[1] * 0.25
+    
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        # Boleto barcodes are wide, short strips spanning much of the page
+        if w < min_width or w < 3 * h:
+            continue
+        pad_x, pad_y = w // 10 + 2, h // 4 + 2
+        x0, y0 = max(x - pad_x, 0), max(y - pad_y, 0)
+        x1 = min(x + w + pad_x, small.shape[1])
+        y1 = min(y + h + pad_y, small.shape[0])
+        regions.append((
+            x0 * LOCATE_SCALE, y0 * LOCATE_SCALE,
+            (x1 - x0) * LOCATE_SCALE, (y1 - y0) * LOCATE_SCALE
+        ))
+    
+    regions.sort(key=lambda region: region[1] + region[3], reverse=True)
+    return regions[:MAX_REGIONS]
+
+
+def decode_barcodes(gray: np.ndarray) -> List[dict]:
+    """Decode barcodes from candidate regions at native resolution.
+    
+    Stops at the first valid 44-digit boleto. Falls back to the bottom band
+    of the page when no region yields one, and only then scans the whole
+    (downscaled) page for a Pix QR code.
+    """
+    height, width = gray.shape[:2]
+    band_top = int(height * (1 - BOTTOM_BAND))
+    
+    barcodes = []
+    for region in find_barcode_regions(gray) + [(0, band_top, width, height - band_top)]:
+        found = _decode_region(gray, region)
+        barcodes.extend(found)
+        if any(is_valid_boleto_barcode(barcode['data']) for barcode in found):
+            break
+    else:
+        barcodes.extend(_decode_qr(gray))
+    
+    return _unique(barcodes)
+
+
+def _decode_qr(gray: np.ndarray) -> List[dict]:
+    """Decode QR codes from a downscaled copy of the page, in page coordinates"""
+    height, width = gray.shape[:2]
+    small = cv2.resize(
+        gray, (max(width // QR_SCALE, 1), max(height // QR_SCALE, 1)),
+        interpolation=cv2.INTER_AREA
+    )
+    barcodes = _decode_region(small, (0, 0, small.shape[1], small.shape[0]), QR_SYMBOLS)
+    for barcode in barcodes:
+        barcode['rect'] = {key: value * QR_SCALE for key, value in barcode['rect'].items()}
+    return barcodes
+
+
+def _decode_region(gray: np.ndarray, region: Region, symbols=BARCODE_SYMBOLS) -> List[dict]:
+    x, y, w, h = region
+    crop = gray[y:y + h, x:x + w]
+    if crop.size == 0:
+        return []
+    
+    barcodes = []
+    for obj in pyzbar.decode(crop, symbols=symbols):
+        barcodes.append({
+            'type': obj.type,
+            'data': obj.data.decode('utf-8'),
+            'rect': {
+                'x': obj.rect.left + x,
+                'y': obj.rect.top + y,
+                'width': obj.rect.width,
+                'height': obj.rect.height
+            }
+        })
+    return barcodes
+
+
+def _unique(barcodes: List[dict]) -> List[dict]:
+    seen = set()
+    unique = []
+    for barcode in barcodes:
+        key = (barcode['type'], barcode['data'])
+        if key not in seen:
+            seen.add(key)
+            unique.append(barcode)
+    return unique
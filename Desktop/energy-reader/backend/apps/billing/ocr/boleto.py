@@ -0,0 +1,83 @@
+import re
+from typing import Optional
+
+# A printed payment line: digit groups split by dots, spaces or hyphens
+_PAYMENT_LINE = re.compile(r'\d[\d .-]{44,62}\d')
+
+
+def _mod10(digits: str) -> int:
+    total = 0
+    weight = 2
+    for digit in reversed(digits):
+        product = int(digit) * weight
+        total += product // 10 + product % 10
+        weight = 1 if weight == 2 else 2
+    return (10 - total % 10) % 10
+
+
+def _mod11_weighted_sum(digits: str) -> int:
+    total = 0
+    weight = 2
+    for digit in reversed(digits):
+        total += int(digit) * weight
+        weight = 2 if weight == 9 else weight + 1
+    return total
+
+
+def _bank_check_digit(digits: str) -> int:
+    """General check digit of a bank boleto (FEBRABAN)"""
+    dv = 11 - _mod11_weighted_sum(digits) % 11
+    return 1 if dv in (0, 10, 11) else dv
+
+
+def _collection_check_digit(digits: str, value_id: str) -> int:
+    """General check digit of a utility/collection boleto (arrecadação)"""
+    if value_id in '67':
+        return _mod10(digits)
+    remainder = _mod11_weighted_sum(digits) % 11
+    return 0 if remainder in (0, 1) else 11 - remainder
+
+
+def is_valid_boleto_barcode(code: str) -> bool:
+    """Validate the general check digit of a 44-digit boleto barcode.
+    
+    Utility bills (energy, water) use collection barcodes starting with '8',
+    whose check digit is the 4th digit; bank boletos keep it in the 5th.
+    """
+    if not code or len(code) != 44 or not code.isdigit():
+        return False
+    
+    if code[0] == '8':
+        value_id = code[2]
+        if value_id not in '6789':
+            return False
+        return int(code[3]) == _collection_check_digit(code[:3] + code[4:], value_id)
+    
+    return int(code[4]) == _bank_check_digit(code[:4] + code[5:])
+
+
+def barcode_from_payment_line(line: str) -> Optional[str]:
+    """44-digit barcode a linha digitável encodes, or None if it does not check out.
+    
+    Collection lines are four 11-digit blocks, each followed by a check
+    digit. Bank lines move the general check digit, due factor and value to
+    the end and split the free field into three checked groups.
+    """
+    digits = re.sub(r'\D', '', line)
+    if len(digits) == 48 and digits[0] == '8':
+        code = ''.join(digits[start:start + 11] for start in range(0, 48, 12))
+    elif len(digits) == 47:
+        code = digits[:4] + digits[32:47] + digits[4:9] + digits[10:20] + digits[21:31]
+    else:
+        return None
+    return code if is_valid_boleto_barcode(code) else None
+
+
+def find_payment_line_barcode(text: str) -> Optional[str]:
+    """Barcode of the first valid linha digitável printed in the text"""
+    for line in text.splitlines():
+        for match in _PAYMENT_LINE.finditer(line):
+            code = barcode_from_payment_line(match.group())
+            if code:
+                return code
+    return None
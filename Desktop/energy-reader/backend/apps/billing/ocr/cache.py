@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+from dataclasses import asdict
+from typing import Optional
+from .layout import OCRLayout
+from .pool import engine_settings
+from .result import OCRResult
+from .templates import LayoutTemplate
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the OCR pipeline output changes so cached results are rebuilt
+OCR_PIPELINE_VERSION = 3
+
+# Settings that only affect speed, not OCR output
+_VERSION_NEUTRAL_SETTINGS = {'page_workers'}
+
+
+def current_engine_version(profile: Optional[str] = None, template: Optional[LayoutTemplate] = None) -> str:
+    """Version key for the OCR pipeline and its output-affecting settings.
+    
+    The preprocessing ``profile`` and layout ``template`` chosen for a file
+    from its fingerprint are appended as a variant, so a result read one
+    way is not served for another. Every variant starts with the plain
+    pipeline version.
+    """
+    output_settings = {
+        key: value for key, value in engine_settings().items()
+        if key not in _VERSION_NEUTRAL_SETTINGS
+    }
+    version = f'v{OCR_PIPELINE_VERSION}-{_fingerprint(output_settings)}'
+    if profile or template is not None:
+        # Template reads depend on its regions, including their boxes
+        variant = {'profile': profile, 'template': asdict(template) if template is not None else None}
+        version += f'-{_fingerprint(variant)}'
+    return version
+
+
+def _fingerprint(value: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, default=_pattern_source).encode()
+    ).hexdigest()[:12]
+
+
+def _pattern_source(value) -> str:
+    """JSON form of the compiled value patterns in template regions"""
+    return value.pattern
+
+
+def cached_layout_hash(file_hash: str) -> Optional[str]:
+    """Page-1 layout hash stored with a current cache entry for this content.
+    
+    Lets content seen before pick its profile and template without
+    rendering page 1 again.
+    """
+    from ..models import OCRCacheEntry
+    
+    if not file_hash:
+        return None
+    
+    return OCRCacheEntry.objects.filter(
+        file_hash=file_hash,
+        engine_version__startswith=current_engine_version()
+    ).exclude(layout_hash='').values_list('layout_hash', flat=True).first()
+
+
+def get_cached_result(file_hash: str, profile: Optional[str] = None,
+                      template: Optional[LayoutTemplate] = None) -> Optional[OCRResult]:
+    """Return the cached OCR result for this content, profile and template, if any"""
+    from ..models import OCRCacheEntry
+    
+    if not file_hash:
+        return None
+    
+    entry = OCRCacheEntry.objects.filter(
+        file_hash=file_hash,
+        engine_version=current_engine_version(profile, template)
+    ).first()
+    if entry is None:
+        return None
+    
+    return OCRResult(
+        success=True,
+        text=entry.text,
+        barcodes=entry.barcodes,
+        pages=entry.pages,
+        layout=OCRLayout.from_dict(entry.words)
+    )
+
+
+def store_result(file_hash: str, result: OCRResult, profile: Optional[str] = None,
+                 template: Optional[LayoutTemplate] = None, layout_hash: str = ''):
+    """Cache a successful OCR result and drop older pipeline versions for the file"""
+    from ..models import OCRCacheEntry
+    
+    if not file_hash or not result.success:
+        return
+    
+    OCRCacheEntry.objects.update_or_create(
+        file_hash=file_hash,
+        engine_version=current_engine_version(profile, template),
+        defaults={
+            'layout_hash': layout_hash,
+            'text': result.text,
+            'barcodes': result.barcodes,
+            'pages': result.pages,
+            'words': result.layout.to_dict() if result.layout is not None else None,
+        }
+    )
+    OCRCacheEntry.objects.filter(file_hash=file_hash).exclude(
+        engine_version__startswith=current_engine_version()
+    ).delete()
+
+
+def evict_stale_versions() -> int:
+    """Delete cache entries produced by other pipeline versions"""
+    from ..models import OCRCacheEntry
+    
+    deleted, _ = OCRCacheEntry.objects.exclude(
+        engine_version__startswith=current_engine_version()
+    ).delete()
+    return deleted
@@ -0,0 +1,138 @@
+import logging
+from dataclasses import asdict, dataclass
+from typing import Optional
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from pdf2image import convert_from_path
+from .templates import content_bounds
+
+logger = logging.getLogger(__name__)
+
+# Page 1 is rendered this coarsely; the header layout survives, text does not need to
+FINGERPRINT_DPI = 50
+# Top share of the printed area hashed as the header (logo, distributor block)
+HEADER_FRACTION = 0.2
+# dHash grid: HASH_SIZE x HASH_SIZE bits
+HASH_SIZE = 8
+
+_CACHE_PREFIX = 'layout_fingerprint'
+
+
+@dataclass(frozen=True)
+class LayoutMatch:
+    """What a page-1 header hash says about a bill, before any OCR"""
+    layout_hash: str
+    distributor: Optional[str] = None
+    template_version: str = ''
+    preprocessing_profile: str = ''
+    distance: Optional[int] = None
+
+    @property
+    def known(self) -> bool:
+        return self.distributor is not None
+
+
+def render_first_page(file_path: str) -> Optional[np.ndarray]:
+    """Render page 1 as a small grayscale image"""
+    if file_path.lower().endswith('.pdf'):
+        rendered = convert_from_path(
+            file_path,
+            dpi=FINGERPRINT_DPI,
+            first_page=1,
+            last_page=1,
+            grayscale=True
+        )
+        return np.asarray(rendered[0]) if rendered else None
+    # Decoded at 1/4 size by libjpeg/libpng where supported
+    return cv2.imread(file_path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+
+
+def layout_hash(gray: np.ndarray) -> str:
+    """Difference hash (hex) of the header band of the printed area"""
+    left, top, right, bottom = content_bounds(gray)
+    header_bottom = top + max(int((bottom - top) * HEADER_FRACTION), 1)
+    header = gray[top:header_bottom, left:right]
+    small = cv2.resize(header, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return f'{value:0{HASH_SIZE * HASH_SIZE // 4}x}'
+
+
+def hamming_distance(first: str, second: str) -> int:
+    return bin(int(first, 16) ^ int(second, 16)).count('1')
+
+
+def identify_layout(file_path: str) -> Optional[LayoutMatch]:
+    """Hash page 1 and look the layout up among registered fingerprints.
+
+    Lookups are cached by layout hash, so repeat layouts cost one render
+    and one cache read. Returns None when the page cannot be rendered.
+    """
+    try:
+        gray = render_first_page(file_path)
+    except Exception as e:
+        logger.warning(f"Layout fingerprinting failed: {e}")
+        return None
+    if gray is None or not gray.size:
+        return None
+
+    return lookup_layout(layout_hash(gray))
+
+
+def lookup_layout(hash_value: str) -> LayoutMatch:
+    """Registered layout for a header hash, cached per hash.
+
+    The cache is per process, so invalidation only reaches the process
+    that changed the fingerprints. Only known layouts are cached, and
+    briefly: a newly registered layout is found at once everywhere, and
+    an edited or deleted one is stale for at most the cache timeout.
+    """
+    cache_key = f'{_CACHE_PREFIX}:{_generation()}:{hash_value}'
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return LayoutMatch(**cached)
+
+    match = match_layout_hash(hash_value)
+    if match.known:
+        cache.set(cache_key, asdict(match), settings.LAYOUT_FINGERPRINT_CACHE_TIMEOUT)
+    return match
+
+
+def invalidate_layout_cache():
+    """Forget this process's cached lookups after registered fingerprints change"""
+    try:
+        cache.incr(f'{_CACHE_PREFIX}:generation')
+    except ValueError:
+        cache.set(f'{_CACHE_PREFIX}:generation', 2, None)
+
+
+def _generation() -> int:
+    return cache.get_or_set(f'{_CACHE_PREFIX}:generation', 1, None)
+
+
+def match_layout_hash(hash_value: str) -> LayoutMatch:
+    """Nearest registered fingerprint within the configured Hamming distance"""
+    from ..models import LayoutFingerprint
+
+    best = None
+    best_distance = settings.LAYOUT_FINGERPRINT_MAX_DISTANCE + 1
+    for fingerprint in LayoutFingerprint.objects.all().only(
+        'layout_hash', 'distributor', 'template_version', 'preprocessing_profile'
+    ):
+        distance = hamming_distance(hash_value, fingerprint.layout_hash)
+        if distance < best_distance:
+            best, best_distance = fingerprint, distance
+
+    if best is None:
+        return LayoutMatch(layout_hash=hash_value)
+    return LayoutMatch(
+        layout_hash=hash_value,
+        distributor=best.distributor,
+        template_version=best.template_version,
+        preprocessing_profile=best.preprocessing_profile,
+        distance=best_distance
+    )
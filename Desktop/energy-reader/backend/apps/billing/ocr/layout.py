@@ -0,0 +1,170 @@
+import re
+import unicodedata
+from array import array
+from typing import Iterable, List, Optional, Sequence
+import numpy as np
+
+
+def _normalize(text: str) -> str:
+    """Lowercase and strip accents for label matching"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+class OCRLayout:
+    """Words/lines recognized by OCR with their boxes, stored column-wise.
+
+    Each entry has a text, an (x0, y0, x1, y1) box in page pixels, a
+    confidence (-1 when unknown) and a 1-based page number. Columns are
+    typed arrays so large documents stay compact, and spatial lookups use
+    a per-page index sorted by vertical centre.
+    """
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self._boxes = array('i')
+        self._confidences = array('f')
+        self._pages = array('h')
+        self._index = None
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, page: int, text: str, box: Sequence[float], confidence: float = -1.0):
+        text = text.strip()
+        if not text:
+            return
+        x0, y0, x1, y1 = (int(round(value)) for value in box)
+        self.texts.append(text)
+        self._boxes.extend((x0, y0, x1, y1))
+        self._confidences.append(confidence)
+        self._pages.append(page)
+        self._index = None
+
+    def extend(self, other: 'OCRLayout', page: Optional[int] = None):
+        """Append another layout, optionally forcing its page number"""
+        for i, text in enumerate(other.texts):
+            self.add(page or other._pages[i], text, other.box(i), other._confidences[i])
+
+    def box(self, i: int) -> tuple:
+        return tuple(self._boxes[4 * i:4 * i + 4])
+
+    def confidence(self, i: int) -> float:
+        return float(self._confidences[i])
+
+    def page(self, i: int) -> int:
+        return int(self._pages[i])
+
+    @property
+    def boxes(self) -> np.ndarray:
+        return np.frombuffer(self._boxes, dtype=np.int32).reshape(-1, 4)
+
+    def to_dict(self) -> dict:
+        """Compact JSON-serializable form (columns, not per-word objects)"""
+        return {
+            'texts': self.texts,
+            'boxes': self._boxes.tolist(),
+            'confidences': [round(value, 3) for value in self._confidences],
+            'pages': self._pages.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> Optional['OCRLayout']:
+        if not data:
+            return None
+        layout = cls()
+        layout.texts = list(data.get('texts', []))
+        layout._boxes = array('i', data.get('boxes', []))
+        layout._confidences = array('f', data.get('confidences', []))
+        layout._pages = array('h', data.get('pages', []))
+        return layout
+
+    def find(self, label: str, page: Optional[int] = None) -> List[int]:
+        """Indices of entries containing the label (accent/case-insensitive)"""
+        needle = _normalize(label)
+        return [
+            i for i, text in enumerate(self.texts)
+            if (page is None or self._pages[i] == page) and needle in _normalize(text)
+        ]
+
+    def value_right_of(self, labels: Iterable[str], pattern: Optional[re.Pattern] = None) -> Optional[str]:
+        """Text following a label on the same row, e.g. the date after 'Vencimento'.
+
+        The label's own entry is tried first (OCR often returns "Label value"
+        as one line), then the nearest entry to its right on that row.
+        """
+        for label in labels:
+            for i in self.find(label):
+                remainder = self._after_label(self.texts[i], label)
+                value = self._match(remainder, pattern)
+                if value:
+                    return value
+                for j in self._row_neighbours(i):
+                    value = self._match(self.texts[j], pattern)
+                    if value:
+                        return value
+        return None
+
+    def value_below(self, labels: Iterable[str], pattern: Optional[re.Pattern] = None) -> Optional[str]:
+        """Text in the nearest entry under a label that overlaps it horizontally"""
+        for label in labels:
+            for i in self.find(label):
+                for j in self._column_neighbours(i):
+                    value = self._match(self.texts[j], pattern)
+                    if value:
+                        return value
+        return None
+
+    def _after_label(self, text: str, label: str) -> str:
+        position = _normalize(text).find(_normalize(label))
+        return text[position + len(label):] if position >= 0 else ''
+
+    def _match(self, text: str, pattern: Optional[re.Pattern]) -> Optional[str]:
+        text = text.strip(' :')
+        if not text:
+            return None
+        if pattern is None:
+            return text
+        match = pattern.search(text)
+        return match.group(0) if match else None
+
+    def _build_index(self):
+        """Per page: entry indices sorted by vertical centre, plus the centres"""
+        boxes = self.boxes
+        centres = (boxes[:, 1] + boxes[:, 3]) / 2.0
+        pages = np.frombuffer(self._pages, dtype=np.int16)
+        self._index = {}
+        for page in np.unique(pages):
+            members = np.flatnonzero(pages == page)
+            order = members[np.argsort(centres[members], kind='stable')]
+            self._index[int(page)] = (order, centres[order])
+
+    def _candidates(self, page: int, y_min: float, y_max: float) -> np.ndarray:
+        if self._index is None:
+            self._build_index()
+        order, centres = self._index.get(page, (np.empty(0, dtype=np.int64), np.empty(0)))
+        start, stop = np.searchsorted(centres, [y_min, y_max])
+        return order[start:stop]
+
+    def _row_neighbours(self, i: int) -> List[int]:
+        """Entries to the right of i whose centre lies within its row band"""
+        x0, y0, x1, y1 = self.box(i)
+        half_height = max((y1 - y0) / 2.0, 1.0)
+        centre = (y0 + y1) / 2.0
+        boxes = self.boxes
+        candidates = [
+            j for j in self._candidates(self.page(i), centre - half_height, centre + half_height)
+            if j != i and boxes[j, 0] >= x1 - half_height
+        ]
+        return sorted(candidates, key=lambda j: boxes[j, 0])
+
+    def _column_neighbours(self, i: int, max_rows: float = 4.0) -> List[int]:
+        """Entries below i that overlap it horizontally, nearest first"""
+        x0, y0, x1, y1 = self.box(i)
+        height = max(y1 - y0, 1)
+        boxes = self.boxes
+        candidates = [
+            j for j in self._candidates(self.page(i), y1, y1 + max_rows * height)
+            if j != i and boxes[j, 0] < x1 and boxes[j, 2] > x0
+        ]
+        return sorted(candidates, key=lambda j: boxes[j, 1])
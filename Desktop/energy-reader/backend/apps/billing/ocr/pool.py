@@ -0,0 +1,150 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _current_rss_mb() -> float:
+    """Return the resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # Non-Linux fallback: peak RSS (KB on Linux, bytes on macOS)
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return peak / divisor
+
+
+def engine_settings() -> dict:
+    """OCRProcessor keyword arguments for this deployment"""
+    return {
+        'page_workers': settings.OCR_PAGE_WORKERS,
+        'use_text_layer': settings.OCR_USE_TEXT_LAYER,
+        'text_layer_min_chars': settings.OCR_TEXT_LAYER_MIN_CHARS,
+        'engine_mode': settings.OCR_ENGINE_MODE,
+        'cascade_min_confidence': settings.OCR_CASCADE_MIN_CONFIDENCE,
+        'preprocessing_profile': settings.OCR_PREPROCESSING_PROFILE,
+        'return_layout': settings.OCR_RETURN_LAYOUT,
+    }
+
+
+class OCREnginePool:
+    """Process-resident OCR engine, loaded once and reused across tasks.
+
+    Each Celery worker process keeps a single warm ``OCRProcessor``. The
+    engine is recycled (dropped and reloaded) after ``max_tasks`` bills or
+    when the process RSS goes above ``max_memory_mb``. If recycling does not
+    bring the RSS back under the ceiling, memory recycling stops for the
+    process: reloading engines per bill would not help, and Celery's
+    ``worker_max_memory_per_child`` replaces the process instead.
+    """
+
+    def __init__(self, max_tasks=None, max_memory_mb=None):
+        self.max_tasks = max_tasks if max_tasks is not None else settings.OCR_POOL_MAX_TASKS
+        self.max_memory_mb = max_memory_mb if max_memory_mb is not None else settings.OCR_POOL_MAX_MEMORY_MB
+        self._processor = None
+        self._tasks_served = 0
+        self._memory_recycle_disabled = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_warm(self) -> bool:
+        return self._processor is not None
+
+    def warm_up(self):
+        """Load OCR engines ahead of the first task"""
+        with self._lock:
+            self._ensure_processor()
+
+    def acquire(self):
+        """Return the warm processor, loading it if needed"""
+        self._lock.acquire()
+        try:
+            return self._ensure_processor()
+        except Exception:
+            self._lock.release()
+            raise
+
+    def release(self):
+        """Mark one task as served and recycle the engine if limits are hit"""
+        try:
+            self._tasks_served += 1
+            reason = self._recycle_reason()
+            if reason is not None:
+                self._recycle()
+                if reason == 'memory':
+                    self._check_memory_after_recycle()
+        finally:
+            self._lock.release()
+
+    def recycle(self):
+        """Drop the loaded engine so the next acquire reloads it"""
+        with self._lock:
+            self._recycle()
+
+    def _ensure_processor(self):
+        if self._processor is None:
+            from .processor import OCRProcessor
+            logger.info("Loading OCR engines")
+            self._processor = OCRProcessor(**engine_settings())
+            self._tasks_served = 0
+        return self._processor
+
+    def _recycle_reason(self):
+        """'tasks' or 'memory' when a limit is hit, else None"""
+        if self.max_tasks and self._tasks_served >= self.max_tasks:
+            logger.info("Recycling OCR engines after task limit", extra={'tasks': self._tasks_served})
+            return 'tasks'
+        if self.max_memory_mb and not self._memory_recycle_disabled:
+            rss_mb = _current_rss_mb()
+            if rss_mb > self.max_memory_mb:
+                logger.info("Recycling OCR engines after memory limit", extra={'rss_mb': round(rss_mb)})
+                return 'memory'
+        return None
+
+    def _check_memory_after_recycle(self):
+        rss_mb = _current_rss_mb()
+        if rss_mb > self.max_memory_mb:
+            # Freed memory is not handed back to the OS; reloading per bill would not help
+            logger.warning(
+                "RSS still over the OCR pool ceiling after recycling, leaving it to worker_max_memory_per_child",
+                extra={'rss_mb': round(rss_mb)}
+            )
+            self._memory_recycle_disabled = True
+
+    def _recycle(self):
+        if self._processor is not None:
+            self._processor.close()
+        self._processor = None
+        self._tasks_served = 0
+        import gc
+        gc.collect()
+
+
+_pool = None
+
+
+def get_engine_pool() -> OCREnginePool:
+    """Return the OCR engine pool for the current process"""
+    global _pool
+    if _pool is None:
+        _pool = OCREnginePool()
+    return _pool
+
+
+@contextmanager
+def ocr_engine():
+    """Borrow the process-resident OCR processor for one task"""
+    pool = get_engine_pool()
+    processor = pool.acquire()
+    try:
+        yield processor
+    finally:
+        pool.release()
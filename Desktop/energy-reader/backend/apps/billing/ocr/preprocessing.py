@@ -0,0 +1,111 @@
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional
+
+# Immerkær fast noise estimation kernel
+_NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+
+@dataclass(frozen=True)
+class PreprocessingProfile:
+    """Which preprocessing stages to run on a page"""
+    name: str
+    deskew: bool = True
+    denoise: Optional[str] = None  # 'nlmeans', 'median' or None
+    clahe: bool = False
+    binarize: str = 'otsu'  # 'otsu' or 'adaptive'
+
+
+PROFILES = {
+    # Clean renders of born-digital PDFs: no skew, no sensor noise
+    'digital': PreprocessingProfile('digital', deskew=False),
+    # Flatbed scans: original full pipeline
+    'scan': PreprocessingProfile('scan', denoise='nlmeans', clahe=True),
+    # Phone photos: uneven lighting calls for local thresholds
+    'phone_photo': PreprocessingProfile('phone_photo', denoise='median', clahe=True, binarize='adaptive'),
+}
+
+# Below this estimated noise sigma a page is treated as a clean render
+DIGITAL_NOISE_SIGMA = 1.0
+# Background brightness spread (0-255) above which lighting is considered uneven
+PHOTO_ILLUMINATION_SPREAD = 60
+# Short side, in pixels, below which a page is treated as a low-resolution photo
+PHOTO_MAX_SHORT_SIDE = 1200
+
+# Skew is searched within +/- this many degrees on a thumbnail this wide
+MAX_SKEW_DEGREES = 10.0
+SKEW_THUMBNAIL_WIDTH = 600
+
+
+def estimate_noise(gray: np.ndarray, sample_size: int = 1024) -> float:
+    """Estimate the noise sigma of a grayscale page.
+    
+    Uses the Immerkær Laplacian-difference operator on a central crop, with
+    a median in place of the mean so text edges do not count as noise.
+    """
+    height, width = gray.shape[:2]
+    top = max((height - sample_size) // 2, 0)
+    left = max((width - sample_size) // 2, 0)
+    sample = gray[top:top + sample_size, left:left + sample_size]
+    if min(sample.shape[:2]) < 3:
+        return 0.0
+    response = cv2.filter2D(sample.astype(np.float32), -1, _NOISE_KERNEL)[1:-1, 1:-1]
+    # For Gaussian noise the response std is 6 sigma; MAD = 0.6745 std
+    return float(np.median(np.abs(response)) / (0.6745 * 6.0))
+
+
+def illumination_spread(gray: np.ndarray) -> float:
+    """Spread of background brightness across the page"""
+    thumbnail = cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA)
+    # Dilation drops dark text strokes, leaving the paper background
+    background = cv2.dilate(thumbnail, np.ones((5, 5), np.uint8))
+    return float(np.percentile(background, 95) - np.percentile(background, 5))
+
+
+def select_profile(gray: np.ndarray) -> PreprocessingProfile:
+    """Pick a profile from cheap image statistics"""
+    if min(gray.shape[:2]) < PHOTO_MAX_SHORT_SIDE or illumination_spread(gray) > PHOTO_ILLUMINATION_SPREAD:
+        return PROFILES['phone_photo']
+    if estimate_noise(gray) < DIGITAL_NOISE_SIGMA:
+        return PROFILES['digital']
+    return PROFILES['scan']
+
+
+def estimate_skew(gray: np.ndarray) -> float:
+    """Estimate page skew in degrees from a downsampled projection profile.
+    
+    Text rows give the sharpest horizontal projection when level, so the
+    best angle maximizes the variance of row sums. A coarse 1 degree sweep
+    on a small thumbnail is refined in 0.1 degree steps on a larger one.
+    """
+    fine_ink = _ink_thumbnail(gray, SKEW_THUMBNAIL_WIDTH)
+    if cv2.countNonZero(fine_ink) < 0.001 * fine_ink.size:
+        return 0.0
+    coarse_ink = _ink_thumbnail(fine_ink, SKEW_THUMBNAIL_WIDTH // 2, binarize=False)
+    
+    coarse_angles = np.arange(-MAX_SKEW_DEGREES, MAX_SKEW_DEGREES + 0.5, 1.0)
+    coarse = max(coarse_angles, key=lambda angle: _projection_score(coarse_ink, angle))
+    fine_angles = np.arange(coarse - 1.0, coarse + 1.05, 0.1)
+    fine = max(fine_angles, key=lambda angle: _projection_score(fine_ink, angle))
+    return float(round(fine, 2))
+
+
+def _ink_thumbnail(gray: np.ndarray, width: int, binarize: bool = True) -> np.ndarray:
+    """Downsample a page and (optionally) binarize it with ink as 255"""
+    height, original_width = gray.shape[:2]
+    if original_width > width:
+        size = (width, max(int(height * width / float(original_width)), 1))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_LINEAR)
+    if not binarize:
+        return gray
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return ink
+
+
+def _projection_score(ink: np.ndarray, angle: float) -> float:
+    height, width = ink.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    rotated = cv2.warpAffine(ink, matrix, (width, height), flags=cv2.INTER_NEAREST)
+    row_sums = cv2.reduce(rotated, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32F)
+    return float(np.var(row_sums))
@@ -1,37 +1,82 @@
+import html
+import multiprocessing
 import os
+import re
+import subprocess
+import time
 import cv2
 import numpy as np
 from PIL import Image
-from pdf2image import convert_from_path
-from pyzbar import pyzbar
+from pdf2image import convert_from_path, pdfinfo_from_path
 import pytesseract
 from paddleocr import PaddleOCR
-from dataclasses import dataclass
-from typing import List, Optional
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+from .barcodes import decode_barcodes
+from .boleto import find_payment_line_barcode
+from .layout import OCRLayout
+from .preprocessing import PROFILES, PreprocessingProfile, estimate_skew, select_profile
+from .result import OCRResult
+from .templates import FieldRegion, LayoutTemplate, content_bounds, region_pixels
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Per-page worker pool shared by every OCRProcessor in this process
+_page_executor = None
+_page_executor_config = None
+# Set once the pool failed to start or broke: pages stay sequential in this process
+_page_executor_disabled = False
 
-@dataclass
-class OCRResult:
-    """Result of OCR processing"""
-    success: bool
-    text: str = ""
-    barcodes: List[dict] = None
-    error: str = ""
-    
-    def __post_init__(self):
-        if self.barcodes is None:
-            self.barcodes = []
+# OCR engine owned by each page worker process
+_worker_processor = None
+
+
+
+class PageResult(NamedTuple):
+    """Output of one OCR'd page"""
+    text: str
+    barcodes: List[dict]
+    meta: dict
+    layout: Optional[OCRLayout] = None
 
 
 class OCRProcessor:
     """OCR processor with multiple engines and preprocessing"""
     
-    def __init__(self, use_paddle=True, use_tesseract=True):
+    PDF_DPI = 300
+    # Text-layer bills without a readable payment line: their last page is decoded at this DPI
+    TEXT_LAYER_BARCODE_DPI = 150
+    
+    TESSERACT_CONFIG = '--psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyzÀÁÂÃÄÅÇÈÉÊËÌÍÎÏÑÒÓÔÕÖÙÚÛÜÝàáâãäåçèéêëìíîïñòóôõöùúûüý .,;:!?()[]{}/-'
+    
+    ENGINE_MODES = ('cascade', 'combined')
+    
+    def __init__(self, use_paddle=True, use_tesseract=True, page_workers=1,
+                 use_text_layer=True, text_layer_min_chars=100,
+                 engine_mode='cascade', cascade_min_confidence=0.85,
+                 preprocessing_profile='auto', return_layout=False):
         self.use_paddle = use_paddle
         self.use_tesseract = use_tesseract
+        # 'cascade': Tesseract only for low-confidence pages/lines;
+        # 'combined': always run both engines and concatenate
+        if engine_mode not in self.ENGINE_MODES:
+            raise ValueError(f"Unknown OCR engine mode: {engine_mode}")
+        self.engine_mode = engine_mode
+        self.cascade_min_confidence = cascade_min_confidence
+        # Named profile from preprocessing.PROFILES, or 'auto' to pick per page
+        if preprocessing_profile != 'auto' and preprocessing_profile not in PROFILES:
+            raise ValueError(f"Unknown preprocessing profile: {preprocessing_profile}")
+        self.preprocessing_profile = preprocessing_profile
+        # Also return recognized lines with boxes (OCRResult.layout)
+        self.return_layout = return_layout
+        # Pages OCR'd in parallel for a single bill (1 = sequential)
+        self.page_workers = max(1, int(page_workers or 1))
+        # Born-digital PDF pages with enough embedded text skip OCR entirely
+        self.use_text_layer = use_text_layer
+        self.text_layer_min_chars = text_layer_min_chars
         
         # Initialize PaddleOCR
         if self.use_paddle:
@@ -47,68 +92,370 @@ class OCRProcessor:
             if tesseract_cmd != 'tesseract':
                 pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
     
-    def process_file(self, file_path: str) -> OCRResult:
-        """Process file (PDF/image) with OCR"""
+    def close(self):
+        """Release the page workers, which hold their own OCR engines"""
+        if self.page_workers > 1:
+            shutdown_page_executor()
+    
+    def process_file(self, file_path: str, template: Optional[LayoutTemplate] = None,
+                     profile: Optional[str] = None) -> OCRResult:
+        """Process file (PDF/image) with OCR.
+        
+        With a layout ``template`` only its field regions are OCR'd on the
+        pages it covers; other pages get full-page OCR. If a required field
+        is not read the whole document goes through full-page OCR instead.
+        ``profile`` overrides the preprocessing profile for this file (e.g.
+        one known from its layout fingerprint).
+        """
+        if profile and profile not in PROFILES:
+            profile = None
         try:
-            # Convert PDF to images if needed
-            images = self._load_images(file_path)
+            is_pdf = file_path.lower().endswith('.pdf')
+            page_count = pdfinfo_from_path(file_path).get('Pages', 0) if is_pdf else 1
+            
+            # Use the embedded text layer where a page has one
+            page_texts = {}
+            text_layer_layouts = {}
+            if is_pdf and self.use_text_layer:
+                for page_number, (text, layout) in enumerate(self._extract_text_layer(file_path), start=1):
+                    if self._has_usable_text(text):
+                        page_texts[page_number] = text.strip()
+                        text_layer_layouts[page_number] = layout
+            text_layer_pages = sorted(page_texts)
+            
+            # Rasterize and OCR only the remaining pages, lazily
+            ocr_page_numbers = [n for n in range(1, page_count + 1) if n not in page_texts]
+            
+            page_results = {}
+            if template is not None and ocr_page_numbers:
+                template_pages = self._process_template(file_path, template, ocr_page_numbers, profile)
+                if template_pages is not None:
+                    page_results.update(template_pages)
+            
+            # Full-page OCR for every page the template did not read
+            full_page_numbers = [n for n in ocr_page_numbers if n not in page_results]
+            if full_page_numbers:
+                images = self._iter_images(file_path, full_page_numbers)
+                if self.page_workers > 1:
+                    full_pages = self._process_pages_parallel(images, profile)
+                else:
+                    full_pages = (self._process_page(image, profile) for image in images)
+                page_results.update(zip(full_page_numbers, full_pages))
+            
+            page_barcodes = {}
+            page_meta = {}
+            page_layouts = {}
+            for page_number, page in page_results.items():
+                page_texts[page_number] = page.text
+                page_barcodes[page_number] = page.barcodes
+                page_meta[page_number] = page.meta
+                page_layouts[page_number] = page.layout
+            
+            if text_layer_pages:
+                page_barcodes.update(self._text_layer_barcodes(
+                    file_path, {page_number: page_texts[page_number] for page_number in text_layer_pages}
+                ))
+                if self.return_layout:
+                    page_layouts.update(text_layer_layouts)
             
-            if not images:
+            if not page_texts:
                 return OCRResult(success=False, error="No images to process")
             
             all_text = []
             all_barcodes = []
+            pages = []
+            layout = OCRLayout() if self.return_layout else None
             
-            for image in images:
-                # Preprocess image
-                processed_image = self._preprocess_image(image)
-                
-                # Extract text
-                text = self._extract_text(processed_image)
-                if text:
-                    all_text.append(text)
-                
-                # Extract barcodes
-                barcodes = self._extract_barcodes(processed_image)
-                all_barcodes.extend(barcodes)
+            # Reassemble in page order
+            for page_number in sorted(page_texts):
+                if page_texts[page_number]:
+                    all_text.append(page_texts[page_number])
+                all_barcodes.extend(page_barcodes.get(page_number, []))
+                if layout is not None and page_layouts.get(page_number) is not None:
+                    layout.extend(page_layouts[page_number], page=page_number)
+                if page_number in page_meta:
+                    pages.append({'page': page_number, 'source': 'ocr', **page_meta[page_number]})
+                else:
+                    pages.append({'page': page_number, 'source': 'text_layer'})
             
             combined_text = "\n".join(all_text)
             
             return OCRResult(
                 success=True,
                 text=combined_text,
-                barcodes=all_barcodes
+                barcodes=all_barcodes,
+                pages=pages,
+                layout=layout
             )
             
         except Exception as e:
             logger.error(f"OCR processing failed: {e}")
             return OCRResult(success=False, error=str(e))
     
-    def _load_images(self, file_path: str) -> List[np.ndarray]:
-        """Load images from file (PDF or image)"""
-        images = []
+    def _extract_text_layer(self, file_path: str) -> List[Tuple[str, OCRLayout]]:
+        """Embedded text and line boxes (in PDF_DPI pixels) of each PDF page.
         
+        One ``pdftotext -bbox-layout`` run gives both: the page text is
+        rebuilt from the line boxes, lines sharing a baseline joined left to
+        right as ``-layout`` would print them.
+        """
         try:
-            if file_path.lower().endswith('.pdf'):
-                # Convert PDF to images
-                pil_images = convert_from_path(file_path, dpi=300)
-                for pil_img in pil_images:
-                    # Convert PIL to OpenCV format
-                    cv_img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-                    images.append(cv_img)
-            else:
-                # Load image directly
-                image = cv2.imread(file_path)
-                if image is not None:
-                    images.append(image)
+            completed = subprocess.run(
+                ['pdftotext', '-bbox-layout', '-enc', 'UTF-8', file_path, '-'],
+                capture_output=True,
+                timeout=30,
+                check=True
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Text layer extraction failed: {e}")
+            return []
+        
+        scale = self.PDF_DPI / 72.0
+        output = completed.stdout.decode('utf-8', errors='replace')
+        pages = []
+        for page_number, page_xml in enumerate(_PDFTOTEXT_PAGE.findall(output), start=1):
+            layout = OCRLayout()
+            lines = []
+            for attributes, line_xml in _PDFTOTEXT_LINE.findall(page_xml):
+                words = [html.unescape(word) for word in _PDFTOTEXT_WORD.findall(line_xml)]
+                box = [float(value) * scale for value in _PDFTOTEXT_BOX.findall(attributes)]
+                if words and len(box) == 4:
+                    layout.add(page_number, ' '.join(words), box)
+                    lines.append((' '.join(words), box))
+            pages.append((_rows_text(lines), layout))
+        return pages
+    
+    def _text_layer_barcodes(self, file_path: str, page_texts: dict) -> dict:
+        """Boleto of the pages read from the text layer, keyed by page number.
+        
+        Taken from the linha digitável printed in the text when it checks
+        out; otherwise only the last of these pages is rendered, at low
+        resolution, and its bars decoded.
+        """
+        for page_number, text in page_texts.items():
+            code = find_payment_line_barcode(text)
+            if code:
+                return {page_number: [{'type': 'I25', 'data': code, 'source': 'text_layer'}]}
+        
+        last_page = max(page_texts)
+        image = next(self._iter_images(file_path, [last_page], dpi=self.TEXT_LAYER_BARCODE_DPI), None)
+        return {last_page: self._extract_barcodes(image)} if image is not None else {}
+    
+    def _has_usable_text(self, text: str) -> bool:
+        """Check whether a page's text layer is rich enough to skip OCR"""
+        return sum(1 for char in text if char.isalnum()) >= self.text_layer_min_chars
+    
+    def _process_page(self, image: np.ndarray, profile: Optional[str] = None) -> PageResult:
+        """Preprocess a single page and extract its text and barcodes"""
+        processed_image, meta = self._preprocess_image(image, profile)
+        timings = meta['timings_ms']
+        
+        layout = OCRLayout() if self.return_layout else None
+        with _timed(timings, 'ocr'):
+            text, text_meta = self._extract_text(processed_image, layout)
+        # Binarization can break thin bars, so decode from the original page
+        with _timed(timings, 'barcodes'):
+            barcodes = self._extract_barcodes(image)
+        
+        meta.update(text_meta)
+        logger.debug("OCR page stages", extra={'profile': meta.get('profile'), 'timings_ms': timings})
+        return PageResult(text, barcodes, meta, layout)
+    
+    def _process_template(self, file_path: str, template: LayoutTemplate,
+                          page_numbers: List[int], profile: Optional[str] = None) -> Optional[dict]:
+        """OCR a template's regions, keyed by page; None if a required field is missing"""
+        template_pages = [n for n in template.pages if n in page_numbers]
+        if not template_pages:
+            return None
         
+        results = {}
+        fields = set()
+        for page_number, image in zip(template_pages, self._iter_images(file_path, template_pages)):
+            page = self._process_template_page(image, template, page_number, profile)
+            results[page_number] = page
+            fields.update(page.meta['fields'])
+        
+        missing = [field for field in template.required_fields if field not in fields]
+        if missing:
+            logger.info("Template read incomplete, using full-page OCR",
+                        extra={'template': template.key, 'missing': missing})
+            return None
+        return results
+    
+    def _process_template_page(self, image: np.ndarray, template: LayoutTemplate,
+                               page_number: int, profile_name: Optional[str] = None) -> PageResult:
+        """Register a page to the template and OCR only its field regions"""
+        timings = {}
+        meta = {'source': 'template', 'template': template.key, 'timings_ms': timings}
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        
+        with _timed(timings, 'profile'):
+            profile = self._get_profile(gray, profile_name or template.profile)
+        meta['profile'] = profile.name
+        
+        if profile.deskew:
+            with _timed(timings, 'deskew'):
+                gray = self._deskew_image(gray)
+        with _timed(timings, 'register'):
+            bounds = content_bounds(gray)
+        
+        layout = OCRLayout() if self.return_layout else None
+        lines = []
+        barcodes = []
+        fields = []
+        with _timed(timings, 'regions'):
+            for region in template.regions:
+                if region.page != page_number:
+                    continue
+                x0, y0, x1, y1 = region_pixels(region, bounds)
+                crop = gray[y0:y1, x0:x1]
+                if crop.size == 0:
+                    continue
+                
+                if region.kind == 'barcode':
+                    found = self._extract_barcodes(crop)
+                    if found:
+                        barcodes.extend(found)
+                        fields.append(region.field)
+                    continue
+                
+                region_lines = self._read_region(crop, profile, region)
+                if not region_lines:
+                    continue
+                fields.append(region.field)
+                if region.label:
+                    region_lines = [f"{region.label}: {' '.join(region_lines)}"]
+                lines.extend(region_lines)
+                if layout is not None:
+                    for line in region_lines:
+                        layout.add(0, line, (x0, y0, x1, y1))
+        
+        meta['fields'] = fields
+        return PageResult("\n".join(lines), barcodes, meta, layout)
+    
+    def _read_region(self, crop: np.ndarray, profile: PreprocessingProfile, region: FieldRegion) -> List[str]:
+        """OCR one template region; empty if its value does not match the region pattern"""
+        if profile.denoise == 'median':
+            crop = cv2.medianBlur(crop, 3)
+        if profile.binarize == 'adaptive':
+            binary = cv2.adaptiveThreshold(crop, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 15)
+        else:
+            _, binary = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        
+        text, _ = self._extract_text(binary)
+        lines = [' '.join(line.split()) for line in text.splitlines() if line.strip()]
+        if region.pattern is not None and not region.pattern.search(' '.join(lines)):
+            return []
+        return lines
+    
+    def _worker_kwargs(self) -> dict:
+        """Settings for page worker processors (which never nest pools)"""
+        return {
+            'use_paddle': self.use_paddle,
+            'use_tesseract': self.use_tesseract,
+            'engine_mode': self.engine_mode,
+            'cascade_min_confidence': self.cascade_min_confidence,
+            'preprocessing_profile': self.preprocessing_profile,
+            'return_layout': self.return_layout,
+        }
+    
+    def _process_pages_parallel(self, images: Iterator[np.ndarray],
+                                profile: Optional[str] = None) -> Iterator[PageResult]:
+        """Spread pages over the bounded page worker pool, keeping page order.
+        
+        At most ``page_workers`` rendered pages are in flight at once, so
+        memory stays bounded for long documents.
+        """
+        executor = _get_page_executor(self.page_workers, self._worker_kwargs())
+        if executor is None:
+            yield from (self._process_page(image, profile) for image in images)
+            return
+        
+        in_flight = deque()
+        pool_failed = False
+        
+        for image in images:
+            try:
+                in_flight.append((executor.submit(_process_page_in_worker, image, profile), image))
+            except Exception as e:
+                # Workers are started on submit: a pool that cannot start them fails here
+                logger.warning(f"Parallel page OCR failed, falling back to sequential: {e}")
+                in_flight.append((None, image))
+                pool_failed = True
+                break
+            if len(in_flight) < self.page_workers:
+                continue
+            result = self._next_parallel_result(in_flight)
+            if result is None:
+                pool_failed = True
+                break
+            yield result
+        
+        while in_flight and not pool_failed:
+            result = self._next_parallel_result(in_flight)
+            if result is None:
+                pool_failed = True
+                break
+            yield result
+        
+        if pool_failed:
+            _disable_page_executor()
+            # Redo pages that were in flight, then finish sequentially
+            for _, image in in_flight:
+                yield self._process_page(image, profile)
+            for image in images:
+                yield self._process_page(image, profile)
+    
+    def _next_parallel_result(self, in_flight: deque) -> Optional[PageResult]:
+        """Wait for the oldest in-flight page; None if the pool broke"""
+        future, _ = in_flight[0]
+        try:
+            result = future.result()
         except Exception as e:
-            logger.error(f"Failed to load images from {file_path}: {e}")
+            logger.warning(f"Parallel page OCR failed, falling back to sequential: {e}")
+            return None
+        in_flight.popleft()
+        return result
+    
+    def _iter_images(self, file_path: str, page_numbers: Optional[List[int]] = None,
+                     dpi: Optional[int] = None) -> Iterator[np.ndarray]:
+        """Yield pages one at a time as grayscale arrays.
         
-        return images
+        PDFs are rendered a single page per call, straight to grayscale, so
+        only the page being processed is held in memory whatever the page
+        count. ``page_numbers`` restricts rendering to those (1-based) pages;
+        ``dpi`` overrides PDF_DPI.
+        """
+        if file_path.lower().endswith('.pdf'):
+            if page_numbers is None:
+                page_count = pdfinfo_from_path(file_path).get('Pages', 0)
+                page_numbers = range(1, page_count + 1)
+            for page_number in page_numbers:
+                rendered = convert_from_path(
+                    file_path,
+                    dpi=dpi or self.PDF_DPI,
+                    first_page=page_number,
+                    last_page=page_number,
+                    grayscale=True
+                )
+                image = np.asarray(rendered[0])
+                del rendered
+                yield image
+        elif page_numbers is None or 1 in page_numbers:
+            # Load image directly
+            image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+            if image is not None:
+                yield image
     
-    def _preprocess_image(self, image: np.ndarray) -> np.ndarray:
-        """Preprocess image for better OCR results"""
+    def _preprocess_image(self, image: np.ndarray, profile_name: Optional[str] = None) -> Tuple[np.ndarray, dict]:
+        """Preprocess image for better OCR results.
+        
+        Returns the binarized page and metadata with the profile used and
+        per-stage timings in milliseconds. ``profile_name`` overrides the
+        processor's configured profile.
+        """
+        timings = {}
+        meta = {'timings_ms': timings}
         try:
             # Convert to grayscale
             if len(image.shape) == 3:
@@ -116,81 +463,132 @@ class OCRProcessor:
             else:
                 gray = image
             
+            with _timed(timings, 'profile'):
+                profile = self._get_profile(gray, profile_name)
+            meta['profile'] = profile.name
+            
             # Deskew
-            gray = self._deskew_image(gray)
+            if profile.deskew:
+                with _timed(timings, 'deskew'):
+                    gray = self._deskew_image(gray)
             
             # Denoise
-            denoised = cv2.fastNlMeansDenoising(gray)
+            if profile.denoise == 'nlmeans':
+                with _timed(timings, 'denoise'):
+                    gray = cv2.fastNlMeansDenoising(gray)
+            elif profile.denoise == 'median':
+                with _timed(timings, 'denoise'):
+                    gray = cv2.medianBlur(gray, 3)
             
             # Enhance contrast
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-            enhanced = clahe.apply(denoised)
+            if profile.clahe:
+                with _timed(timings, 'clahe'):
+                    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+                    gray = clahe.apply(gray)
             
             # Binarization
-            _, binary = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            with _timed(timings, 'binarize'):
+                if profile.binarize == 'adaptive':
+                    binary = cv2.adaptiveThreshold(
+                        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 15
+                    )
+                else:
+                    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
             
-            return binary
+            return binary, meta
             
         except Exception as e:
             logger.warning(f"Preprocessing failed, using original: {e}")
-            return image
+            return image, meta
+    
+    def _get_profile(self, gray: np.ndarray, name: Optional[str] = None) -> PreprocessingProfile:
+        name = name or self.preprocessing_profile
+        if name == 'auto':
+            return select_profile(gray)
+        return PROFILES[name]
     
     def _deskew_image(self, image: np.ndarray) -> np.ndarray:
-        """Deskew image using Hough transform"""
+        """Deskew image, estimating the angle on a thumbnail"""
         try:
-            edges = cv2.Canny(image, 50, 150, apertureSize=3)
-            lines = cv2.HoughLines(edges, 1, np.pi/180, threshold=100)
-            
-            if lines is not None:
-                angles = []
-                for rho, theta in lines[:10]:  # Use first 10 lines
-                    angle = theta * 180 / np.pi
-                    if angle < 45:
-                        angles.append(angle)
-                    elif angle > 135:
-                        angles.append(angle - 180)
-                
-                if angles:
-                    median_angle = np.median(angles)
-                    if abs(median_angle) > 0.5:  # Only rotate if significant skew
-                        (h, w) = image.shape[:2]
-                        center = (w // 2, h // 2)
-                        M = cv2.getRotationMatrix2D(center, median_angle, 1.0)
-                        rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-                        return rotated
+            angle = estimate_skew(image)
+            if abs(angle) > 0.5:  # Only rotate if significant skew
+                (h, w) = image.shape[:2]
+                center = (w // 2, h // 2)
+                M = cv2.getRotationMatrix2D(center, angle, 1.0)
+                rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+                return rotated
         
         except Exception as e:
             logger.warning(f"Deskewing failed: {e}")
         
         return image
     
-    def _extract_text(self, image: np.ndarray) -> str:
-        """Extract text using available OCR engines"""
+    def _extract_text(self, image: np.ndarray, layout: Optional[OCRLayout] = None) -> Tuple[str, dict]:
+        """Extract text using available OCR engines, returning page metadata.
+        
+        When ``layout`` is given it is filled with the recognized lines.
+        """
+        if self.engine_mode == 'combined':
+            return self._extract_text_combined(image, layout), {'engine': 'paddle+tesseract'}
+        return self._extract_text_cascade(image, layout)
+    
+    def _extract_text_cascade(self, image: np.ndarray, layout: Optional[OCRLayout] = None) -> Tuple[str, dict]:
+        """Run PaddleOCR and fall back to Tesseract only where confidence is low"""
+        lines = self._paddle_lines(image) if self.use_paddle else None
+        
+        if lines is None:
+            text = self._tesseract_text(image, layout=layout) if self.use_tesseract else ""
+            return text, {'engine': 'tesseract', 'confidence': None}
+        
+        confidence = self._page_confidence(lines)
+        threshold = self.cascade_min_confidence
+        
+        if confidence >= threshold or not self.use_tesseract:
+            kept = [line for line in lines if line[2] > 0.5]
+            _add_paddle_lines(layout, kept)
+            text = "\n".join(line_text for _, line_text, _ in kept)
+            return text, {'engine': 'paddle', 'confidence': round(confidence, 3)}
+        
+        low_confidence = [line for line in lines if line[2] < threshold]
+        if lines and len(low_confidence) <= len(lines) // 2:
+            # Mostly good page: re-read only the doubtful lines
+            texts = []
+            for box, line_text, score in lines:
+                if score < threshold:
+                    line_text = self._tesseract_region(image, box) or (line_text if score > 0.5 else "")
+                if line_text:
+                    texts.append(line_text)
+                    _add_paddle_lines(layout, [(box, line_text, score)])
+            meta = {
+                'engine': 'paddle+tesseract_regions',
+                'confidence': round(confidence, 3),
+                'regions': len(low_confidence)
+            }
+            return "\n".join(texts), meta
+        
+        text = self._tesseract_text(image, layout=layout)
+        return text, {'engine': 'tesseract', 'confidence': round(confidence, 3)}
+    
+    def _extract_text_combined(self, image: np.ndarray, layout: Optional[OCRLayout] = None) -> str:
+        """Run every available engine and concatenate their output"""
         texts = []
         
         # Try PaddleOCR first (usually better for Portuguese)
         if self.use_paddle:
-            try:
-                result = self.paddle_ocr.ocr(image, cls=True)
-                if result and result[0]:
-                    paddle_text = "\n".join([line[1][0] for line in result[0] if line[1][1] > 0.5])
-                    if paddle_text:
-                        texts.append(paddle_text)
-            except Exception as e:
-                logger.warning(f"PaddleOCR failed: {e}")
+            lines = self._paddle_lines(image)
+            if lines:
+                kept = [line for line in lines if line[2] > 0.5]
+                _add_paddle_lines(layout, kept)
+                paddle_text = "\n".join(line_text for _, line_text, _ in kept)
+                if paddle_text:
+                    texts.append(paddle_text)
         
-        # Try Tesseract
+        # Try Tesseract (its boxes only if Paddle gave none)
         if self.use_tesseract:
-            try:
-                tesseract_text = pytesseract.image_to_string(
-                    image, 
-                    lang='por',
-                    config='--psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyzÀÁÂÃÄÅÇÈÉÊËÌÍÎÏÑÒÓÔÕÖÙÚÛÜÝàáâãäåçèéêëìíîïñòóôõöùúûüý .,;:!?()[]{}/-'
-                )
-                if tesseract_text.strip():
-                    texts.append(tesseract_text)
-            except Exception as e:
-                logger.warning(f"Tesseract failed: {e}")
+            tesseract_layout = layout if layout is not None and not len(layout) else None
+            tesseract_text = self._tesseract_text(image, layout=tesseract_layout)
+            if tesseract_text.strip():
+                texts.append(tesseract_text)
         
         # Combine results (prefer PaddleOCR if available)
         if texts:
@@ -198,27 +596,192 @@ class OCRProcessor:
         
         return ""
     
-    def _extract_barcodes(self, image: np.ndarray) -> List[dict]:
-        """Extract barcodes and QR codes"""
-        barcodes = []
+    def _paddle_lines(self, image: np.ndarray) -> Optional[List[Tuple[list, str, float]]]:
+        """Run PaddleOCR, returning (box, text, score) per line or None on failure"""
+        try:
+            result = self.paddle_ocr.ocr(image, cls=True)
+        except Exception as e:
+            logger.warning(f"PaddleOCR failed: {e}")
+            return None
         
+        if not result or not result[0]:
+            return []
+        return [(line[0], line[1][0], float(line[1][1])) for line in result[0]]
+    
+    def _page_confidence(self, lines: List[Tuple[list, str, float]]) -> float:
+        """Mean line score weighted by text length"""
+        total_chars = sum(len(text) for _, text, _ in lines)
+        if not total_chars:
+            return 0.0
+        return sum(len(text) * score for _, text, score in lines) / total_chars
+    
+    def _tesseract_text(self, image: np.ndarray, config: str = None,
+                        layout: Optional[OCRLayout] = None) -> str:
+        """Run Tesseract; with a layout, use image_to_data to also keep line boxes"""
         try:
-            decoded_objects = pyzbar.decode(image)
-            
-            for obj in decoded_objects:
-                barcode_data = {
-                    'type': obj.type,
-                    'data': obj.data.decode('utf-8'),
-                    'rect': {
-                        'x': obj.rect.left,
-                        'y': obj.rect.top,
-                        'width': obj.rect.width,
-                        'height': obj.rect.height
-                    }
-                }
-                barcodes.append(barcode_data)
-                
+            if layout is None:
+                return pytesseract.image_to_string(
+                    image,
+                    lang='por',
+                    config=config or self.TESSERACT_CONFIG
+                )
+            data = pytesseract.image_to_data(
+                image,
+                lang='por',
+                config=config or self.TESSERACT_CONFIG,
+                output_type=pytesseract.Output.DICT
+            )
         except Exception as e:
-            logger.warning(f"Barcode extraction failed: {e}")
+            logger.warning(f"Tesseract failed: {e}")
+            return ""
         
-        return barcodes
\ No newline at end of file
+        # Group words into lines: text plus union box and mean confidence
+        lines = {}
+        for i, word in enumerate(data['text']):
+            if not word.strip():
+                continue
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            left, top = data['left'][i], data['top'][i]
+            right, bottom = left + data['width'][i], top + data['height'][i]
+            line = lines.setdefault(key, {'words': [], 'box': [left, top, right, bottom], 'conf': []})
+            line['words'].append(word)
+            line['box'] = [
+                min(line['box'][0], left), min(line['box'][1], top),
+                max(line['box'][2], right), max(line['box'][3], bottom)
+            ]
+            line['conf'].append(float(data['conf'][i]))
+        
+        texts = []
+        for line in lines.values():
+            line_text = ' '.join(line['words'])
+            texts.append(line_text)
+            confidence = sum(line['conf']) / len(line['conf']) / 100.0
+            layout.add(0, line_text, line['box'], confidence)
+        return "\n".join(texts)
+    
+    def _tesseract_region(self, image: np.ndarray, box: list, padding: int = 4) -> str:
+        """OCR a single text line given its PaddleOCR quadrilateral"""
+        points = np.array(box, dtype=np.int32)
+        x, y, w, h = cv2.boundingRect(points)
+        height, width = image.shape[:2]
+        x0, y0 = max(x - padding, 0), max(y - padding, 0)
+        x1, y1 = min(x + w + padding, width), min(y + h + padding, height)
+        if x1 <= x0 or y1 <= y0:
+            return ""
+        
+        line_config = self.TESSERACT_CONFIG.replace('--psm 6', '--psm 7')
+        return self._tesseract_text(image[y0:y1, x0:x1], config=line_config).strip()
+    
+    def _extract_barcodes(self, image: np.ndarray) -> List[dict]:
+        """Extract boleto barcodes from likely regions of the grayscale page"""
+        try:
+            if len(image.shape) == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            return decode_barcodes(image)
+        except Exception as e:
+            logger.warning(f"Barcode extraction failed: {e}")
+            return []
+
+
+_PDFTOTEXT_PAGE = re.compile(r'<page\b[^>]*>(.*?)</page>', re.DOTALL)
+_PDFTOTEXT_LINE = re.compile(r'<line\b([^>]*)>(.*?)</line>', re.DOTALL)
+_PDFTOTEXT_WORD = re.compile(r'<word\b[^>]*>(.*?)</word>', re.DOTALL)
+_PDFTOTEXT_BOX = re.compile(r'[xy]M(?:in|ax)="([\d.]+)"')
+
+
+def _rows_text(lines: List[Tuple[str, list]]) -> str:
+    """Page text from (text, box) lines, each row read left to right.
+    
+    A line joins the current row when its vertical centre falls inside the
+    row's extent, so table cells on one baseline stay on one text line.
+    """
+    rows = []
+    for text, box in sorted(lines, key=lambda line: (line[1][1], line[1][0])):
+        centre = (box[1] + box[3]) / 2
+        if rows and rows[-1]['top'] <= centre <= rows[-1]['bottom']:
+            rows[-1]['lines'].append((box[0], text))
+            rows[-1]['bottom'] = max(rows[-1]['bottom'], box[3])
+        else:
+            rows.append({'top': box[1], 'bottom': box[3], 'lines': [(box[0], text)]})
+    return '\n'.join('  '.join(text for _, text in sorted(row['lines'])) for row in rows)
+
+
+def _add_paddle_lines(layout: Optional[OCRLayout], lines: List[Tuple[list, str, float]]):
+    """Add PaddleOCR (quadrilateral, text, score) lines to a layout"""
+    if layout is None:
+        return
+    for quad, text, score in lines:
+        xs = [point[0] for point in quad]
+        ys = [point[1] for point in quad]
+        layout.add(0, text, (min(xs), min(ys), max(xs), max(ys)), score)
+
+
+@contextmanager
+def _timed(timings: dict, stage: str):
+    """Record the wall time of a pipeline stage in milliseconds"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def _init_page_worker(worker_kwargs: dict):
+    """Load OCR engines once in each page worker process"""
+    global _worker_processor
+    _worker_processor = OCRProcessor(**worker_kwargs)
+
+
+def _process_page_in_worker(image: np.ndarray, profile: Optional[str] = None) -> PageResult:
+    return _worker_processor._process_page(image, profile)
+
+
+def _get_page_executor(workers: int, worker_kwargs: dict) -> Optional[ProcessPoolExecutor]:
+    """Return the process-wide page pool, creating it on first use.
+    
+    Workers are spawned, not forked, so they never inherit the parent's
+    loaded engines; each loads its own in ``_init_page_worker``. Daemonic
+    processes (Celery's default prefork children) cannot have children:
+    there the pool is disabled and pages stay sequential. Run workers that
+    set OCR_PAGE_WORKERS > 1 with ``--pool solo``.
+    """
+    global _page_executor, _page_executor_config
+    if _page_executor_disabled:
+        return None
+    if multiprocessing.current_process().daemon:
+        logger.warning("OCR_PAGE_WORKERS ignored in a daemonic worker process; run Celery with --pool solo")
+        _disable_page_executor()
+        return None
+    config = (workers, tuple(sorted(worker_kwargs.items())))
+    if _page_executor is not None and _page_executor_config == config:
+        return _page_executor
+    
+    shutdown_page_executor()
+    try:
+        _page_executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_page_worker,
+            initargs=(worker_kwargs,)
+        )
+        _page_executor_config = config
+    except Exception as e:
+        logger.warning(f"Could not start page worker pool: {e}")
+        _disable_page_executor()
+    return _page_executor
+
+
+def shutdown_page_executor():
+    """Stop the page workers (and the OCR engines they hold)"""
+    global _page_executor, _page_executor_config
+    if _page_executor is not None:
+        _page_executor.shutdown(wait=False, cancel_futures=True)
+    _page_executor = None
+    _page_executor_config = None
+
+
+def _disable_page_executor():
+    """Stop the page pool and process pages sequentially from now on"""
+    global _page_executor_disabled
+    shutdown_page_executor()
+    _page_executor_disabled = True
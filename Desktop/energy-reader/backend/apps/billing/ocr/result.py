@@ -0,0 +1,22 @@
+from dataclasses import dataclass
+from typing import List, Optional
+from .layout import OCRLayout
+
+
+@dataclass
+class OCRResult:
+    """Result of OCR processing"""
+    success: bool
+    text: str = ""
+    barcodes: List[dict] = None
+    error: str = ""
+    # Per-page metadata, e.g. {'page': 1, 'source': 'text_layer'}
+    pages: List[dict] = None
+    # Recognized lines with boxes, when the processor was asked for them
+    layout: Optional[OCRLayout] = None
+    
+    def __post_init__(self):
+        if self.barcodes is None:
+            self.barcodes = []
+        if self.pages is None:
+            self.pages = []
@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Pattern, Tuple
+
+
+@dataclass(frozen=True)
+class FieldRegion:
+    """Where a field is printed on a known bill layout.
+
+    ``box`` is (x0, y0, x1, y1) as fractions of the page's printed area, so
+    it holds across render resolutions and scan margins. ``label`` is
+    written before the recognized value so the bill parser can read it;
+    regions without a label keep their lines as read. A ``pattern`` the
+    value must contain guards against reading the wrong region.
+    """
+    field: str
+    label: str
+    box: Tuple[float, float, float, float]
+    pattern: Optional[Pattern] = None
+    page: int = 1
+    kind: str = 'text'  # 'text' or 'barcode'
+
+
+@dataclass(frozen=True)
+class LayoutTemplate:
+    """Field regions of one distributor's bill layout version"""
+    distributor: str
+    version: str
+    regions: Tuple[FieldRegion, ...]
+    # Without these the template read is discarded and the page is fully OCR'd
+    required_fields: Tuple[str, ...] = ()
+    # Preprocessing profile for crops ('auto' to select per page)
+    profile: str = 'auto'
+
+    @property
+    def key(self) -> str:
+        return f'{self.distributor}:{self.version}'
+
+    @property
+    def pages(self) -> List[int]:
+        return sorted({region.page for region in self.regions})
+
+
+# Templates are registered with boxes measured on real sample bills of each
+# layout; none ship built in, so OCR_USE_TEMPLATES has no effect until one is
+_REGISTRY: Dict[str, Dict[str, LayoutTemplate]] = {}
+
+
+def register_template(template: LayoutTemplate) -> LayoutTemplate:
+    """Add a template to the registry (replacing the same distributor/version)"""
+    _REGISTRY.setdefault(template.distributor, {})[template.version] = template
+    return template
+
+
+def get_template(distributor: str, version: Optional[str] = None) -> Optional[LayoutTemplate]:
+    """Return a template by distributor and version, or its latest version"""
+    versions = _REGISTRY.get(distributor, {})
+    if version is not None:
+        return versions.get(version)
+    if not versions:
+        return None
+    return versions[max(versions)]
+
+
+def all_templates() -> List[LayoutTemplate]:
+    return [template for versions in _REGISTRY.values() for template in versions.values()]
+
+
+def content_bounds(gray: np.ndarray, margin: float = 0.002) -> Tuple[int, int, int, int]:
+    """Bounding box of the printed area, used to register a page to a template.
+
+    Found on a thumbnail so it is cheap; compensates for scan margins and
+    offsets before fractional template boxes are applied.
+    """
+    height, width = gray.shape[:2]
+    scale = min(1.0, 500.0 / width)
+    thumbnail = cv2.resize(gray, (max(int(width * scale), 1), max(int(height * scale), 1)),
+                           interpolation=cv2.INTER_AREA)
+    _, ink = cv2.threshold(thumbnail, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    points = cv2.findNonZero(ink)
+    if points is None:
+        return 0, 0, width, height
+    x, y, w, h = cv2.boundingRect(points)
+    pad_x, pad_y = int(width * margin), int(height * margin)
+    return (
+        max(int(x / scale) - pad_x, 0),
+        max(int(y / scale) - pad_y, 0),
+        min(int((x + w) / scale) + pad_x, width),
+        min(int((y + h) / scale) + pad_y, height),
+    )
+
+
+def region_pixels(region: FieldRegion, bounds: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+    """Map a region's fractional box onto a registered page, as x0, y0, x1, y1"""
+    left, top, right, bottom = bounds
+    width, height = right - left, bottom - top
+    x0, y0, x1, y1 = region.box
+    return (
+        left + int(x0 * width), top + int(y0 * height),
+        left + int(x1 * width), top + int(y1 * height),
+    )
+
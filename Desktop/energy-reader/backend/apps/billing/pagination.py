@@ -0,0 +1,94 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Optional, Tuple
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_position(timestamp: datetime, pk: int) -> str:
+    """Opaque cursor for a (timestamp, id) keyset position"""
+    return urlsafe_b64encode(f'{timestamp.isoformat()}|{pk}'.encode()).decode()
+
+
+def decode_position(encoded: str) -> Optional[Tuple[datetime, int]]:
+    """(timestamp, id) from a cursor, or None if it is malformed"""
+    try:
+        timestamp, pk = urlsafe_b64decode(encoded.encode()).decode().rsplit('|', 1)
+        position = parse_datetime(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return position if position[0] is not None else None
+
+
+class BillCursorPagination(BasePagination):
+    """Keyset pagination over (created_at, id), newest first.
+
+    Each page seeks past the last row of the previous one through the
+    (user, -created_at, -id) index, so no COUNT(*) or OFFSET is run and
+    page latency does not grow with depth. Only a ``next`` link is given,
+    which is all infinite scroll needs.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+        # One extra row tells whether there is a next page without counting
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        position = decode_position(encoded)
+        if position is None:
+            raise NotFound('Cursor inválido')
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_position(self.last.created_at, self.last.id))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,5 @@
+from .base import PARSER_VERSION, BillParser
+from .registry import get_parser, register_parser, select_parser
+
+# Distributor parsers register themselves on import
+from . import enel_parser, cpfl_parser, cemig_parser, light_parser, copel_parser  # noqa: F401
@@ -0,0 +1,322 @@
+import re
+from datetime import datetime
+from decimal import InvalidOperation
+from typing import Dict, List, Optional, Any
+import logging
+from .scanner import FieldScanner
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever parsing output changes so stored OCR text is re-parsed (reparse_bills)
+PARSER_VERSION = 3
+
+_DATE = r'(\d{2}/\d{2}/\d{4})'
+_MONEY = r'(\d{1,3}(?:\.\d{3})+,\d{2}|\d+,\d+)'
+
+# Field: (labels that precede the value, value pattern with one capture group)
+FIELDS = {
+    # Customer info
+    'numero_cliente': (('Número do Cliente', 'Cliente'), r'(\d+)'),
+    'unidade_consumidora': (('Unidade Consumidora', 'UC'), r'(\d+)'),
+    'instalacao': (('Instalação', 'Instalacao'), r'(\d+)'),
+    
+    # Dates
+    'periodo_inicio': (('Período', 'Periodo'), _DATE),
+    'periodo_fim': (('até', 'a'), _DATE),
+    'vencimento': (('Vencimento', 'Data de Vencimento'), _DATE),
+    'emissao': (('Emissão', 'Data de Emissão'), _DATE),
+    
+    # Consumption and meter readings
+    'consumo_kwh': (('Consumo', 'kWh'), r'(\d+(?:,\d+)?)'),
+    'leitura_anterior': (('Leitura Anterior',), r'(\d+)'),
+    'leitura_atual': (('Leitura Atual',), r'(\d+)'),
+    
+    # Tariff
+    'tarifa_kwh': (('Tarifa', 'R$/kWh'), r'R?\$?\s*(\d+,\d+)'),
+    'bandeira_tarifaria': (('Bandeira Tarifária', 'Bandeira Tarifaria', 'Bandeira'),
+                           r'(Verde|Amarela|Vermelha|Escassez Hídrica)'),
+    
+    # Values
+    'valor_total': (('Total a Pagar', 'Valor Total'), r'R\$\s*' + _MONEY),
+    'icms': (('ICMS',), r'R\$\s*' + _MONEY),
+    'pis': (('PIS',), r'R\$\s*' + _MONEY),
+    'cofins': (('COFINS',), r'R\$\s*' + _MONEY),
+    
+    # Payment
+    'linha_digitavel': ((), r'(\d{5}\.\d{5}\s\d{5}\.\d{6}\s\d{5}\.\d{6}\s\d\s\d{14})'),
+    'codigo_barras': ((), r'(\d{44})'),
+    
+    # Address
+    'endereco': (('Endereço', 'Endereco'), r'([^\n]+)'),
+}
+
+FIELD_SCANNER = FieldScanner(FIELDS)
+
+# Whitespace runs and characters that interfere with matching, collapsed in one pass
+_NOISE = re.compile(r'[^\w.,;:!?()\[\]{}/$-]+')
+
+
+class BillParser:
+    """Label/value parser for Brazilian energy bills.
+    
+    Distributor parsers subclass it, naming the distributor and the
+    signature ``keywords`` the registry uses to pick a parser for a text.
+    Subclasses may extend ``FIELDS`` with their own labels and build a
+    matching ``scanner``.
+    """
+    
+    distributor = ''
+    keywords = ()
+    
+    # Fields read from the OCR layout: labels to look for and the value shape
+    # expected to their right (or just below)
+    LAYOUT_FIELDS = {
+        'numero_cliente': (('Número do Cliente', 'Nº do Cliente'), re.compile(r'\d+')),
+        'unidade_consumidora': (('Unidade Consumidora',), re.compile(r'\d+')),
+        'instalacao': (('Instalação', 'Instalacao'), re.compile(r'\d+')),
+        'vencimento': (('Data de Vencimento', 'Vencimento'), re.compile(r'\d{2}/\d{2}/\d{4}')),
+        'emissao': (('Data de Emissão', 'Emissão'), re.compile(r'\d{2}/\d{2}/\d{4}')),
+        'valor_total': (('Total a Pagar', 'Valor Total'), re.compile(r'\d{1,3}(?:\.\d{3})*,\d{2}')),
+        'consumo_kwh': (('Consumo Ativo', 'Consumo (kWh)', 'Consumo kWh'), re.compile(r'\d+(?:,\d+)?')),
+    }
+    # Only filled from the layout when the text scan found nothing: consumption
+    # labels also head the history table ("Histórico de Consumo (kWh)")
+    LAYOUT_FALLBACK_FIELDS = {'consumo_kwh'}
+    
+    FIELDS = FIELDS
+    scanner = FIELD_SCANNER
+    
+    def parse(self, text: str, barcodes: List[dict] = None, layout=None) -> Dict[str, Any]:
+        """Parse bill text and return structured data.
+        
+        ``layout`` is an optional ``OCRLayout``; values found next to their
+        labels there take precedence over matches in the flattened text.
+        """
+        if not text:
+            return {}
+        
+        # Clean text
+        cleaned_text = self._clean_text(text)
+        
+        # Find every field in one sweep over the text (readings included)
+        fields = self.scanner.scan(cleaned_text)
+        
+        # Extract data
+        parsed_data = {
+            "fornecedor": self.distributor,
+            "numero_cliente": self._extract_field(fields, 'numero_cliente'),
+            "unidade_consumidora": self._extract_field(fields, 'unidade_consumidora'),
+            "instalacao": self._extract_field(fields, 'instalacao'),
+            "endereco": self._extract_field(fields, 'endereco'),
+            "periodo": self._extract_period(fields),
+            "emissao": self._extract_date(fields, 'emissao'),
+            "vencimento": self._extract_date(fields, 'vencimento'),
+            "consumo_kwh": self._extract_consumption(fields),
+            "bandeira_tarifaria": self._extract_bandeira(fields),
+            "tarifa_kwh": self._extract_decimal(fields, 'tarifa_kwh'),
+            "impostos": self._extract_taxes(fields),
+            "valor_total": self._extract_decimal(fields, 'valor_total'),
+            "linha_digitavel": self._extract_payment_line(fields, barcodes),
+            "codigo_de_barras": self._extract_barcode(fields, barcodes)
+        }
+        
+        if layout is not None and len(layout):
+            self._apply_layout(parsed_data, layout)
+        
+        # Validate and normalize
+        parsed_data = self._validate_data(parsed_data)
+        
+        return parsed_data
+    
+    def _apply_layout(self, parsed_data: Dict[str, Any], layout) -> None:
+        """Overwrite label/value fields with values read from the layout"""
+        for field, (labels, value_pattern) in self.LAYOUT_FIELDS.items():
+            if field in self.LAYOUT_FALLBACK_FIELDS and parsed_data.get(field) is not None:
+                continue
+            value = layout.value_right_of(labels, value_pattern) or layout.value_below(labels, value_pattern)
+            if not value:
+                continue
+            
+            if field in ('vencimento', 'emissao'):
+                try:
+                    value = datetime.strptime(value, '%d/%m/%Y').strftime('%Y-%m-%d')
+                except ValueError:
+                    continue
+            elif field in ('valor_total', 'consumo_kwh'):
+                value = self._parse_decimal(value)
+                if value is None:
+                    continue
+            
+            parsed_data[field] = value
+    
+    def _clean_text(self, text: str) -> str:
+        """Collapse whitespace and interfering characters into single spaces"""
+        return _NOISE.sub(' ', text).strip()
+    
+    def _extract_field(self, fields: Dict[str, str], field: str) -> Optional[str]:
+        """Value the scanner found for a field"""
+        return fields.get(field)
+    
+    def _extract_date(self, fields: Dict[str, str], field: str) -> Optional[str]:
+        """Extract and normalize date"""
+        date_str = self._extract_field(fields, field)
+        if not date_str:
+            return None
+        
+        try:
+            # Convert DD/MM/YYYY to YYYY-MM-DD
+            date_obj = datetime.strptime(date_str, '%d/%m/%Y')
+            return date_obj.strftime('%Y-%m-%d')
+        except ValueError:
+            logger.warning(f"Invalid date format: {date_str}")
+            return None
+    
+    def _extract_period(self, fields: Dict[str, str]) -> Dict[str, Optional[str]]:
+        """Extract billing period"""
+        inicio = self._extract_date(fields, 'periodo_inicio')
+        fim = self._extract_date(fields, 'periodo_fim')
+        
+        return {
+            "inicio": inicio,
+            "fim": fim
+        }
+    
+    def _extract_consumption(self, fields: Dict[str, str]) -> Optional[float]:
+        """Extract consumption in kWh"""
+        # Try direct consumption pattern
+        consumo_str = self._extract_field(fields, 'consumo_kwh')
+        if consumo_str:
+            return self._parse_decimal(consumo_str)
+        
+        # Try calculating from readings
+        leitura_anterior = self._extract_field(fields, 'leitura_anterior')
+        leitura_atual = self._extract_field(fields, 'leitura_atual')
+        
+        if leitura_anterior and leitura_atual:
+            try:
+                anterior = int(leitura_anterior)
+                atual = int(leitura_atual)
+                return float(atual - anterior)
+            except ValueError:
+                pass
+        
+        return None
+    
+    def _extract_bandeira(self, fields: Dict[str, str]) -> str:
+        """Extract tariff flag"""
+        bandeira = self._extract_field(fields, 'bandeira_tarifaria')
+        if not bandeira:
+            return "DESCONHECIDA"
+        
+        bandeira_upper = bandeira.upper()
+        bandeira_map = {
+            'VERDE': 'VERDE',
+            'AMARELA': 'AMARELA',
+            'VERMELHA': 'VERMELHA',
+            'ESCASSEZ HÍDRICA': 'ESCASSEZ_HIDRICA',
+            'ESCASSEZ HIDRICA': 'ESCASSEZ_HIDRICA'
+        }
+        
+        return bandeira_map.get(bandeira_upper, 'DESCONHECIDA')
+    
+    def _extract_decimal(self, fields: Dict[str, str], field: str) -> Optional[float]:
+        """Extract decimal value"""
+        value_str = self._extract_field(fields, field)
+        return self._parse_decimal(value_str) if value_str else None
+    
+    def _parse_decimal(self, value_str: str) -> Optional[float]:
+        """Parse Brazilian decimal format (1.234,56)"""
+        if not value_str:
+            return None
+        
+        try:
+            # Remove currency symbols and spaces
+            cleaned = re.sub(r'[R$\s]', '', value_str)
+            # Convert Brazilian format to standard decimal
+            if ',' in cleaned:
+                # Handle thousands separator
+                if cleaned.count(',') == 1 and '.' in cleaned:
+                    # Format: 1.234,56
+                    cleaned = cleaned.replace('.', '').replace(',', '.')
+                else:
+                    # Format: 1234,56
+                    cleaned = cleaned.replace(',', '.')
+            
+            return float(cleaned)
+        except (ValueError, InvalidOperation):
+            logger.warning(f"Could not parse decimal: {value_str}")
+            return None
+    
+    def _extract_taxes(self, fields: Dict[str, str]) -> Dict[str, Optional[float]]:
+        """Extract tax values"""
+        return {
+            "ICMS": self._extract_decimal(fields, 'icms'),
+            "PIS": self._extract_decimal(fields, 'pis'),
+            "COFINS": self._extract_decimal(fields, 'cofins'),
+            "outros": None  # Could be calculated as difference
+        }
+    
+    def _extract_payment_line(self, fields: Dict[str, str], barcodes: List[dict] = None) -> Optional[str]:
+        """Extract payment line (linha digitável)"""
+        # Try from text first
+        linha = self._extract_field(fields, 'linha_digitavel')
+        if linha:
+            return linha
+        
+        # Try from barcodes
+        if barcodes:
+            for barcode in barcodes:
+                if barcode.get('type') == 'CODE128' and len(barcode.get('data', '')) >= 44:
+                    return barcode['data']
+        
+        return None
+    
+    def _extract_barcode(self, fields: Dict[str, str], barcodes: List[dict] = None) -> Optional[str]:
+        """Extract barcode"""
+        # Try from text first
+        codigo = self._extract_field(fields, 'codigo_barras')
+        if codigo:
+            return codigo
+        
+        # Try from barcodes
+        if barcodes:
+            for barcode in barcodes:
+                data = barcode.get('data', '')
+                if len(data) == 44 and data.isdigit():
+                    return data
+        
+        return None
+    
+    def _validate_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate and clean parsed data"""
+        # Ensure required fields are not empty strings
+        for key, value in data.items():
+            if value == '':
+                data[key] = None
+        
+        # Validate date ranges
+        periodo = data.get('periodo', {})
+        if periodo.get('inicio') and periodo.get('fim'):
+            try:
+                inicio = datetime.strptime(periodo['inicio'], '%Y-%m-%d')
+                fim = datetime.strptime(periodo['fim'], '%Y-%m-%d')
+                if inicio > fim:
+                    logger.warning("Invalid period: start date after end date")
+                    data['periodo'] = {"inicio": None, "fim": None}
+            except ValueError:
+                pass
+        
+        # Validate consumption is positive
+        if data.get('consumo_kwh') and data['consumo_kwh'] < 0:
+            logger.warning("Negative consumption detected")
+            data['consumo_kwh'] = None
+        
+        # Validate total taxes don't exceed total value
+        impostos = data.get('impostos', {})
+        valor_total = data.get('valor_total')
+        if valor_total and impostos:
+            total_impostos = sum(v for v in impostos.values() if v is not None)
+            if total_impostos > valor_total:
+                logger.warning("Total taxes exceed total value")
+        
+        return data
\ No newline at end of file
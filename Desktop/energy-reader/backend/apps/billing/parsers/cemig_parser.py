@@ -0,0 +1,10 @@
+from .base import BillParser
+from .registry import register_parser
+
+
+@register_parser
+class CemigParser(BillParser):
+    """Parser for CEMIG energy bills"""
+    
+    distributor = 'CEMIG'
+    keywords = ('cemig', 'companhia energética de minas gerais')
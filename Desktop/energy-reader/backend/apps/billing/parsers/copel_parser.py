@@ -0,0 +1,10 @@
+from .base import BillParser
+from .registry import register_parser
+
+
+@register_parser
+class CopelParser(BillParser):
+    """Parser for COPEL energy bills"""
+    
+    distributor = 'COPEL'
+    keywords = ('copel', 'companhia paranaense de energia')
@@ -0,0 +1,10 @@
+from .base import BillParser
+from .registry import register_parser
+
+
+@register_parser
+class CPFLParser(BillParser):
+    """Parser for CPFL energy bills"""
+    
+    distributor = 'CPFL'
+    keywords = ('cpfl', 'cpfl paulista', 'cpfl piratininga', 'companhia paulista de força e luz')
@@ -0,0 +1,82 @@
+from collections import deque
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton for finding many keywords in one pass.
+
+    Keywords are matched case-insensitively and only as whole words. The
+    failure links are folded into a full transition table when the
+    automaton is built, so scanning is one dict lookup per character
+    whatever the number of keywords.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._outputs: List[List[Tuple[int, Any]]] = [[]]
+        self._built = False
+
+    def add(self, keyword: str, value: Any):
+        """Register a keyword; matches report ``value``"""
+        keyword = keyword.lower()
+        if not keyword:
+            return
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append((len(keyword), value))
+        self._built = False
+
+    def build(self):
+        """Compute failure links and fold them into the transition table"""
+        fail = [0] * len(self._goto)
+        transitions = [dict(edges) for edges in self._goto]
+        outputs = [list(found) for found in self._outputs]
+        queue = deque(transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                if state:
+                    fallback = fail[state]
+                    while fallback and char not in self._goto[fallback]:
+                        fallback = fail[fallback]
+                    fail[next_state] = self._goto[fallback].get(char, 0)
+                # A state also reports the keywords ending at its failure state
+                outputs[next_state].extend(outputs[fail[next_state]])
+            # Missing edges follow the failure state's (already complete) edges
+            if state:
+                for char, target in transitions[fail[state]].items():
+                    transitions[state].setdefault(char, target)
+        self._transitions = transitions
+        self._match_outputs = outputs
+        self._built = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """Yield (start, keyword length, value) for every whole-word keyword match"""
+        if not self._built:
+            self.build()
+        transitions = self._transitions
+        outputs = self._match_outputs
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Rare characters change length when lowercased; keep offsets aligned
+            lowered = text
+        state = 0
+        for end, char in enumerate(lowered):
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                for length, value in outputs[state]:
+                    start = end - length + 1
+                    if _is_word_boundary(lowered, start - 1) and _is_word_boundary(lowered, end + 1):
+                        yield start, length, value
+
+
+def _is_word_boundary(text: str, index: int) -> bool:
+    return index < 0 or index >= len(text) or not text[index].isalnum()
@@ -0,0 +1,11 @@
+from .base import BillParser
+from .registry import register_parser
+
+
+@register_parser
+class LightParser(BillParser):
+    """Parser for Light energy bills"""
+    
+    distributor = 'Light'
+    # 'light' alone is an ordinary word in bill text, so only the company name counts
+    keywords = ('light s.a', 'light s/a', 'light sesa', 'light serviços de eletricidade')
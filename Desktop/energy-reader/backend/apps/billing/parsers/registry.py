@@ -0,0 +1,59 @@
+from collections import Counter
+from typing import Dict, Optional, Type
+from .base import BillParser
+from .keywords import KeywordAutomaton
+
+# Only the head of the text is scanned: distributors name themselves in the header
+SELECT_SCAN_CHARS = 3000
+
+_parsers: Dict[str, Type[BillParser]] = {}
+_automaton: Optional[KeywordAutomaton] = None
+_default: Optional[str] = None
+
+
+def register_parser(parser_class: Type[BillParser], default: bool = False) -> Type[BillParser]:
+    """Add a distributor parser to the registry (usable as a class decorator)"""
+    global _automaton, _default
+    _parsers[parser_class.distributor.lower()] = parser_class
+    if default or _default is None:
+        _default = parser_class.distributor.lower()
+    _automaton = None
+    return parser_class
+
+
+def get_parser(distributor: str) -> Optional[BillParser]:
+    """Parser instance for a distributor name, or None if unknown"""
+    parser_class = _parsers.get((distributor or '').lower())
+    return parser_class() if parser_class else None
+
+
+def select_parser(text: str) -> BillParser:
+    """Pick the parser whose keywords occur most often in the text.
+
+    All distributors' keywords are found in a single automaton pass, so
+    selection cost does not grow with the number of parsers. Ties go to
+    the distributor mentioned first; without any match the default
+    parser is used.
+    """
+    hits = Counter()
+    first_seen = {}
+    for start, _, distributor in _get_automaton().iter_matches((text or '')[:SELECT_SCAN_CHARS]):
+        hits[distributor] += 1
+        first_seen.setdefault(distributor, start)
+
+    if not hits:
+        return _parsers[_default]()
+    best = max(hits, key=lambda distributor: (hits[distributor], -first_seen[distributor]))
+    return _parsers[best]()
+
+
+def _get_automaton() -> KeywordAutomaton:
+    global _automaton
+    if _automaton is None:
+        automaton = KeywordAutomaton()
+        for distributor, parser_class in _parsers.items():
+            for keyword in parser_class.keywords:
+                automaton.add(keyword, distributor)
+        automaton.build()
+        _automaton = automaton
+    return _automaton
@@ -0,0 +1,74 @@
+import re
+from typing import Dict, Iterable, Sequence, Tuple
+
+# Label/value field spec: labels that may precede the value, and the value
+# pattern with a single capture group. Fields without labels are matched
+# on the value pattern alone.
+FieldSpec = Tuple[Sequence[str], str]
+
+
+def _label_pattern(labels: Iterable[str], flags: int = 0) -> re.Pattern:
+    """One literal alternation of labels, longest first so none is shadowed by its prefix"""
+    alternation = '|'.join(re.escape(label) for label in sorted(labels, key=lambda label: (-len(label), label)))
+    return re.compile(rf'\b(?:{alternation})', flags)
+
+
+class FieldScanner:
+    """Find the first value of many labelled fields in a single sweep.
+
+    All labels are folded into one literal alternation that walks the
+    lowercased text once. At each label hit only the fields with a label
+    starting there are tried, by anchoring their value pattern right after
+    the label, so every field gets its earliest match as if it had been
+    searched for on its own. The alternation is compiled once; labels of
+    fields already found are skipped at their hits.
+    """
+
+    def __init__(self, fields: Dict[str, FieldSpec]):
+        self._by_initial = {}
+        self._label_fields = {}
+        self._unlabelled = {}
+        for field, (labels, value) in fields.items():
+            if re.compile(value).groups != 1:
+                raise ValueError(f"Value pattern for {field} must have exactly one capture group")
+            if not labels:
+                self._unlabelled[field] = re.compile(value, re.IGNORECASE)
+                continue
+            value_re = re.compile(r'[:\s]*' + value, re.IGNORECASE)
+            for label in labels:
+                label = label.lower()
+                self._by_initial.setdefault(label[0], []).append((label, field, value_re))
+                self._label_fields.setdefault(label, set()).add(field)
+        self._labelled_count = len(set().union(*self._label_fields.values()))
+        self._labels = _label_pattern(self._label_fields)
+        self._labels_ignorecase = _label_pattern(self._label_fields, re.IGNORECASE)
+
+    def scan(self, text: str) -> Dict[str, str]:
+        """Return the first value found for each field (missing fields are absent)"""
+        found = {}
+        haystack, labels = text.lower(), self._labels
+        if len(haystack) != len(text):
+            # Rare characters change length when lowercased; keep offsets aligned
+            haystack, labels = text, self._labels_ignorecase
+
+        position = 0
+        while len(found) < self._labelled_count:
+            match = labels.search(haystack, position)
+            if match is None:
+                break
+            start = match.start()
+            for label, field, value_re in self._by_initial.get(haystack[start].lower(), ()):
+                if field in found:
+                    continue
+                if haystack[start:start + len(label)].lower() != label:
+                    continue
+                value = value_re.match(text, start + len(label))
+                if value:
+                    found[field] = value.group(1).strip()
+            position = start + 1
+
+        for field, value_re in self._unlabelled.items():
+            value = value_re.search(text)
+            if value:
+                found[field] = value.group(1).strip()
+        return found
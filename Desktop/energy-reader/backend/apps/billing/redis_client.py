@@ -0,0 +1,15 @@
+from django.conf import settings
+
+_redis = None
+
+
+def get_redis():
+    """Shared Redis client, or None when redis-py is not installed"""
+    global _redis
+    if _redis is None:
+        try:
+            import redis
+        except ImportError:
+            return None
+        _redis = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=2)
+    return _redis
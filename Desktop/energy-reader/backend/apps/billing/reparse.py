@@ -0,0 +1,145 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import EXTRACTED_FIELDS, Bill, OCRCacheEntry
+from .ocr.fingerprint import match_layout_hash
+from .ocr.layout import OCRLayout
+from .parsers import PARSER_VERSION, get_parser, select_parser
+from .tasks import _update_bill_fields
+
+logger = logging.getLogger(__name__)
+
+# Columns a re-parse rewrites (see tasks._update_bill_fields)
+REPARSED_FIELDS = ['parsed_json', 'parser_version', 'updated_at'] + EXTRACTED_FIELDS
+
+# (bill id, OCR text, barcodes, layout words, page-1 layout hash, distributor from its fingerprint)
+ParseJob = Tuple[int, str, list, Optional[dict], Optional[str], Optional[str]]
+
+
+def parse_stored_ocr(job: ParseJob) -> Tuple[int, Optional[dict]]:
+    """Parse one bill's stored OCR output (runs in pool workers, no DB access)"""
+    bill_id, text, barcodes, words, layout_hash, distributor = job
+    parser = get_parser(distributor) if distributor else None
+    if parser is None:
+        parser = select_parser(text)
+    try:
+        parsed_data = parser.parse(text, barcodes, OCRLayout.from_dict(words))
+    except Exception as e:
+        logger.warning(f"Re-parse failed for bill {bill_id}: {type(e).__name__}")
+        return bill_id, None
+    # Kept like process_bill_task does, so the next re-parse still routes by fingerprint
+    if parsed_data and layout_hash:
+        parsed_data['layout_hash'] = layout_hash
+    return bill_id, parsed_data
+
+
+def stale_bills():
+    """Processed bills parsed by an older parser version"""
+    return Bill.objects.filter(
+        status=Bill.Status.PROCESSED,
+        parser_version__lt=PARSER_VERSION
+    )
+
+
+def reparse_stale_bills(chunk_size: Optional[int] = None, workers: Optional[int] = None,
+                        limit: Optional[int] = None) -> Dict[str, int]:
+    """Re-parse stored OCR text of stale bills and write results back in bulk.
+
+    Bills are streamed in primary key order, one chunk at a time, so memory
+    stays flat over the whole history. Chunks are parsed in a process pool
+    when ``workers`` > 1. Bills stored before OCR text was kept fall back to
+    the OCR cache; bills with neither are skipped. Each row is written only
+    if the bill is unchanged since it was read, so bills reprocessed or
+    claimed meanwhile are left alone and counted as ``changed``.
+    """
+    chunk_size = chunk_size or settings.REPARSE_CHUNK_SIZE
+    workers = workers or settings.REPARSE_WORKERS
+    stats = {'reparsed': 0, 'failed': 0, 'skipped': 0, 'changed': 0}
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    distributors = {}
+    last_id = 0
+
+    try:
+        while limit is None or sum(stats.values()) < limit:
+            size = chunk_size if limit is None else min(chunk_size, limit - sum(stats.values()))
+            bills = list(
+                stale_bills()
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'file_hash', 'ocr_text', 'ocr_barcodes', 'ocr_words', *REPARSED_FIELDS)[:size]
+            )
+            if not bills:
+                break
+            last_id = bills[-1].id
+
+            jobs = _build_jobs(bills, distributors)
+            stats['skipped'] += len(bills) - len(jobs)
+            results, executor = _parse_jobs(jobs, executor, workers)
+
+            by_id = {bill.id: bill for bill in bills}
+            now = timezone.now()
+            with transaction.atomic():
+                for bill_id, parsed_data in results:
+                    if not parsed_data:
+                        stats['failed'] += 1
+                        continue
+                    bill = by_id[bill_id]
+                    read = {'parser_version': bill.parser_version, 'updated_at': bill.updated_at}
+                    bill.parsed_json = parsed_data
+                    _update_bill_fields(bill, parsed_data)
+                    bill.parser_version = PARSER_VERSION
+                    # update() skips auto_now
+                    bill.updated_at = now
+                    written = Bill.objects.filter(id=bill_id, status=Bill.Status.PROCESSED, **read).update(
+                        **{field: getattr(bill, field) for field in REPARSED_FIELDS}
+                    )
+                    stats['reparsed' if written else 'changed'] += 1
+            logger.info("Re-parsed bill chunk", extra={'last_id': last_id, **stats})
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return stats
+
+
+def _build_jobs(bills: List[Bill], distributors: Dict[str, Optional[str]]) -> List[ParseJob]:
+    """Parse inputs for a chunk, filling missing OCR text from the OCR cache"""
+    missing = [bill.file_hash for bill in bills if not bill.ocr_text]
+    cached = {}
+    if missing:
+        for entry in OCRCacheEntry.objects.filter(file_hash__in=missing).order_by('created_at'):
+            cached[entry.file_hash] = entry
+
+    jobs = []
+    for bill in bills:
+        text, barcodes, words = bill.ocr_text, bill.ocr_barcodes, bill.ocr_words
+        if not text:
+            entry = cached.get(bill.file_hash)
+            if entry is None:
+                continue
+            text, barcodes, words = entry.text, entry.barcodes, entry.words
+
+        # Same distributor choice as processing: the layout fingerprint wins
+        layout_hash = (bill.parsed_json or {}).get('layout_hash')
+        if layout_hash and layout_hash not in distributors:
+            distributors[layout_hash] = match_layout_hash(layout_hash).distributor
+        jobs.append((bill.id, text, barcodes or [], words, layout_hash, distributors.get(layout_hash)))
+    return jobs
+
+
+def _parse_jobs(jobs: List[ParseJob], executor: Optional[ProcessPoolExecutor],
+                workers: int) -> Tuple[list, Optional[ProcessPoolExecutor]]:
+    """Parse a chunk in the pool, falling back to this process if the pool is unusable"""
+    if executor is not None:
+        try:
+            chunksize = max(1, len(jobs) // (workers * 4))
+            return list(executor.map(parse_stored_ocr, jobs, chunksize=chunksize)), executor
+        except Exception as e:
+            # e.g. daemonic Celery children that are not allowed to fork
+            logger.warning(f"Re-parse pool failed, continuing in process: {e}")
+            executor.shutdown(wait=False, cancel_futures=True)
+            executor = None
+    return [parse_stored_ocr(job) for job in jobs], executor
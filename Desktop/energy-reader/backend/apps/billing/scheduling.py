@@ -0,0 +1,155 @@
+import logging
+import time
+from typing import Iterable
+from django.conf import settings
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Celery queues: single uploads go straight to their own lane, bulk work is metered
+QUEUE_INTERACTIVE = 'interactive'
+QUEUE_BULK = 'bulk'
+
+# Redis keys of the bulk scheduler
+_RING = 'fair:users'            # users with pending bulk bills, rotated round-robin
+_ACTIVE = 'fair:active'         # set mirror of the ring for O(1) membership
+_IN_FLIGHT = 'fair:in_flight'   # bill id -> dispatch time of bulk tasks in the broker or running
+_LOCK = 'fair:lock'
+
+
+def _user_queue(user_id) -> str:
+    return f'fair:user:{user_id}'
+
+
+def enqueue_interactive(bill_id: int):
+    """Queue a bill a user is waiting on"""
+    from .tasks import process_bill_task
+    process_bill_task.apply_async((bill_id,), queue=QUEUE_INTERACTIVE)
+
+
+def enqueue_bulk(user_id: int, bill_ids: Iterable[int]):
+    """Queue bills behind the fair scheduler: one sub-queue per user, served round-robin.
+
+    At most BULK_MAX_IN_FLIGHT bulk tasks are handed to Celery at a time, so
+    a user with hundreds of bills only ever holds one slot per turn and the
+    bulk lane never floods the broker. Without Redis bills go straight to
+    the bulk queue.
+    """
+    bill_ids = list(bill_ids)
+    if not bill_ids:
+        return
+    client = get_redis()
+    if client is None:
+        for bill_id in bill_ids:
+            _send_bulk(bill_id)
+        return
+
+    pushed = False
+    try:
+        with client.lock(_LOCK, timeout=30, blocking_timeout=10):
+            # Join the ring before pushing: once the bills are queued they are served
+            if client.sadd(_ACTIVE, user_id):
+                # Newcomers get the next turn: small batches are not queued behind a full round
+                client.lpush(_RING, user_id)
+            client.rpush(_user_queue(user_id), *bill_ids)
+            pushed = True
+            _dispatch(client)
+    except Exception as e:
+        if pushed:
+            # Queued in Redis; the next finished task or the periodic dispatch hands them out
+            logger.warning(f"Bulk dispatch failed after queueing: {type(e).__name__}")
+            return
+        # Better unmetered than left waiting in Redis
+        logger.warning(f"Fair scheduler unavailable, queueing bulk bills directly: {type(e).__name__}")
+        for bill_id in bill_ids:
+            _send_bulk(bill_id)
+
+
+def bulk_task_finished(bill_id: int):
+    """Free the bill's in-flight slot and hand out the next bulk bill"""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.zrem(_IN_FLIGHT, bill_id)
+    except Exception as e:
+        # The slot expires with its lease
+        logger.warning(f"Bulk slot release failed: {type(e).__name__}")
+        return
+    dispatch_bulk()
+
+
+def bulk_task_retrying(bill_id: int, countdown: int):
+    """Keep the bill's in-flight slot for its retry; the lease restarts when the retry is due"""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.zadd(_IN_FLIGHT, {bill_id: time.time() + countdown})
+    except Exception as e:
+        # The slot expires with its lease
+        logger.warning(f"Bulk slot renewal failed: {type(e).__name__}")
+
+
+def bulk_pending(user_id: int, bill_id: int) -> bool:
+    """Whether the bill waits in its user's fair queue or holds an in-flight slot"""
+    client = get_redis()
+    if client is None:
+        return False
+    try:
+        return (client.zscore(_IN_FLIGHT, bill_id) is not None
+                or client.lpos(_user_queue(user_id), bill_id) is not None)
+    except Exception as e:
+        # Unknown: let the caller queue it; a duplicate task finds the bill claimed
+        logger.warning(f"Bulk queue lookup failed: {type(e).__name__}")
+        return False
+
+
+def dispatch_bulk() -> int:
+    """Fill free in-flight slots from the user ring; returns bills dispatched"""
+    client = get_redis()
+    if client is None:
+        return 0
+    try:
+        with client.lock(_LOCK, timeout=30, blocking_timeout=10):
+            return _dispatch(client)
+    except Exception as e:
+        # Slots are refilled by the next finished task or the periodic dispatch
+        logger.warning(f"Bulk dispatch skipped: {type(e).__name__}")
+        return 0
+
+
+def _dispatch(client) -> int:
+    now = time.time()
+    # Slots of tasks lost without finishing (worker killed) expire after the lease
+    client.zremrangebyscore(_IN_FLIGHT, 0, now - settings.BULK_TASK_LEASE_SECONDS)
+    free = settings.BULK_MAX_IN_FLIGHT - client.zcard(_IN_FLIGHT)
+    dispatched = 0
+    while free > 0:
+        user_id = client.lmove(_RING, _RING, 'LEFT', 'RIGHT')
+        if user_id is None:
+            break
+        user_id = int(user_id)
+        bill_id = client.lpop(_user_queue(user_id))
+        if bill_id is None:
+            client.lrem(_RING, 0, user_id)
+            client.srem(_ACTIVE, user_id)
+            continue
+        bill_id = int(bill_id)
+        client.zadd(_IN_FLIGHT, {bill_id: now})
+        try:
+            _send_bulk(bill_id)
+        except Exception as e:
+            # Broker unreachable: put the bill back at the head of its queue for the next round
+            logger.warning(f"Bulk send failed, bill requeued: {type(e).__name__}")
+            client.lpush(_user_queue(user_id), bill_id)
+            client.zrem(_IN_FLIGHT, bill_id)
+            break
+        dispatched += 1
+        free -= 1
+    return dispatched
+
+
+def _send_bulk(bill_id: int):
+    from .tasks import process_bill_task
+    process_bill_task.apply_async((bill_id,), kwargs={'bulk': True}, queue=QUEUE_BULK)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Bill
+from .sync import SYNC_FIELDS
 
 class BillUploadSerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,8 +17,18 @@ class BillListSerializer(serializers.ModelSerializer):
         fields = ['id', 'status', 'fornecedor', 'period_start', 'period_end', 
                  'consumo_kwh', 'valor_total', 'created_at']
 
+class BillSyncSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Bill
+        fields = SYNC_FIELDS
+
+class BillStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Bill
+        fields = ['id', 'status', 'error_message', 'processed_at', 'updated_at']
+
 class BillSerializer(serializers.ModelSerializer):
     class Meta:
         model = Bill
-        fields = '__all__'
+        exclude = ['ocr_text', 'ocr_barcodes', 'ocr_words', 'parser_version']
         read_only_fields = ['user', 'file_hash', 'created_at', 'updated_at']
\ No newline at end of file
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Bill, BillTombstone
+
+
+@receiver(post_delete, sender=Bill)
+def record_bill_tombstone(sender, instance, origin=None, **kwargs):
+    """Leave a tombstone for delta sync when a bill is deleted on its own"""
+    # Bills removed with their user need no tombstone (and the user row is going away)
+    origin_model = getattr(origin, 'model', type(origin))
+    if origin is not None and origin_model is not Bill:
+        return
+    BillTombstone.objects.create(user_id=instance.user_id, bill_id=instance.id)
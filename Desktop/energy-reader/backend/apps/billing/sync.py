@@ -0,0 +1,114 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import List, Optional, Tuple
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Bill, BillTombstone
+
+# Columns a sync payload carries (BillSyncSerializer)
+SYNC_FIELDS = [
+    'id', 'status', 'fornecedor', 'period_start', 'period_end',
+    'consumo_kwh', 'valor_total', 'created_at', 'updated_at',
+]
+
+# Watermark: (timestamp, last bill id at that timestamp or 0 once caught up, time it was
+# issued; paging watermarks keep the issue time of the sync they continue)
+SyncPosition = Tuple[datetime, int, datetime]
+
+# Issue time carried by the pages of a first sync: the client holds no bills yet
+_NEVER_SYNCED = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+@dataclass
+class SyncDelta:
+    created: List[Bill] = field(default_factory=list)
+    updated: List[Bill] = field(default_factory=list)
+    deleted: List[int] = field(default_factory=list)
+    # Watermark for the next call
+    position: SyncPosition = None
+    has_more: bool = False
+    # The watermark predates kept tombstones: the client must drop its copy and resync
+    reset: bool = False
+
+
+def encode_sync_position(position: SyncPosition) -> str:
+    """Opaque cursor for a sync watermark"""
+    timestamp, pk, issued = position
+    return urlsafe_b64encode(f'{timestamp.isoformat()}|{pk}|{issued.isoformat()}'.encode()).decode()
+
+
+def decode_sync_position(encoded: str) -> Optional[SyncPosition]:
+    """Sync watermark from a cursor, or None if it is malformed"""
+    try:
+        parts = urlsafe_b64decode(encoded.encode()).decode().split('|')
+        # Cursors from before the issue time was added: (timestamp, id)
+        timestamp, pk, issued = parts if len(parts) == 3 else parts + parts[:1]
+        position = parse_datetime(timestamp), int(pk), parse_datetime(issued)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return position if None not in position else None
+
+
+def bill_changes(user, since: Optional[SyncPosition], limit: int) -> SyncDelta:
+    """Bills created, updated or deleted after a (timestamp, id) watermark.
+
+    Bills are read in (updated_at, id) order from the (user, updated_at, id)
+    index, ``limit`` at a time. While more remain the watermark is the last
+    bill returned. Once caught up it trails the current time by a few
+    seconds, so rows committed late with an earlier updated_at are sent again
+    rather than missed.
+
+    Bills created after the watermark was issued are reported as created,
+    the rest as updated. A caught-up watermark issued before the tombstone
+    retention window resets the client. Paging watermarks are always
+    followed: their timestamp is an old bill's updated_at, not the client's
+    last sync.
+    """
+    now = timezone.now()
+    delta = SyncDelta()
+
+    retention = now - timedelta(days=settings.BILL_TOMBSTONE_RETENTION_DAYS)
+    if since is not None and since[1] == 0 and since[2] < retention:
+        delta.reset = True
+        since = None
+
+    bills = Bill.objects.filter(user=user).order_by('updated_at', 'id').only(*SYNC_FIELDS)
+    if since is not None:
+        timestamp, pk, _ = since
+        bills = bills.filter(Q(updated_at__gt=timestamp) | Q(updated_at=timestamp, id__gt=pk))
+    page = list(bills[:limit + 1])
+    delta.has_more = len(page) > limit
+    page = page[:limit]
+
+    for bill in page:
+        if since is None or bill.created_at > since[2]:
+            delta.created.append(bill)
+        else:
+            delta.updated.append(bill)
+
+    if delta.has_more:
+        delta.position = (page[-1].updated_at, page[-1].id, since[2] if since is not None else _NEVER_SYNCED)
+    else:
+        settled = now - timedelta(seconds=settings.BILL_SYNC_SETTLE_SECONDS)
+        delta.position = (max(settled, since[0]) if since is not None else settled, 0, now)
+
+    if since is not None:
+        # Deletions up to the watermark; later ones come with the next call
+        delta.deleted = list(
+            BillTombstone.objects.filter(
+                user=user,
+                deleted_at__gt=since[0],
+                deleted_at__lte=delta.position[0] if delta.has_more else now
+            ).values_list('bill_id', flat=True)
+        )
+    return delta
+
+
+def purge_tombstones() -> int:
+    """Delete tombstones older than the retention window"""
+    retention = timezone.now() - timedelta(days=settings.BILL_TOMBSTONE_RETENTION_DAYS)
+    deleted, _ = BillTombstone.objects.filter(deleted_at__lt=retention).delete()
+    return deleted
@@ -1,47 +1,102 @@
 import logging
+import uuid
+from datetime import timedelta
+from typing import Optional
 from celery import shared_task
+from django.conf import settings
+from django.db.models import F, Q
 from django.utils import timezone
-from .models import Bill
-from .ocr.processor import OCRProcessor
-from .parsers.enel_parser import EnelParser
+from .events import publish_status
+from .models import EXTRACTED_FIELDS, STORED_OCR_FIELDS, Bill
+from .ocr.cache import cached_layout_hash, evict_stale_versions, get_cached_result, store_result
+from .ocr.fingerprint import identify_layout, lookup_layout
+from .ocr.pool import ocr_engine
+from .ocr.templates import get_template
+from .parsers import PARSER_VERSION, get_parser, select_parser
+from .scheduling import bulk_task_finished, bulk_task_retrying, dispatch_bulk
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task(bind=True, max_retries=3)
-def process_bill_task(self, bill_id):
+def process_bill_task(self, bill_id, bulk=False):
     """Process bill file with OCR and data extraction"""
+    token = claim_bill(bill_id)
+    if token is None:
+        # Duplicate delivery, double click or a bill another run is still working on
+        logger.info("Bill not claimable, skipping", extra={'bill_id': bill_id})
+        if bulk:
+            bulk_task_finished(bill_id)
+        return
+    
+    retrying = False
     try:
         bill = Bill.objects.get(id=bill_id)
-        bill.status = Bill.Status.PROCESSING
-        bill.save()
+        publish_status(bill)
         
         logger.info("Starting bill processing")
         
-        # Initialize OCR processor
-        ocr_processor = OCRProcessor()
-        
-        # Process file with safe path handling
+        # Safe path handling
         from django.core.files.storage import default_storage
         file_path = default_storage.path(bill.raw_file.name)
-        ocr_result = ocr_processor.process_file(file_path)
         
-        if not ocr_result.success:
-            raise Exception(f"OCR failed: {ocr_result.error}")
+        # Identify distributor and layout before any OCR: content seen before
+        # already has its page-1 hash, otherwise page 1 is rendered at low res
+        known_hash = cached_layout_hash(bill.file_hash)
+        layout_match = lookup_layout(known_hash) if known_hash else identify_layout(file_path)
+        
+        template = None
+        profile = None
+        if layout_match is not None and layout_match.known:
+            if settings.OCR_USE_TEMPLATES and layout_match.template_version:
+                template = get_template(layout_match.distributor, layout_match.template_version)
+            profile = layout_match.preprocessing_profile or None
         
-        # Parse Enel data
-        parser = EnelParser()
-        parsed_data = parser.parse(ocr_result.text, ocr_result.barcodes)
+        # Same bytes, OCR engine version, profile and template: reuse the cached result
+        ocr_result = get_cached_result(bill.file_hash, profile=profile, template=template)
         
-        # Update bill with parsed data
+        if ocr_result is None:
+            # Reuse the worker's warm engines
+            with ocr_engine() as ocr_processor:
+                ocr_result = ocr_processor.process_file(file_path, template=template, profile=profile)
+            
+            if not ocr_result.success:
+                raise Exception(f"OCR failed: {ocr_result.error}")
+            
+            store_result(
+                bill.file_hash, ocr_result, profile=profile, template=template,
+                layout_hash=layout_match.layout_hash if layout_match is not None else ''
+            )
+        else:
+            logger.info("Using cached OCR result")
+        
+        # Parse with the distributor's parser: known layout first, else by keywords
+        parser = None
+        if layout_match is not None and layout_match.known:
+            parser = get_parser(layout_match.distributor)
+        if parser is None:
+            parser = select_parser(ocr_result.text)
+        parsed_data = parser.parse(ocr_result.text, ocr_result.barcodes, ocr_result.layout)
+        if parsed_data and layout_match is not None:
+            parsed_data['layout_hash'] = layout_match.layout_hash
+        
+        # Update bill with parsed data, keeping the OCR output for later re-parses
+        bill.ocr_text = ocr_result.text
+        bill.ocr_barcodes = ocr_result.barcodes or []
+        bill.ocr_words = ocr_result.layout.to_dict() if ocr_result.layout is not None else None
+        bill.parser_version = PARSER_VERSION
         bill.parsed_json = parsed_data
         bill.status = Bill.Status.PROCESSED
+        bill.error_message = ''
         bill.processed_at = timezone.now()
         
         # Update extracted fields for easier querying
         _update_bill_fields(bill, parsed_data)
         
-        bill.save()
+        if not _save_claimed(bill, token, ['status', 'error_message', 'processed_at'] + STORED_OCR_FIELDS + EXTRACTED_FIELDS):
+            logger.warning("Lost claim on bill, discarding result", extra={'bill_id': bill_id})
+            return
+        publish_status(bill)
         
         logger.info("Bill processed successfully")
         
@@ -55,17 +110,118 @@ def process_bill_task(self, bill_id):
     except Exception as exc:
         logger.error("Error processing bill", extra={'bill_id': bill_id, 'error': str(exc)[:200]})
         
-        try:
-            bill = Bill.objects.get(id=bill_id)
-            bill.status = Bill.Status.FAILED
-            bill.error_message = str(exc)
-            bill.save()
-        except Bill.DoesNotExist:
-            pass
+        # Retries claim the bill again, so hand it back as UPLOADED until the last attempt
+        retrying = self.request.retries < self.max_retries
+        bill = Bill(
+            id=bill_id,
+            status=Bill.Status.UPLOADED if retrying else Bill.Status.FAILED,
+            error_message=str(exc)
+        )
+        if _save_claimed(bill, token, ['status', 'error_message']):
+            # None if the bill was deleted meanwhile: nobody is waiting on it
+            bill.user_id = Bill.objects.filter(id=bill_id).values_list('user_id', flat=True).first()
+            if bill.user_id is not None:
+                publish_status(bill)
         
         # Retry with exponential backoff
-        if self.request.retries < self.max_retries:
-            raise self.retry(countdown=60 * (2 ** self.request.retries))
+        if retrying:
+            countdown = 60 * (2 ** self.request.retries)
+            if bulk:
+                # The retry runs on the bulk lane again and keeps this slot
+                bulk_task_retrying(bill_id, countdown)
+            raise self.retry(countdown=countdown)
+    
+    finally:
+        if bulk and not retrying:
+            # Hand this slot to the next user in the fair bulk rotation
+            bulk_task_finished(bill_id)
+
+
+@shared_task
+def dispatch_bulk_task():
+    """Refill bulk in-flight slots lost to crashed workers (run every minute)"""
+    dispatched = dispatch_bulk()
+    if dispatched:
+        logger.info(f"Dispatched {dispatched} queued bulk bills")
+
+
+@shared_task
+def evict_stale_ocr_cache_task():
+    """Delete OCR cache entries from previous engine versions (run daily)"""
+    try:
+        deleted = evict_stale_versions()
+        logger.info(f"Evicted {deleted} stale OCR cache entries")
+    except Exception as exc:
+        logger.error(f"Error evicting OCR cache: {type(exc).__name__}")
+
+
+@shared_task
+def purge_bill_tombstones_task():
+    """Delete delta-sync tombstones past the retention window (run daily)"""
+    from .sync import purge_tombstones
+    
+    try:
+        deleted = purge_tombstones()
+        logger.info(f"Purged {deleted} bill tombstones")
+    except Exception as exc:
+        logger.error(f"Error purging bill tombstones: {type(exc).__name__}")
+
+
+@shared_task
+def reparse_stale_bills_task():
+    """Re-parse stored OCR output of bills from older parser versions (run after deploys)"""
+    from .reparse import reparse_stale_bills
+    
+    try:
+        stats = reparse_stale_bills()
+        logger.info(f"Re-parsed {stats['reparsed']} bills ({stats['failed']} failed, {stats['skipped']} skipped, "
+                    f"{stats['changed']} changed meanwhile)")
+    except Exception as exc:
+        logger.error(f"Error re-parsing bills: {type(exc).__name__}")
+
+
+def claim_bill(bill_id) -> Optional[str]:
+    """Atomically move a bill from UPLOADED to PROCESSING; returns the claim token.
+
+    The conditional UPDATE lets exactly one run win. A bill whose claim is
+    older than BILL_PROCESSING_LEASE_SECONDS (its worker died) can be
+    claimed again. Returns None when the bill is not claimable.
+    """
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.BILL_PROCESSING_LEASE_SECONDS)
+    claimed = Bill.objects.filter(id=bill_id).filter(
+        Q(status=Bill.Status.UPLOADED) |
+        Q(status=Bill.Status.PROCESSING, processing_started_at__lt=stale)
+    ).update(
+        status=Bill.Status.PROCESSING,
+        processing_token=token,
+        processing_started_at=now,
+        processing_attempts=F('processing_attempts') + 1,
+        updated_at=now
+    )
+    return token if claimed else None
+
+
+def unclaimed() -> Q:
+    """Bills no live processing run holds: any status but PROCESSING, or a stale claim.
+
+    Reprocessing may reset these; a worker that still finishes a stale
+    claim afterwards finds its token gone and discards its result.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.BILL_PROCESSING_LEASE_SECONDS)
+    return ~Q(status=Bill.Status.PROCESSING) | Q(processing_started_at__lt=stale)
+
+
+def _save_claimed(bill, token, fields) -> bool:
+    """Write the given fields only while ``token`` still holds the claim"""
+    bill.updated_at = timezone.now()
+    values = {field: getattr(bill, field) for field in fields + ['updated_at']}
+    return Bill.objects.filter(
+        id=bill.id,
+        status=Bill.Status.PROCESSING,
+        processing_token=token
+    ).update(**values) == 1
 
 
 def _update_bill_fields(bill, parsed_data):
@@ -73,12 +229,16 @@ def _update_bill_fields(bill, parsed_data):
     if not parsed_data:
         return
     
+    # Start from defaults so fields the parser no longer finds are cleared
+    for field in EXTRACTED_FIELDS:
+        setattr(bill, field, Bill._meta.get_field(field).get_default())
+    
     # Basic info
-    bill.fornecedor = parsed_data.get('fornecedor', '')
-    bill.numero_cliente = parsed_data.get('numero_cliente', '')
-    bill.unidade_consumidora = parsed_data.get('unidade_consumidora', '')
-    bill.instalacao = parsed_data.get('instalacao', '')
-    bill.endereco = parsed_data.get('endereco', '')
+    bill.fornecedor = parsed_data.get('fornecedor') or ''
+    bill.numero_cliente = parsed_data.get('numero_cliente') or ''
+    bill.unidade_consumidora = parsed_data.get('unidade_consumidora') or ''
+    bill.instalacao = parsed_data.get('instalacao') or ''
+    bill.endereco = parsed_data.get('endereco') or ''
     
     # Dates
     periodo = parsed_data.get('periodo', {})
@@ -101,7 +261,7 @@ def _update_bill_fields(bill, parsed_data):
         bill.valor_total = parsed_data['valor_total']
     
     # Bandeira tarifária
-    bandeira = parsed_data.get('bandeira_tarifaria', '').upper()
+    bandeira = (parsed_data.get('bandeira_tarifaria') or '').upper()
     if bandeira in [choice[0] for choice in Bill.BandeiraTarifaria.choices]:
         bill.bandeira_tarifaria = bandeira
     
@@ -1,16 +1,63 @@
+import hashlib
 import os
 import tempfile
+import time
+import numpy as np
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
 from decimal import Decimal
-from django.test import TestCase
+from unittest.mock import Mock, patch
+from unittest import skipIf
+from django.conf import settings
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models.fields.files import FieldFile
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import Bill
+from .models import Bill, BillBatch, LayoutFingerprint, OCRCacheEntry
+from .ocr.boleto import is_valid_boleto_barcode
+from .ocr.cache import evict_stale_versions, get_cached_result, store_result
+from .ocr.fingerprint import hamming_distance, identify_layout, layout_hash
+from .ocr.layout import OCRLayout
+from .ocr.pool import OCREnginePool
+from .ocr.preprocessing import estimate_skew, select_profile
+from .ocr.result import OCRResult
+from .ocr import templates as ocr_templates
+from .ocr.templates import FieldRegion, LayoutTemplate, content_bounds, get_template, region_pixels
+from .parsers import get_parser, select_parser
 from .parsers.enel_parser import EnelParser
+from .parsers.keywords import KeywordAutomaton
+
+try:
+    from .ocr import barcodes as ocr_barcodes
+except ImportError:
+    # zbar shared library is not installed
+    ocr_barcodes = None
+
+try:
+    from .ocr import processor as ocr_processor
+except ImportError:
+    # PaddleOCR is not installed
+    ocr_processor = None
 
 User = get_user_model()
 
+# Synthetic layout for the template machinery; no template ships built in
+SAMPLE_TEMPLATE = LayoutTemplate(
+    distributor='Enel',
+    version='v1',
+    regions=(
+        FieldRegion('numero_cliente', 'Número do Cliente', (0.55, 0.08, 1.00, 0.16)),
+        FieldRegion('valor_total', 'Total a Pagar', (0.78, 0.22, 1.00, 0.30)),
+        FieldRegion('codigo_de_barras', '', (0.00, 0.88, 1.00, 1.00), kind='barcode'),
+    ),
+    required_fields=('numero_cliente', 'valor_total'),
+)
+
 
 class BillModelTest(TestCase):
     """Test Bill model"""
@@ -88,6 +135,50 @@ class EnelParserTest(TestCase):
         self.assertEqual(result['bandeira_tarifaria'], 'VERDE')
         self.assertEqual(result['valor_total'], 125.50)
     
+    def test_parse_with_layout(self):
+        """Test values are read next to their labels in the OCR layout"""
+        layout = OCRLayout()
+        layout.add(1, 'Vencimento', (100, 100, 300, 130), 0.9)
+        layout.add(1, '25/02/2024', (320, 102, 500, 128), 0.9)
+        layout.add(1, 'Total a Pagar', (100, 200, 300, 230), 0.9)
+        layout.add(1, 'R$ 1.234,56', (100, 240, 300, 270), 0.9)
+        layout = OCRLayout.from_dict(layout.to_dict())
+        
+        result = self.parser.parse('Vencimento Total a Pagar 01/01/2020', layout=layout)
+        
+        self.assertEqual(result['vencimento'], '2024-02-25')
+        self.assertEqual(result['valor_total'], 1234.56)
+    
+    def test_layout_consumption_ignores_history(self):
+        """Test history table headers do not override the billed consumption"""
+        layout = OCRLayout()
+        layout.add(1, 'Histórico de Consumo (kWh)', (100, 500, 500, 530), 0.9)
+        layout.add(1, 'Consumo Faturado Anterior 320', (100, 540, 500, 570), 0.9)
+        
+        result = self.parser.parse('Consumo: 150 kWh', layout=layout)
+        self.assertEqual(result['consumo_kwh'], 150.0)
+        
+        layout.add(1, 'Consumo Ativo', (100, 300, 300, 330), 0.9)
+        layout.add(1, '180', (320, 302, 400, 328), 0.9)
+        result = self.parser.parse('Conta de energia', layout=layout)
+        self.assertEqual(result['consumo_kwh'], 180.0)
+    
+    def test_single_pass_scan(self):
+        """Test overlapping labels, first-match semantics and readings in one sweep"""
+        text = """
+        Cliente 111 Número do Cliente: 222
+        Valor Total a Pagar R$ 1.234,56
+        Leitura Anterior: 1000 Leitura Atual: 1150
+        ICMS R$ 10,00 ICMS R$ 20,00
+        """
+        
+        result = self.parser.parse(text)
+        
+        self.assertEqual(result['numero_cliente'], '111')
+        self.assertEqual(result['valor_total'], 1234.56)
+        self.assertEqual(result['consumo_kwh'], 150.0)
+        self.assertEqual(result['impostos']['ICMS'], 10.0)
+    
     def test_parse_decimal_values(self):
         """Test parsing Brazilian decimal format"""
         self.assertEqual(self.parser._parse_decimal('1.234,56'), 1234.56)
@@ -114,6 +205,992 @@ class EnelParserTest(TestCase):
         self.assertIsNone(validated['periodo']['fim'])
 
 
+class ParserRegistryTest(TestCase):
+    """Test distributor parser selection"""
+    
+    def test_keyword_automaton(self):
+        """Test overlapping whole-word keywords are all found in one pass"""
+        automaton = KeywordAutomaton()
+        for keyword in ('enel', 'enel sp', 'he', 'she', 'hers'):
+            automaton.add(keyword, keyword)
+        
+        matches = [(start, value) for start, _, value in automaton.iter_matches('ushers SHE, ENEL SP')]
+        
+        self.assertEqual(matches, [(7, 'she'), (12, 'enel'), (12, 'enel sp')])
+    
+    def test_select_parser(self):
+        text = 'CPFL Paulista - Companhia Paulista de Força e Luz\nTotal a Pagar R$ 10,00'
+        parser = select_parser(text)
+        self.assertEqual(parser.distributor, 'CPFL')
+        self.assertEqual(parser.parse(text)['fornecedor'], 'CPFL')
+        
+        self.assertEqual(select_parser('CEMIG Distribuição S.A.').distributor, 'CEMIG')
+        self.assertEqual(select_parser('Conta de energia').distributor, 'Enel')
+        # Substrings are not keyword matches
+        self.assertEqual(select_parser('Highlight Copelandia').distributor, 'Enel')
+        # Ordinary words are not distributor names
+        self.assertEqual(select_parser('Light usage, light meter. CEMIG Distribuição S.A.').distributor, 'CEMIG')
+        self.assertEqual(select_parser('Faixa ampla de consumo - Light S.A.').distributor, 'Light')
+    
+    def test_get_parser(self):
+        self.assertIsInstance(get_parser('enel'), EnelParser)
+        self.assertEqual(get_parser('COPEL').distributor, 'COPEL')
+        self.assertIsNone(get_parser('Equatorial'))
+
+
+class OCREnginePoolTest(TestCase):
+    """Test process-resident OCR engine pool"""
+    
+    def test_engine_reused_until_task_limit(self):
+        """Test engine is reused across tasks and recycled after the limit"""
+        pool = OCREnginePool(max_tasks=2, max_memory_mb=0)
+        engine = Mock()
+        pool._processor = engine
+        
+        self.assertIs(pool.acquire(), engine)
+        pool.release()
+        self.assertTrue(pool.is_warm)
+        
+        self.assertIs(pool.acquire(), engine)
+        pool.release()
+        self.assertFalse(pool.is_warm)
+        engine.close.assert_called_once_with()
+    
+    def test_engine_recycled_over_memory_ceiling(self):
+        """Test engine is recycled when the process passes the memory ceiling"""
+        pool = OCREnginePool(max_tasks=0, max_memory_mb=1)
+        pool._processor = Mock()
+        
+        pool.acquire()
+        pool.release()
+        
+        self.assertFalse(pool.is_warm)
+    
+    def test_memory_recycle_stops_when_rss_stays_high(self):
+        """Test engines are not reloaded per bill when recycling frees no memory"""
+        pool = OCREnginePool(max_tasks=0, max_memory_mb=100)
+        with patch('apps.billing.ocr.pool._current_rss_mb', return_value=500):
+            pool._processor = Mock()
+            pool.acquire()
+            pool.release()
+            self.assertFalse(pool.is_warm)
+            
+            engine = Mock()
+            pool._processor = engine
+            pool.acquire()
+            pool.release()
+            self.assertTrue(pool.is_warm)
+
+
+@skipIf(ocr_processor is None, 'OCR engines not installed')
+class ParallelPageOCRTest(TestCase):
+    """Test pages spread over the page worker pool"""
+    
+    def setUp(self):
+        self.processor = ocr_processor.OCRProcessor(use_paddle=False, use_tesseract=False, page_workers=2)
+    
+    def tearDown(self):
+        ocr_processor.shutdown_page_executor()
+        ocr_processor._page_executor_disabled = False
+    
+    def _page(self, image, profile=None):
+        return ocr_processor.PageResult(f'page {image}', [], {})
+    
+    def test_pages_kept_in_order(self):
+        """Test results come back in page order whatever order workers finish in"""
+        def first_page_slowest(image, profile=None):
+            time.sleep(0.05 if image == 1 else 0)
+            return self._page(image)
+        
+        with ThreadPoolExecutor(max_workers=2) as executor, \
+                patch.object(ocr_processor, '_get_page_executor', return_value=executor), \
+                patch.object(ocr_processor, '_process_page_in_worker', side_effect=first_page_slowest):
+            pages = list(self.processor._process_pages_parallel(iter(range(1, 6))))
+        
+        self.assertEqual([page.text for page in pages], [f'page {n}' for n in range(1, 6)])
+    
+    def test_broken_pool_falls_back_to_sequential(self):
+        """Test a pool that fails on submit is dropped for good and pages are OCR'd in process"""
+        executor = Mock()
+        executor.submit.side_effect = BrokenProcessPool('worker died')
+        with patch.object(ocr_processor, 'ProcessPoolExecutor', return_value=executor) as pool_class, \
+                patch.object(self.processor, '_process_page', side_effect=self._page) as process_page:
+            pages = list(self.processor._process_pages_parallel(iter(range(1, 4))))
+            self.assertEqual([page.text for page in pages], ['page 1', 'page 2', 'page 3'])
+            self.assertEqual(process_page.call_count, 3)
+            
+            # Later bills do not try to start the pool again
+            pages = list(self.processor._process_pages_parallel(iter([4])))
+            self.assertEqual([page.text for page in pages], ['page 4'])
+        
+        self.assertEqual(pool_class.call_count, 1)
+    
+    def test_pool_workers_spawned(self):
+        """Test page workers are spawned, not forked after engines are loaded"""
+        with patch.object(ocr_processor, 'ProcessPoolExecutor') as pool_class:
+            ocr_processor._get_page_executor(2, self.processor._worker_kwargs())
+        self.assertEqual(pool_class.call_args.kwargs['mp_context'].get_start_method(), 'spawn')
+    
+    def test_daemonic_process_stays_sequential(self):
+        """Test a daemonic worker (Celery prefork child) OCRs pages in process without a pool"""
+        import multiprocessing
+        
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        child = context.Process(target=_parallel_pages_in_child, args=(results,), daemon=True)
+        child.start()
+        texts, disabled, pools_started = results.get(timeout=30)
+        child.join(timeout=30)
+        
+        self.assertEqual(texts, ['page 1', 'page 2', 'page 3'])
+        self.assertTrue(disabled)
+        self.assertEqual(pools_started, 0)
+
+
+def _parallel_pages_in_child(results):
+    """Run parallel page OCR in a daemonic process and report what happened"""
+    processor = ocr_processor.OCRProcessor(use_paddle=False, use_tesseract=False, page_workers=2)
+    with patch.object(processor, '_process_page',
+                      side_effect=lambda image, profile=None: ocr_processor.PageResult(f'page {image}', [], {})), \
+            patch.object(ocr_processor, 'ProcessPoolExecutor', wraps=ocr_processor.ProcessPoolExecutor) as pool_class:
+        pages = list(processor._process_pages_parallel(iter(range(1, 4))))
+    results.put(([page.text for page in pages], ocr_processor._page_executor_disabled, pool_class.call_count))
+
+
+@skipIf(ocr_processor is None, 'OCR engines not installed')
+class PageRenderingTest(TestCase):
+    """Test PDF pages are rendered lazily, one page per call"""
+    
+    def setUp(self):
+        self.processor = ocr_processor.OCRProcessor(use_paddle=False, use_tesseract=False)
+    
+    def _render(self, file_path, **kwargs):
+        return [Image.new('L', (10, 10), kwargs['first_page'])]
+    
+    def test_pages_rendered_on_demand(self):
+        """Test a page is only rendered when the consumer asks for it"""
+        with patch.object(ocr_processor, 'pdfinfo_from_path', return_value={'Pages': 3}), \
+                patch.object(ocr_processor, 'convert_from_path', side_effect=self._render) as convert:
+            images = self.processor._iter_images('bill.pdf')
+            first = next(images)
+            
+            self.assertEqual(convert.call_count, 1)
+            self.assertEqual(first.shape, (10, 10))
+            self.assertEqual(first[0, 0], 1)
+            kwargs = convert.call_args.kwargs
+            self.assertEqual((kwargs['first_page'], kwargs['last_page']), (1, 1))
+            self.assertTrue(kwargs['grayscale'])
+            
+            self.assertEqual([image[0, 0] for image in images], [2, 3])
+            self.assertEqual(convert.call_count, 3)
+    
+    def test_only_requested_pages_rendered(self):
+        """Test ``page_numbers`` limits rendering to those pages"""
+        with patch.object(ocr_processor, 'pdfinfo_from_path') as pdfinfo, \
+                patch.object(ocr_processor, 'convert_from_path', side_effect=self._render) as convert:
+            images = list(self.processor._iter_images('bill.pdf', [2, 4]))
+        
+        pdfinfo.assert_not_called()
+        self.assertEqual([image[0, 0] for image in images], [2, 4])
+        self.assertEqual([call.kwargs['first_page'] for call in convert.call_args_list], [2, 4])
+
+
+@skipIf(ocr_processor is None, 'OCR engines not installed')
+class TextLayerTest(TestCase):
+    """Test born-digital PDF pages are read from their text layer"""
+    
+    RICH_PAGE = 'Enel Distribuição São Paulo Número do Cliente 123456789 ' * 3
+    BARCODE = {'type': 'I25', 'data': '8' * 44, 'rect': {}}
+    
+    def setUp(self):
+        self.processor = ocr_processor.OCRProcessor(use_paddle=False, use_tesseract=False)
+    
+    def _render(self, file_path, **kwargs):
+        return [Image.new('L', (10, 10), kwargs['first_page'])]
+    
+    def test_text_layer_read_in_one_run(self):
+        """Test one pdftotext -bbox-layout run gives each page's text, in rows, and line boxes"""
+        def line(x, y, *words):
+            word_xml = ''.join(f'<word>{word}</word>' for word in words)
+            return f'<line xMin="{x}" yMin="{y}" xMax="{x + 50}" yMax="{y + 10}">{word_xml}</line>'
+        
+        output = (
+            f'<doc><page>{line(200, 101, "150")}{line(10, 100, "Consumo", "kWh")}{line(10, 130, "Total")}</page>'
+            f'<page>{line(10, 10, "p&#225;gina", "2")}</page></doc>'
+        )
+        with patch.object(ocr_processor.subprocess, 'run', return_value=Mock(stdout=output.encode())) as run:
+            pages = self.processor._extract_text_layer('bill.pdf')
+        
+        run.assert_called_once()
+        self.assertIn('-bbox-layout', run.call_args.args[0])
+        self.assertEqual([text for text, _ in pages], ['Consumo kWh  150\nTotal', 'página 2'])
+        layout = pages[0][1]
+        self.assertEqual(len(layout), 3)
+        
+        with patch.object(ocr_processor.subprocess, 'run', side_effect=OSError('pdftotext not found')):
+            self.assertEqual(self.processor._extract_text_layer('bill.pdf'), [])
+    
+    def test_usable_text_threshold(self):
+        """Test only pages with enough alphanumerics skip OCR"""
+        self.assertTrue(self.processor._has_usable_text(self.RICH_PAGE))
+        self.assertFalse(self.processor._has_usable_text('- - - 1 / 2 - - -' + ' ' * 200))
+    
+    def test_text_layer_pages_skip_ocr_but_keep_barcodes(self):
+        """Test rich pages skip OCR, sparse ones are OCR'd, and a text-layer boleto is decoded at low DPI"""
+        def decode(gray):
+            # The boleto sits on the text layer page
+            return [self.BARCODE] if gray[0, 0] == 1 else []
+        
+        ocr_page = ocr_processor.PageResult('página digitalizada', [], {'engine': 'paddle'})
+        text_layer = [(self.RICH_PAGE, OCRLayout()), ('scan', OCRLayout())]
+        with patch.object(ocr_processor, 'pdfinfo_from_path', return_value={'Pages': 2}), \
+                patch.object(self.processor, '_extract_text_layer', return_value=text_layer), \
+                patch.object(ocr_processor, 'convert_from_path', side_effect=self._render) as convert, \
+                patch.object(ocr_processor, 'decode_barcodes', side_effect=decode), \
+                patch.object(self.processor, '_process_page', return_value=ocr_page) as process_page:
+            result = self.processor.process_file('bill.pdf')
+        
+        self.assertTrue(result.success)
+        self.assertEqual(process_page.call_count, 1)
+        self.assertEqual(result.text, f'{self.RICH_PAGE.strip()}\npágina digitalizada')
+        self.assertEqual([page['source'] for page in result.pages], ['text_layer', 'ocr'])
+        self.assertEqual(result.barcodes, [self.BARCODE])
+        rendered = {call.kwargs['first_page']: call.kwargs['dpi'] for call in convert.call_args_list}
+        self.assertEqual(rendered, {1: self.processor.TEXT_LAYER_BARCODE_DPI, 2: self.processor.PDF_DPI})
+    
+    def test_payment_line_in_text_skips_rendering(self):
+        """Test a valid linha digitável in the text layer gives the boleto without rasterizing"""
+        barcode = '84670000001435900240200240500024384221010811'
+        page = f"{self.RICH_PAGE}\n{payment_line(barcode)}"
+        with patch.object(ocr_processor, 'pdfinfo_from_path', return_value={'Pages': 1}), \
+                patch.object(self.processor, '_extract_text_layer', return_value=[(page, OCRLayout())]), \
+                patch.object(ocr_processor, 'convert_from_path') as convert, \
+                patch.object(ocr_processor, 'decode_barcodes') as decode:
+            result = self.processor.process_file('bill.pdf')
+        
+        convert.assert_not_called()
+        decode.assert_not_called()
+        self.assertEqual([code['data'] for code in result.barcodes], [barcode])
+
+
+def payment_line(barcode):
+    """Printed linha digitável of a 44-digit collection barcode"""
+    from .ocr.boleto import _mod10
+    return ' '.join(f'{barcode[i:i + 11]}-{_mod10(barcode[i:i + 11])}' for i in range(0, 44, 11))
+
+
+@skipIf(ocr_processor is None, 'OCR engines not installed')
+class EngineCascadeTest(TestCase):
+    """Test Tesseract only runs where PaddleOCR is unsure"""
+    
+    BOX = [[0, 0], [100, 0], [100, 20], [0, 20]]
+    
+    def setUp(self):
+        self.processor = ocr_processor.OCRProcessor(use_paddle=False, use_tesseract=False)
+        self.processor.use_paddle = True
+        self.processor.use_tesseract = True
+        self.image = np.zeros((100, 100), dtype=np.uint8)
+    
+    def _cascade(self, lines):
+        with patch.object(self.processor, '_paddle_lines', return_value=lines), \
+                patch.object(self.processor, '_tesseract_text', return_value='tesseract page') as page, \
+                patch.object(self.processor, '_tesseract_region', return_value='tesseract line') as region:
+            text, meta = self.processor._extract_text_cascade(self.image)
+        return text, meta, page, region
+    
+    def test_confident_page_uses_paddle_only(self):
+        lines = [(self.BOX, 'Enel', 0.99), (self.BOX, 'Total a Pagar', 0.95), (self.BOX, '?', 0.3)]
+        text, meta, page, region = self._cascade(lines)
+        
+        self.assertEqual(text, 'Enel\nTotal a Pagar')
+        self.assertEqual(meta['engine'], 'paddle')
+        page.assert_not_called()
+        region.assert_not_called()
+    
+    def test_doubtful_lines_reread(self):
+        lines = [(self.BOX, 'Enel Distribuição', 0.99), (self.BOX, 'Vencimento', 0.98), (self.BOX, 'R$ l2,5O', 0.2)]
+        text, meta, page, region = self._cascade(lines)
+        
+        self.assertEqual(text, 'Enel Distribuição\nVencimento\ntesseract line')
+        self.assertEqual(meta['engine'], 'paddle+tesseract_regions')
+        self.assertEqual(meta['regions'], 1)
+        page.assert_not_called()
+        region.assert_called_once()
+    
+    def test_poor_page_read_by_tesseract(self):
+        lines = [(self.BOX, 'Enel', 0.99), (self.BOX, 'Vencim', 0.6), (self.BOX, 'R$', 0.5)]
+        text, meta, page, region = self._cascade(lines)
+        
+        self.assertEqual(text, 'tesseract page')
+        self.assertEqual(meta['engine'], 'tesseract')
+        region.assert_not_called()
+    
+    def test_paddle_failure_falls_back_to_tesseract(self):
+        text, meta, page, region = self._cascade(None)
+        
+        self.assertEqual(text, 'tesseract page')
+        self.assertEqual(meta, {'engine': 'tesseract', 'confidence': None})
+
+
+@skipIf(ocr_processor is None, 'OCR engines not installed')
+class TemplateOCRTest(TestCase):
+    """Test template region reads in a multi-page document"""
+    
+    def test_pages_outside_template_fully_ocrd(self):
+        processor = ocr_processor.OCRProcessor(use_paddle=False, use_tesseract=False, use_text_layer=False)
+        template_page = ocr_processor.PageResult('Total a Pagar: 125,50', [], {'source': 'template', 'fields': []})
+        full_page = ocr_processor.PageResult('Demonstrativo', [], {'engine': 'paddle'})
+        
+        with patch.object(ocr_processor, 'pdfinfo_from_path', return_value={'Pages': 2}), \
+                patch.object(processor, '_process_template', return_value={1: template_page}), \
+                patch.object(processor, '_iter_images', return_value=iter(['page 2'])) as iter_images, \
+                patch.object(processor, '_process_page', return_value=full_page):
+            result = processor.process_file('bill.pdf', template=SAMPLE_TEMPLATE)
+        
+        iter_images.assert_called_once_with('bill.pdf', [2])
+        self.assertEqual(result.text, 'Total a Pagar: 125,50\nDemonstrativo')
+        self.assertEqual([page['source'] for page in result.pages], ['template', 'ocr'])
+
+
+class PreprocessingProfileTest(TestCase):
+    """Test automatic preprocessing profile selection"""
+    
+    def setUp(self):
+        # Clean A4 page at 300 DPI with a few dark text-like bars
+        self.page = np.full((3508, 2480), 250, dtype=np.uint8)
+        for row in range(200, 3300, 120):
+            self.page[row:row + 20, 200:2200] = 20
+    
+    def test_clean_render_uses_digital_profile(self):
+        self.assertEqual(select_profile(self.page).name, 'digital')
+    
+    def test_noisy_scan_uses_scan_profile(self):
+        rng = np.random.default_rng(0)
+        noisy = np.clip(self.page + rng.normal(0, 8, self.page.shape), 0, 255).astype(np.uint8)
+        self.assertEqual(select_profile(noisy).name, 'scan')
+    
+    def test_uneven_lighting_uses_phone_photo_profile(self):
+        shading = np.linspace(0.4, 1.0, self.page.shape[1])[None, :]
+        shaded = (self.page * shading).astype(np.uint8)
+        self.assertEqual(select_profile(shaded).name, 'phone_photo')
+    
+    def test_skew_estimated_from_thumbnail(self):
+        """Test skew angle is recovered from a rotated page"""
+        import cv2
+        center = (self.page.shape[1] / 2, self.page.shape[0] / 2)
+        matrix = cv2.getRotationMatrix2D(center, 3.0, 1.0)
+        skewed = cv2.warpAffine(self.page, matrix, self.page.shape[::-1], borderValue=250)
+        
+        self.assertAlmostEqual(estimate_skew(skewed), -3.0, delta=0.3)
+        self.assertAlmostEqual(estimate_skew(self.page), 0.0, delta=0.3)
+
+
+class BoletoValidationTest(TestCase):
+    """Test boleto barcode check digits"""
+    
+    def test_bank_boleto(self):
+        self.assertTrue(is_valid_boleto_barcode('00193373700000001000500940144816060680935031'))
+        self.assertFalse(is_valid_boleto_barcode('00194373700000001000500940144816060680935031'))
+    
+    def test_collection_boleto(self):
+        """Test utility (arrecadação) barcodes, mod 10 and mod 11 variants"""
+        # Published samples, linha digitável without its block check digits:
+        # 84670000001-7 43590024020-9 02405000243-5 84221010811-9 (mod 10)
+        # 85890000460-9 52460179160-5 60759305086-5 83148300001-0 (mod 11)
+        for code in ('84670000001435900240200240500024384221010811',
+                     '85890000460524601791606075930508683148300001'):
+            self.assertTrue(is_valid_boleto_barcode(code))
+            wrong = code[:3] + str((int(code[3]) + 1) % 10) + code[4:]
+            self.assertFalse(is_valid_boleto_barcode(wrong))
+    
+    def test_rejects_malformed(self):
+        self.assertFalse(is_valid_boleto_barcode('123'))
+        self.assertFalse(is_valid_boleto_barcode('a' * 44))
+    
+    def test_payment_line_to_barcode(self):
+        """Test printed payment lines map back to their barcode, and garbled ones do not"""
+        from .ocr.boleto import barcode_from_payment_line, find_payment_line_barcode
+        
+        self.assertEqual(
+            barcode_from_payment_line('00190.50095 40144.816069 06809.350314 3 37370000000100'),
+            '00193373700000001000500940144816060680935031'
+        )
+        self.assertEqual(
+            find_payment_line_barcode('Código de barras:\n84670000001-7 43590024020-9 02405000243-5 84221010811-9'),
+            '84670000001435900240200240500024384221010811'
+        )
+        self.assertIsNone(find_payment_line_barcode('84670000001-7 43590024020-9 02405000243-5 84221010812-9'))
+        self.assertIsNone(find_payment_line_barcode('Total a Pagar R$ 125,50'))
+
+
+# Interleaved 2 of 5 bar/space widths per digit (n = narrow, w = wide)
+ITF_PATTERNS = ['nnwwn', 'wnnnw', 'nwnnw', 'wwnnn', 'nnwnw', 'wnwnn', 'nwwnn', 'nnnww', 'wnnwn', 'nwnwn']
+
+
+def draw_itf(page, code, x, y, height, narrow=3):
+    """Draw an ITF barcode on a white page; returns its right edge"""
+    widths = [narrow] * 4
+    for bars, spaces in zip(code[::2], code[1::2]):
+        for bar, space in zip(ITF_PATTERNS[int(bars)], ITF_PATTERNS[int(spaces)]):
+            widths += [narrow * (3 if bar == 'w' else 1), narrow * (3 if space == 'w' else 1)]
+    widths += [narrow * 3, narrow, narrow]
+    for i, width in enumerate(widths):
+        if i % 2 == 0:
+            page[y:y + height, x:x + width] = 0
+        x += width
+    return x
+
+
+@skipIf(ocr_barcodes is None, 'zbar not installed')
+class BarcodeRegionTest(TestCase):
+    """Test barcodes are decoded from located regions, not the whole page"""
+    
+    BOLETO = '84670000001435900240200240500024384221010811'
+    
+    def setUp(self):
+        # A4 at 300 DPI: text lines at the top, the boleto barcode at the foot
+        self.page = np.full((3508, 2480), 255, dtype=np.uint8)
+        for top in range(200, 1400, 60):
+            for left in range(150, 2200, 260):
+                self.page[top:top + 25, left:left + 200:6] = 0
+        self.right = draw_itf(self.page, self.BOLETO, 200, 3150, 150)
+    
+    def test_barcode_region_found(self):
+        regions = ocr_barcodes.find_barcode_regions(self.page)
+        
+        x, y, w, h = regions[0]
+        self.assertLessEqual(x, 200)
+        self.assertGreaterEqual(x + w, self.right)
+        self.assertLessEqual(y, 3150)
+        self.assertGreaterEqual(y + h, 3300)
+        self.assertLess(w * h, self.page.size / 10)
+    
+    def test_decode_stops_at_valid_boleto(self):
+        def decode(crop, symbols):
+            crops.append((crop.shape, symbols))
+            if symbols == ocr_barcodes.QR_SYMBOLS:
+                return [Mock(type='QRCODE', data=b'00020126pix', rect=Mock(left=0, top=0, width=9, height=9))]
+            return [Mock(type='I25', data=self.BOLETO.encode(), rect=Mock(left=5, top=7, width=9, height=9))]
+        
+        crops = []
+        with patch.object(ocr_barcodes.pyzbar, 'decode', side_effect=decode):
+            barcodes = ocr_barcodes.decode_barcodes(self.page)
+        
+        x, y, _, _ = ocr_barcodes.find_barcode_regions(self.page)[0]
+        self.assertEqual([barcode['type'] for barcode in barcodes], ['I25'])
+        self.assertEqual(barcodes[0]['data'], self.BOLETO)
+        self.assertEqual((barcodes[0]['rect']['x'], barcodes[0]['rect']['y']), (x + 5, y + 7))
+        # One region crop for the boleto and no page-wide QR pass
+        self.assertEqual(len(crops), 1)
+        self.assertLess(crops[0][0][0], self.page.shape[0] // 4)
+    
+    def test_qr_pass_only_without_boleto(self):
+        """Test a page with no valid boleto is scanned, downscaled, for a Pix QR code"""
+        def decode(crop, symbols):
+            crops.append((crop.shape, symbols))
+            if symbols == ocr_barcodes.QR_SYMBOLS:
+                return [Mock(type='QRCODE', data=b'00020126pix', rect=Mock(left=10, top=20, width=30, height=30))]
+            return []
+        
+        crops = []
+        with patch.object(ocr_barcodes.pyzbar, 'decode', side_effect=decode):
+            barcodes = ocr_barcodes.decode_barcodes(self.page)
+        
+        self.assertEqual([barcode['type'] for barcode in barcodes], ['QRCODE'])
+        self.assertEqual(barcodes[0]['rect'], {'x': 20, 'y': 40, 'width': 60, 'height': 60})
+        self.assertEqual(crops[-1], (
+            (self.page.shape[0] // ocr_barcodes.QR_SCALE, self.page.shape[1] // ocr_barcodes.QR_SCALE),
+            ocr_barcodes.QR_SYMBOLS
+        ))
+        self.assertEqual(sum(symbols == ocr_barcodes.QR_SYMBOLS for _, symbols in crops), 1)
+
+
+class OCRCacheTest(TestCase):
+    """Test content-addressed OCR result cache"""
+    
+    def test_cache_round_trip(self):
+        """Test cached OCR result is returned for the same file hash"""
+        self.assertIsNone(get_cached_result('a' * 64))
+        
+        store_result('a' * 64, OCRResult(
+            success=True,
+            text='Total a Pagar',
+            barcodes=[{'type': 'I25', 'data': '8' * 44}]
+        ))
+        
+        cached = get_cached_result('a' * 64)
+        self.assertEqual(cached.text, 'Total a Pagar')
+        self.assertEqual(cached.barcodes[0]['data'], '8' * 44)
+    
+    def test_stale_engine_versions_evicted(self):
+        """Test entries from other engine versions are evicted"""
+        OCRCacheEntry.objects.create(file_hash='b' * 64, engine_version='v0-old', text='old')
+        OCRCacheEntry.objects.create(file_hash='c' * 64, engine_version='v0-old', text='old')
+        
+        self.assertIsNone(get_cached_result('b' * 64))
+        store_result('b' * 64, OCRResult(success=True, text='new'))
+        self.assertEqual(OCRCacheEntry.objects.filter(file_hash='b' * 64).count(), 1)
+        
+        self.assertEqual(evict_stale_versions(), 1)
+        self.assertFalse(OCRCacheEntry.objects.filter(file_hash='c' * 64).exists())
+    
+    def test_profile_and_template_are_part_of_the_key(self):
+        """Test a result read with one profile or template is not served for another"""
+        template = SAMPLE_TEMPLATE
+        store_result('d' * 64, OCRResult(success=True, text='scan'), profile='scan', layout_hash='f' * 16)
+        store_result('d' * 64, OCRResult(success=True, text='template'), profile='scan', template=template)
+        
+        self.assertIsNone(get_cached_result('d' * 64))
+        self.assertIsNone(get_cached_result('d' * 64, profile='digital'))
+        self.assertEqual(get_cached_result('d' * 64, profile='scan').text, 'scan')
+        self.assertEqual(get_cached_result('d' * 64, profile='scan', template=template).text, 'template')
+        self.assertEqual(evict_stale_versions(), 0)
+        
+        from .ocr.cache import cached_layout_hash
+        self.assertEqual(cached_layout_hash('d' * 64), 'f' * 16)
+    
+    def test_version_follows_template_regions(self):
+        """Test re-measured template regions invalidate cached reads"""
+        from dataclasses import replace
+        from .ocr.cache import current_engine_version
+        
+        template = SAMPLE_TEMPLATE
+        moved = replace(template.regions[0], box=(0.50, 0.08, 1.00, 0.16))
+        remeasured = replace(template, regions=(moved,) + template.regions[1:])
+        
+        self.assertNotEqual(current_engine_version(template=remeasured), current_engine_version(template=template))
+        self.assertTrue(current_engine_version(template=template).startswith(current_engine_version()))
+
+
+class LayoutTemplateTest(TestCase):
+    """Test layout template registry and page registration"""
+    
+    def test_no_template_ships_built_in(self):
+        self.assertIsNone(get_template('Enel'))
+    
+    def test_registered_template_found(self):
+        with patch.dict(ocr_templates._REGISTRY, clear=True):
+            template = ocr_templates.register_template(SAMPLE_TEMPLATE)
+            self.assertEqual(template.key, 'Enel:v1')
+            self.assertIs(get_template('Enel'), template)
+            self.assertIs(get_template('Enel', 'v1'), template)
+            self.assertIsNone(get_template('Enel', 'v0'))
+    
+    def test_regions_follow_printed_area(self):
+        """Test regions map onto the printed area, not the raw page"""
+        page = np.full((1000, 800), 255, dtype=np.uint8)
+        page[100:900, 200:600] = 0
+        bounds = content_bounds(page, margin=0)
+        for actual, expected in zip(bounds, (200, 100, 600, 900)):
+            self.assertAlmostEqual(actual, expected, delta=3)
+        
+        region = SAMPLE_TEMPLATE.regions[0]
+        x0, y0, x1, y1 = region_pixels(region, (200, 100, 600, 900))
+        self.assertEqual((x0, x1), (200 + int(region.box[0] * 400), 200 + int(region.box[2] * 400)))
+        self.assertEqual((y0, y1), (100 + int(region.box[1] * 800), 100 + int(region.box[3] * 800)))
+
+
+class LayoutFingerprintTest(TestCase):
+    """Test pre-OCR layout identification"""
+    
+    def setUp(self):
+        import cv2
+        self.tmpdir = tempfile.mkdtemp()
+        rng = np.random.default_rng(3)
+        self.page = np.full((1600, 1200), 255, dtype=np.uint8)
+        for _ in range(12):
+            x, y = int(rng.integers(100, 1000)), int(rng.integers(100, 400))
+            self.page[y:y + 40, x:x + int(rng.integers(40, 150))] = 0
+        self.page[500:1500, 100:1100:7] = 0
+        self.path = os.path.join(self.tmpdir, 'enel.png')
+        cv2.imwrite(self.path, self.page)
+    
+    def test_hash_ignores_margins(self):
+        """Test the same layout shifted on the page hashes (nearly) the same"""
+        shifted = np.full_like(self.page, 255)
+        shifted[40:, 30:] = self.page[:-40, :-30]
+        self.assertLessEqual(hamming_distance(layout_hash(self.page), layout_hash(shifted)), 4)
+    
+    def test_identify_registered_layout(self):
+        """Test a registered layout is recognized and unknown layouts are not"""
+        from django.core.management import call_command
+        from io import StringIO
+        
+        match = identify_layout(self.path)
+        self.assertFalse(match.known)
+        
+        with patch.dict(ocr_templates._REGISTRY, {'Enel': {'v1': SAMPLE_TEMPLATE}}):
+            call_command('register_layout', self.path, distributor='Enel', template_version='v1',
+                         profile='scan', stdout=StringIO())
+        self.assertEqual(LayoutFingerprint.objects.count(), 1)
+        
+        match = identify_layout(self.path)
+        self.assertTrue(match.known)
+        self.assertEqual(match.distributor, 'Enel')
+        self.assertEqual(match.preprocessing_profile, 'scan')
+        self.assertEqual(match.distance, 0)
+    
+    def test_unknown_layouts_not_cached(self):
+        """Test a layout registered by another process is found without invalidation"""
+        from .ocr.fingerprint import lookup_layout
+        
+        self.assertFalse(lookup_layout('3c' * 8).known)
+        # bulk_create skips save(), like a registration this process never saw
+        LayoutFingerprint.objects.bulk_create([LayoutFingerprint(layout_hash='3c' * 8, distributor='Enel')])
+        self.assertEqual(lookup_layout('3c' * 8).distributor, 'Enel')
+
+
+class ReparseTest(TestCase):
+    """Test bulk re-parse of stored OCR output"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='reparse@example.com',
+            username='reparseuser',
+            password=os.environ.get('TEST_PASSWORD', 'temp_test_pass')
+        )
+    
+    def test_stale_bills_reparsed(self):
+        """Test stale bills get parsed fields and the current parser version"""
+        from .parsers import PARSER_VERSION
+        from .reparse import reparse_stale_bills
+        
+        text = "Enel Distribuição São Paulo\nNúmero do Cliente: 123456789\nVencimento: 25/02/2024\nValor Total: R$ 125,50"
+        stale = Bill.objects.create(user=self.user, status=Bill.Status.PROCESSED, file_hash='a' * 64,
+                                    ocr_text=text)
+        from_cache = Bill.objects.create(user=self.user, status=Bill.Status.PROCESSED, file_hash='d' * 64)
+        OCRCacheEntry.objects.create(file_hash='d' * 64, engine_version='v1', text=text)
+        missing = Bill.objects.create(user=self.user, status=Bill.Status.PROCESSED, file_hash='e' * 64)
+        current = Bill.objects.create(user=self.user, status=Bill.Status.PROCESSED, file_hash='f' * 64,
+                                      ocr_text=text, parser_version=PARSER_VERSION)
+        
+        stats = reparse_stale_bills(chunk_size=1, workers=1)
+        self.assertEqual(stats, {'reparsed': 2, 'failed': 0, 'skipped': 1, 'changed': 0})
+        
+        for bill in (stale, from_cache):
+            bill.refresh_from_db()
+            self.assertEqual(bill.parser_version, PARSER_VERSION)
+            self.assertEqual(bill.numero_cliente, '123456789')
+            self.assertEqual(bill.valor_total, Decimal('125.50'))
+            self.assertEqual(bill.parsed_json['vencimento'], '2024-02-25')
+        missing.refresh_from_db()
+        self.assertEqual(missing.parser_version, 0)
+        current.refresh_from_db()
+        self.assertIsNone(current.valor_total)
+    
+    def test_reparse_keeps_layout_hash(self):
+        """Test repeated re-parses keep the layout hash and clear fields no longer found"""
+        from .reparse import reparse_stale_bills
+        
+        LayoutFingerprint.objects.create(layout_hash='0f' * 8, distributor='Enel')
+        text = "Fatura de energia\nNúmero do Cliente: 123456789\nValor Total: R$ 125,50"
+        bill = Bill.objects.create(user=self.user, status=Bill.Status.PROCESSED, file_hash='a' * 64,
+                                   ocr_text=text, parsed_json={'layout_hash': '0f' * 8},
+                                   instalacao='OLD', consumo_kwh=Decimal('999'))
+        
+        for _ in range(2):
+            Bill.objects.filter(id=bill.id).update(parser_version=0)
+            self.assertEqual(reparse_stale_bills(workers=1)['reparsed'], 1)
+            bill.refresh_from_db()
+            self.assertEqual(bill.parsed_json['layout_hash'], '0f' * 8)
+            self.assertEqual(bill.parsed_json['fornecedor'], 'Enel')
+        
+        self.assertEqual(bill.numero_cliente, '123456789')
+        self.assertEqual(bill.instalacao, '')
+        self.assertIsNone(bill.consumo_kwh)
+    
+    def test_bill_changed_during_parse_left_alone(self):
+        """Test a bill reprocessed between read and write-back is not overwritten"""
+        from . import reparse
+        
+        text = "Enel Distribuição São Paulo\nNúmero do Cliente: 123456789\nValor Total: R$ 125,50"
+        bill = Bill.objects.create(user=self.user, status=Bill.Status.PROCESSED, file_hash='a' * 64,
+                                   ocr_text=text)
+        parse = reparse.parse_stored_ocr
+        
+        def reprocessed_meanwhile(job):
+            # Reprocessed by the pipeline, still PROCESSED but with fresh results
+            Bill.objects.filter(id=bill.id).update(numero_cliente='987654321', updated_at=timezone.now())
+            return parse(job)
+        
+        with patch.object(reparse, 'parse_stored_ocr', side_effect=reprocessed_meanwhile):
+            stats = reparse.reparse_stale_bills(workers=1)
+        
+        self.assertEqual(stats, {'reparsed': 0, 'failed': 0, 'skipped': 0, 'changed': 1})
+        bill.refresh_from_db()
+        self.assertEqual(bill.parser_version, 0)
+        self.assertEqual(bill.numero_cliente, '987654321')
+
+
+class FakeRedis:
+    """In-memory stand-in for the Redis commands the bulk scheduler uses"""
+    
+    def __init__(self):
+        self.lists, self.sets, self.zsets = {}, {}, {}
+    
+    def lock(self, name, **kwargs):
+        from contextlib import nullcontext
+        return nullcontext()
+    
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(str(value).encode() for value in values)
+    
+    def lpush(self, key, *values):
+        self.lists[key] = [str(value).encode() for value in reversed(values)] + self.lists.get(key, [])
+    
+    def lpop(self, key):
+        items = self.lists.get(key)
+        return items.pop(0) if items else None
+    
+    def lmove(self, source, destination, where_from, where_to):
+        value = self.lpop(source)
+        if value is not None:
+            self.rpush(destination, value.decode())
+        return value
+    
+    def lrem(self, key, count, value):
+        self.lists[key] = [item for item in self.lists.get(key, []) if item != str(value).encode()]
+    
+    def lpos(self, key, value):
+        items = self.lists.get(key, [])
+        return items.index(str(value).encode()) if str(value).encode() in items else None
+    
+    def sadd(self, key, value):
+        members = self.sets.setdefault(key, set())
+        added = value not in members
+        members.add(value)
+        return int(added)
+    
+    def srem(self, key, value):
+        self.sets.get(key, set()).discard(value)
+    
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+    
+    def zrem(self, key, value):
+        self.zsets.get(key, {}).pop(value, None)
+    
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+    
+    def zscore(self, key, value):
+        return self.zsets.get(key, {}).get(value)
+    
+    def zremrangebyscore(self, key, low, high):
+        zset = self.zsets.get(key, {})
+        for member in [member for member, score in zset.items() if low <= score <= high]:
+            del zset[member]
+
+
+@override_settings(BULK_MAX_IN_FLIGHT=2)
+class FairSchedulingTest(TestCase):
+    """Test round-robin dispatch of bulk bills across users"""
+    
+    def test_users_served_round_robin(self):
+        from .scheduling import QUEUE_BULK, bulk_task_finished, enqueue_bulk
+        
+        sent = []
+        with patch('apps.billing.scheduling.get_redis', return_value=FakeRedis()), \
+                patch('apps.billing.tasks.process_bill_task.apply_async',
+                      side_effect=lambda args, kwargs, queue: sent.append((args[0], queue))):
+            # A big batch first, then a small one from another user
+            enqueue_bulk(1, range(100, 110))
+            enqueue_bulk(2, [200, 201])
+            self.assertEqual([bill_id for bill_id, _ in sent], [100, 101])
+            
+            for bill_id in (100, 101, 200, 102):
+                bulk_task_finished(bill_id)
+        
+        self.assertEqual([bill_id for bill_id, _ in sent], [100, 101, 200, 102, 201, 103])
+        self.assertTrue(all(queue == QUEUE_BULK for _, queue in sent))
+    
+    def test_dispatch_failure_after_queueing(self):
+        """Test bills already queued in Redis are not also sent directly when dispatch fails"""
+        from .scheduling import dispatch_bulk, enqueue_bulk
+        
+        redis = FakeRedis()
+        sent = []
+        with patch('apps.billing.scheduling.get_redis', return_value=redis), \
+                patch('apps.billing.tasks.process_bill_task.apply_async',
+                      side_effect=lambda args, kwargs, queue: sent.append(args[0])):
+            with patch.object(FakeRedis, 'zcard', side_effect=ConnectionError):
+                enqueue_bulk(1, [100, 101])
+            self.assertEqual(sent, [])
+            
+            dispatch_bulk()
+        self.assertEqual(sent, [100, 101])
+    
+    def test_send_failure_requeues_bill(self):
+        """Test a bill whose send fails goes back to the head of its queue without holding a slot"""
+        from .scheduling import _IN_FLIGHT, _user_queue, dispatch_bulk, enqueue_bulk
+        
+        redis = FakeRedis()
+        with patch('apps.billing.scheduling.get_redis', return_value=redis), \
+                patch('apps.billing.scheduling._send_bulk', side_effect=ConnectionError) as send:
+            enqueue_bulk(1, [100, 101])
+        
+        send.assert_called_once_with(100)
+        self.assertEqual(redis.lists[_user_queue(1)], [b'100', b'101'])
+        self.assertEqual(redis.zcard(_IN_FLIGHT), 0)
+        
+        sent = []
+        with patch('apps.billing.scheduling.get_redis', return_value=redis), \
+                patch('apps.billing.scheduling._send_bulk', side_effect=sent.append):
+            dispatch_bulk()
+        self.assertEqual(sent, [100, 101])
+    
+    def test_retry_keeps_bulk_slot(self):
+        """Test a bulk task holds its in-flight slot across retries and frees it once"""
+        from .tasks import process_bill_task
+        
+        user = User.objects.create_user(
+            email='bulk@example.com',
+            username='bulkuser',
+            password=os.environ.get('TEST_PASSWORD', 'temp_test_pass')
+        )
+        bill = Bill.objects.create(user=user, file_hash='a' * 64)
+        
+        with patch('apps.billing.tasks.cached_layout_hash', side_effect=RuntimeError('OCR down')), \
+                patch('apps.billing.tasks.bulk_task_retrying') as retrying, \
+                patch('apps.billing.tasks.bulk_task_finished') as finished:
+            process_bill_task.apply((bill.id,), {'bulk': True})
+        
+        self.assertEqual(retrying.call_count, process_bill_task.max_retries)
+        finished.assert_called_once_with(bill.id)
+        bill.refresh_from_db()
+        self.assertEqual(bill.status, Bill.Status.FAILED)
+
+
+class ProcessingClaimTest(TestCase):
+    """Test bills are claimed by exactly one processing run"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='claim@example.com',
+            username='claimuser',
+            password=os.environ.get('TEST_PASSWORD', 'temp_test_pass')
+        )
+    
+    def test_bill_claimed_once(self):
+        from .tasks import claim_bill
+        
+        bill = Bill.objects.create(user=self.user, file_hash='a' * 64)
+        token = claim_bill(bill.id)
+        self.assertIsNotNone(token)
+        self.assertIsNone(claim_bill(bill.id))
+        
+        bill.refresh_from_db()
+        self.assertEqual(bill.status, Bill.Status.PROCESSING)
+        self.assertEqual(bill.processing_token, token)
+        self.assertEqual(bill.processing_attempts, 1)
+    
+    @override_settings(BILL_PROCESSING_LEASE_SECONDS=60)
+    def test_stale_claim_taken_over(self):
+        from .tasks import _save_claimed, claim_bill
+        
+        bill = Bill.objects.create(user=self.user, file_hash='a' * 64)
+        token = claim_bill(bill.id)
+        Bill.objects.filter(id=bill.id).update(processing_started_at=timezone.now() - timedelta(minutes=5))
+        self.assertIsNotNone(claim_bill(bill.id))
+        
+        # The first run's late result is discarded
+        bill.status = Bill.Status.PROCESSED
+        self.assertFalse(_save_claimed(bill, token, ['status']))
+        bill.refresh_from_db()
+        self.assertEqual(bill.status, Bill.Status.PROCESSING)
+        self.assertEqual(bill.processing_attempts, 2)
+    
+    def test_duplicate_delivery_is_noop(self):
+        from .tasks import process_bill_task
+        
+        bill = Bill.objects.create(user=self.user, file_hash='a' * 64, status=Bill.Status.PROCESSED)
+        with patch('apps.billing.tasks.identify_layout') as identify:
+            process_bill_task.run(bill.id)
+        identify.assert_not_called()
+        bill.refresh_from_db()
+        self.assertEqual(bill.status, Bill.Status.PROCESSED)
+        self.assertEqual(bill.processing_attempts, 0)
+    
+    def test_failure_of_deleted_bill_not_published(self):
+        """Test a bill deleted while its failure is recorded ends the task quietly"""
+        from . import tasks
+        
+        bill = Bill.objects.create(user=self.user, file_hash='a' * 64)
+        save_claimed = tasks._save_claimed
+        
+        def deleted_after_save(*args):
+            saved = save_claimed(*args)
+            Bill.objects.filter(id=bill.id).delete()
+            return saved
+        
+        with patch('apps.billing.tasks.cached_layout_hash', side_effect=RuntimeError('OCR down')), \
+                patch('apps.billing.tasks._save_claimed', side_effect=deleted_after_save), \
+                patch('apps.billing.tasks.publish_status') as publish:
+            result = tasks.process_bill_task.apply((bill.id,), retries=tasks.process_bill_task.max_retries)
+        
+        self.assertTrue(result.successful())
+        self.assertEqual([call[0][0].status for call in publish.call_args_list], [Bill.Status.PROCESSING])
+
+
+class ProcessBillCacheTest(TestCase):
+    """Test bill processing looks the OCR cache up before any rendering"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='cache@example.com',
+            username='cacheuser',
+            password=os.environ.get('TEST_PASSWORD', 'temp_test_pass')
+        )
+        LayoutFingerprint.objects.create(layout_hash='f' * 16, distributor='Enel', preprocessing_profile='scan')
+    
+    def test_cache_hit_needs_no_render(self):
+        from .tasks import process_bill_task
+        
+        text = "Enel Distribuição São Paulo\nNúmero do Cliente: 123456789\nValor Total: R$ 125,50"
+        store_result('a' * 64, OCRResult(success=True, text=text), profile='scan', layout_hash='f' * 16)
+        bill = Bill.objects.create(user=self.user, file_hash='a' * 64)
+        
+        with patch('apps.billing.tasks.identify_layout') as identify, \
+                patch('apps.billing.tasks.ocr_engine') as engine, \
+                patch('apps.analytics.tasks.create_metric_snapshot_task.delay'):
+            process_bill_task.run(bill.id)
+        
+        identify.assert_not_called()
+        engine.assert_not_called()
+        bill.refresh_from_db()
+        self.assertEqual(bill.status, Bill.Status.PROCESSED)
+        self.assertEqual(bill.numero_cliente, '123456789')
+        self.assertEqual(bill.parsed_json['layout_hash'], 'f' * 16)
+    
+    def test_result_cached_under_fingerprint_profile(self):
+        from .ocr.fingerprint import LayoutMatch
+        from .tasks import process_bill_task
+        
+        bill = Bill.objects.create(user=self.user, file_hash='b' * 64)
+        match = LayoutMatch(layout_hash='f' * 16, distributor='Enel', preprocessing_profile='scan')
+        with patch('apps.billing.tasks.identify_layout', return_value=match), \
+                patch('apps.billing.tasks.ocr_engine') as engine, \
+                patch('apps.analytics.tasks.create_metric_snapshot_task.delay'):
+            processor = engine.return_value.__enter__.return_value
+            processor.process_file.return_value = OCRResult(success=True, text='Enel Valor Total: R$ 10,00')
+            process_bill_task.run(bill.id)
+        
+        self.assertEqual(processor.process_file.call_args.kwargs['profile'], 'scan')
+        self.assertIsNone(get_cached_result('b' * 64))
+        self.assertEqual(get_cached_result('b' * 64, profile='scan').text, 'Enel Valor Total: R$ 10,00')
+
+
+class PeriodicTaskTest(TestCase):
+    """Test the beat schedule points at registered tasks"""
+    
+    def test_scheduled_tasks_registered(self):
+        from config.celery import app
+        from . import tasks  # noqa: F401
+        
+        for name, entry in settings.CELERY_BEAT_SCHEDULE.items():
+            self.assertIn(entry['task'], app.tasks, name)
+
+
 class BillAPITest(APITestCase):
     """Test Bill API endpoints"""
     
@@ -135,18 +1212,423 @@ class BillAPITest(APITestCase):
             content_type='application/pdf'
         )
         
-        response = self.client.post('/api/bills/upload/', {
-            'raw_file': uploaded_file
-        }, format='multipart')
+        with patch('apps.billing.views.enqueue_interactive') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/bills/upload/', {
+                    'raw_file': uploaded_file
+                }, format='multipart')
         
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         self.assertIn('bill_id', response.data)
+        self.assertTrue(response.data['status_url'].endswith(f"/api/bills/{response.data['bill_id']}/status/"))
+        delay.assert_called_once_with(response.data['bill_id'])
         
-        # Check bill was created
+        # Check bill was created and left for the worker
         bill = Bill.objects.get(id=response.data['bill_id'])
         self.assertEqual(bill.user, self.user)
         self.assertEqual(bill.status, Bill.Status.UPLOADED)
     
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=16)
+    def test_upload_hashed_while_streaming(self):
+        """Test the content hash comes from the upload handler for memory and disk uploads"""
+        for name, content in (('small.pdf', b'%PDF-1.4 tiny'), ('large.pdf', b'%PDF-1.4 ' + b'x' * 200000)):
+            with patch('apps.billing.views.enqueue_interactive'), \
+                    patch('apps.billing.uploads.hashlib.sha256', wraps=hashlib.sha256) as sha256:
+                response = self.client.post('/api/bills/upload/', {
+                    'raw_file': SimpleUploadedFile(name, content, content_type='application/pdf')
+                }, format='multipart')
+            
+            bill = Bill.objects.get(id=response.data['bill_id'])
+            self.assertEqual(bill.file_hash, hashlib.sha256(content).hexdigest())
+            self.assertTrue(bill.raw_file.name.startswith(f'bills/{self.user.id}/{bill.file_hash[:16]}_'))
+            # One hasher per handler that saw the file, none re-reading it on save
+            self.assertLessEqual(sha256.call_count, 2)
+    
+    def test_duplicate_upload_returns_existing_bill(self):
+        """Test re-uploading the same content returns the existing bill without storing or queueing"""
+        content = b'%PDF-1.4 same bill'
+        with patch('apps.billing.views.enqueue_interactive') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                first = self.client.post('/api/bills/upload/', {
+                    'raw_file': SimpleUploadedFile('a.pdf', content, content_type='application/pdf')
+                }, format='multipart')
+            with patch('django.core.files.storage.FileSystemStorage.save') as storage_save:
+                with self.captureOnCommitCallbacks(execute=True):
+                    second = self.client.post('/api/bills/upload/', {
+                        'raw_file': SimpleUploadedFile('b.pdf', content, content_type='application/pdf')
+                    }, format='multipart')
+        
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data['bill_id'], first.data['bill_id'])
+        storage_save.assert_not_called()
+        self.assertEqual(delay.call_count, 1)
+        self.assertEqual(Bill.objects.filter(user=self.user).count(), 1)
+    
+    def test_duplicate_upload_requeues_failed_bill(self):
+        """Test re-uploading a failed bill queues it again instead of returning the failure"""
+        content = b'%PDF-1.4 failed bill'
+        bill = Bill.objects.create(user=self.user, file_hash=hashlib.sha256(content).hexdigest(),
+                                   status=Bill.Status.FAILED, error_message='OCR failed')
+        
+        with patch('apps.billing.views.enqueue_interactive') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/bills/upload/', {
+                'raw_file': SimpleUploadedFile('a.pdf', content, content_type='application/pdf')
+            }, format='multipart')
+        
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['bill_id'], bill.id)
+        delay.assert_called_once_with(bill.id)
+        bill.refresh_from_db()
+        self.assertEqual(bill.status, Bill.Status.UPLOADED)
+        self.assertEqual(bill.error_message, '')
+    
+    def test_duplicate_upload_leaves_bulk_bills_queued(self):
+        """Test stale uploads waiting on the bulk lane are not queued interactively as well"""
+        from .scheduling import enqueue_bulk
+        
+        redis = FakeRedis()
+        stale = timezone.now() - timedelta(seconds=settings.BILL_PROCESSING_LEASE_SECONDS + 1)
+        batch = BillBatch.objects.create(user=self.user)
+        in_batch = Bill.objects.create(user=self.user, batch=batch, file_hash=hashlib.sha256(b'batch').hexdigest())
+        queued = Bill.objects.create(user=self.user, file_hash=hashlib.sha256(b'queued').hexdigest())
+        lost = Bill.objects.create(user=self.user, file_hash=hashlib.sha256(b'lost').hexdigest())
+        Bill.objects.update(updated_at=stale)
+        with patch('apps.billing.scheduling.get_redis', return_value=redis), \
+                override_settings(BULK_MAX_IN_FLIGHT=0):
+            enqueue_bulk(self.user.id, [queued.id])
+        
+        for content, expected in ((b'batch', 200), (b'queued', 200), (b'lost', 202)):
+            with patch('apps.billing.scheduling.get_redis', return_value=redis), \
+                    patch('apps.billing.views.enqueue_interactive') as delay, \
+                    self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/bills/upload/', {
+                    'raw_file': SimpleUploadedFile('a.pdf', content, content_type='application/pdf')
+                }, format='multipart')
+            self.assertEqual(response.status_code, expected)
+            self.assertEqual(delay.call_count, int(expected == 202))
+        delay.assert_called_once_with(lost.id)
+        self.assertEqual(Bill.objects.get(id=in_batch.id).updated_at, stale)
+    
+    def test_upload_race_deletes_stored_file(self):
+        """Test the upload losing a same-file race removes the file it stored"""
+        content = b'%PDF-1.4 raced bill'
+        bill = Bill.objects.create(user=self.user, file_hash=hashlib.sha256(content).hexdigest())
+        
+        # The duplicate check misses the bill the concurrent upload is inserting
+        with patch('django.db.models.query.QuerySet.first', return_value=None), \
+                patch('django.core.files.storage.FileSystemStorage.delete') as delete, \
+                patch('apps.billing.views.enqueue_interactive') as delay:
+            response = self.client.post('/api/bills/upload/', {
+                'raw_file': SimpleUploadedFile('a.pdf', content, content_type='application/pdf')
+            }, format='multipart')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['bill_id'], bill.id)
+        delete.assert_called_once()
+        self.assertTrue(delete.call_args[0][0].startswith(f'bills/{self.user.id}/{bill.file_hash[:16]}_'))
+        delay.assert_not_called()
+    
+    def test_duplicate_upload_across_users(self):
+        """Test another user's processed result is reused only when the policy allows it"""
+        content = b'%PDF-1.4 shared bill'
+        owner = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password=os.environ.get('TEST_PASSWORD', 'temp_test_pass')
+        )
+        source = Bill.objects.create(
+            user=owner,
+            raw_file=SimpleUploadedFile('shared.pdf', content, content_type='application/pdf'),
+            status=Bill.Status.PROCESSED,
+            ocr_text='Enel',
+            fornecedor='Enel',
+            valor_total=Decimal('99.90')
+        )
+        
+        with patch('apps.billing.views.enqueue_interactive') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/bills/upload/', {
+                    'raw_file': SimpleUploadedFile('mine.pdf', content, content_type='application/pdf')
+                }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        delay.assert_called_once()
+        Bill.objects.filter(user=self.user).delete()
+        
+        with override_settings(BILL_DEDUP_ACROSS_USERS=True), \
+                patch('apps.billing.views.enqueue_interactive') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/bills/upload/', {
+                    'raw_file': SimpleUploadedFile('mine.pdf', content, content_type='application/pdf')
+                }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], Bill.Status.PROCESSED)
+        delay.assert_not_called()
+        
+        bill = Bill.objects.get(id=response.data['bill_id'])
+        self.assertEqual(bill.user, self.user)
+        self.assertEqual(bill.raw_file.name, source.raw_file.name)
+        self.assertEqual(bill.valor_total, Decimal('99.90'))
+        self.assertEqual(bill.ocr_text, 'Enel')
+    
+    @override_settings(BILL_DEDUP_ACROSS_USERS=True)
+    def test_duplicate_upload_across_users_race(self):
+        """Test losing a same-user race while copying another user's result returns the winner"""
+        content = b'%PDF-1.4 shared raced bill'
+        file_hash = hashlib.sha256(content).hexdigest()
+        owner = User.objects.create_user(
+            email='owner@example.com',
+            username='owner',
+            password=os.environ.get('TEST_PASSWORD', 'temp_test_pass')
+        )
+        source = Bill.objects.create(user=owner, file_hash=file_hash, status=Bill.Status.PROCESSED)
+        winner = Bill.objects.create(user=self.user, file_hash=file_hash, status=Bill.Status.PROCESSED)
+        
+        # The duplicate check misses the bill the concurrent upload is inserting
+        with patch('django.db.models.query.QuerySet.first', side_effect=[None, source]):
+            response = self.client.post('/api/bills/upload/', {
+                'raw_file': SimpleUploadedFile('mine.pdf', content, content_type='application/pdf')
+            }, format='multipart')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['bill_id'], winner.id)
+        self.assertEqual(Bill.objects.filter(user=self.user).count(), 1)
+    
+    def test_batch_upload(self):
+        """Test files and zip members become one batch queued on the bulk lane"""
+        import io
+        import zipfile
+        
+        existing = Bill.objects.create(user=self.user, file_hash=hashlib.sha256(b'%PDF-1.4 old').hexdigest())
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('2023/jan.pdf', b'%PDF-1.4 jan')
+            zf.writestr('2023/fev.pdf', b'%PDF-1.4 fev')
+            zf.writestr('2023/copia.pdf', b'%PDF-1.4 jan')
+            zf.writestr('2023/old.pdf', b'%PDF-1.4 old')
+            zf.writestr('2023/notas.txt', b'texto')
+        
+        with patch('apps.billing.views.enqueue_bulk') as enqueue_bulk, \
+                patch('django.db.models.fields.files.FieldFile.save', autospec=True,
+                      side_effect=FieldFile.save) as file_save:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/bills/batches/', {
+                    'files': [
+                        SimpleUploadedFile('historico.zip', archive.getvalue(), content_type='application/zip'),
+                        SimpleUploadedFile('mar.pdf', b'%PDF-1.4 mar', content_type='application/pdf'),
+                    ]
+                }, format='multipart')
+        
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        # Duplicates are recognized before anything is written
+        self.assertEqual([call.args[1] for call in file_save.call_args_list], ['jan.pdf', 'fev.pdf', 'mar.pdf'])
+        self.assertEqual(sorted(bill['name'] for bill in response.data['bills']), ['fev.pdf', 'jan.pdf', 'mar.pdf'])
+        duplicates = {duplicate['name']: duplicate['bill_id'] for duplicate in response.data['duplicates']}
+        jan = next(bill['bill_id'] for bill in response.data['bills'] if bill['name'] == 'jan.pdf')
+        self.assertEqual(duplicates, {'copia.pdf': jan, 'old.pdf': existing.id})
+        self.assertEqual(response.data['skipped'], [{'name': 'notas.txt', 'reason': 'formato não suportado'}])
+        enqueue_bulk.assert_called_once_with(self.user.id, [bill['bill_id'] for bill in response.data['bills']])
+        
+        bill = Bill.objects.get(id=jan)
+        self.assertEqual(bill.batch_id, response.data['batch_id'])
+        self.assertEqual(bill.file_hash, hashlib.sha256(b'%PDF-1.4 jan').hexdigest())
+        self.assertEqual(bill.raw_file.read(), b'%PDF-1.4 jan')
+        
+        Bill.objects.filter(id=jan).update(status=Bill.Status.PROCESSED)
+        response = self.client.get(f"/api/bills/batches/{response.data['batch_id']}/")
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(response.data['counts'][Bill.Status.PROCESSED], 1)
+        self.assertEqual(response.data['counts'][Bill.Status.UPLOADED], 2)
+        self.assertFalse(response.data['finished'])
+    
+    @override_settings(BILL_BATCH_MAX_FILE_SIZE=1024)
+    def test_batch_zip_limits(self):
+        """Test oversized zip members are skipped and an oversized batch is rejected without leaving files"""
+        import io
+        import zipfile
+        
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('ok.pdf', b'%PDF-1.4 ok')
+            zf.writestr('bomba.pdf', b'0' * 100000)
+        
+        with patch('apps.billing.views.enqueue_bulk'):
+            response = self.client.post('/api/bills/batches/', {
+                'files': [SimpleUploadedFile('lote.zip', archive.getvalue(), content_type='application/zip')]
+            }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual([bill['name'] for bill in response.data['bills']], ['ok.pdf'])
+        self.assertEqual(response.data['skipped'], [{'name': 'bomba.pdf', 'reason': 'arquivo muito grande'}])
+        Bill.objects.filter(user=self.user).delete()
+        
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('ok.pdf', b'%PDF-1.4 ok')
+            zf.writestr('grande.pdf', b'%PDF-1.4 ' + b'0' * 1000)
+        
+        with override_settings(BILL_BATCH_MAX_TOTAL_SIZE=1000), \
+                patch('django.core.files.storage.FileSystemStorage.delete') as delete:
+            response = self.client.post('/api/bills/batches/', {
+                'files': [SimpleUploadedFile('lote.zip', archive.getvalue(), content_type='application/zip')]
+            }, format='multipart')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(delete.call_count, 1)
+        self.assertFalse(Bill.objects.filter(user=self.user).exists())
+    
+    def test_batch_insert_race(self):
+        """Test files inserted by a concurrent upload become duplicates and the rest is created"""
+        existing = Bill.objects.create(user=self.user, file_hash=hashlib.sha256(b'%PDF-1.4 jan').hexdigest())
+        
+        # The per-file lookup misses the bill the concurrent upload is inserting
+        with patch('django.db.models.query.QuerySet.first', return_value=None), \
+                patch('django.core.files.storage.FileSystemStorage.delete') as delete, \
+                patch('apps.billing.views.enqueue_bulk'):
+            response = self.client.post('/api/bills/batches/', {
+                'files': [
+                    SimpleUploadedFile('jan.pdf', b'%PDF-1.4 jan', content_type='application/pdf'),
+                    SimpleUploadedFile('fev.pdf', b'%PDF-1.4 fev', content_type='application/pdf'),
+                ]
+            }, format='multipart')
+        
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual([bill['name'] for bill in response.data['bills']], ['fev.pdf'])
+        self.assertEqual(response.data['duplicates'], [{'bill_id': existing.id, 'name': 'jan.pdf'}])
+        self.assertEqual(delete.call_count, 1)
+        batch = BillBatch.objects.get(id=response.data['batch_id'])
+        self.assertEqual(batch.total, 1)
+        self.assertEqual(list(batch.bills.values_list('file_hash', flat=True)),
+                         [hashlib.sha256(b'%PDF-1.4 fev').hexdigest()])
+    
+    def test_bill_status(self):
+        """Test status endpoint asks clients to poll until processing ends"""
+        bill = Bill.objects.create(user=self.user, file_hash='a' * 64)
+        
+        response = self.client.get(f'/api/bills/{bill.id}/status/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], Bill.Status.UPLOADED)
+        self.assertIn('Retry-After', response)
+        
+        Bill.objects.filter(id=bill.id).update(status=Bill.Status.PROCESSED)
+        response = self.client.get(f'/api/bills/{bill.id}/status/')
+        self.assertEqual(response.data['status'], Bill.Status.PROCESSED)
+        self.assertNotIn('Retry-After', response)
+    
+    def test_reprocess_bill(self):
+        """Test reprocessing resets the bill unless a worker holds it"""
+        bill = Bill.objects.create(user=self.user, file_hash='a' * 64, status=Bill.Status.FAILED,
+                                   error_message='OCR failed')
+        
+        with patch('apps.billing.views.enqueue_interactive') as enqueue, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/bills/{bill.id}/reprocess/')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        enqueue.assert_called_once_with(bill.id)
+        bill.refresh_from_db()
+        self.assertEqual(bill.status, Bill.Status.UPLOADED)
+        self.assertEqual(bill.error_message, '')
+        
+        Bill.objects.filter(id=bill.id).update(status=Bill.Status.PROCESSING, processing_started_at=timezone.now())
+        with patch('apps.billing.views.enqueue_interactive') as enqueue:
+            response = self.client.post(f'/api/bills/{bill.id}/reprocess/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        enqueue.assert_not_called()
+        
+        # The worker holding it died: past the lease the bill can be reset
+        Bill.objects.filter(id=bill.id).update(
+            processing_started_at=timezone.now() - timedelta(seconds=settings.BILL_PROCESSING_LEASE_SECONDS + 1)
+        )
+        with patch('apps.billing.views.enqueue_interactive') as enqueue, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/bills/{bill.id}/reprocess/')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        enqueue.assert_called_once_with(bill.id)
+    
+    def test_admin_reprocess_skips_live_claims(self):
+        """Test the admin action resets stale PROCESSING bills but not ones a worker holds"""
+        from django.contrib.admin.sites import site
+        from .admin import BillAdmin
+        
+        stale_start = timezone.now() - timedelta(seconds=settings.BILL_PROCESSING_LEASE_SECONDS + 1)
+        failed = Bill.objects.create(user=self.user, file_hash='a' * 64, status=Bill.Status.FAILED)
+        stuck = Bill.objects.create(user=self.user, file_hash='b' * 64, status=Bill.Status.PROCESSING,
+                                    processing_started_at=stale_start)
+        running = Bill.objects.create(user=self.user, file_hash='c' * 64, status=Bill.Status.PROCESSING,
+                                      processing_started_at=timezone.now())
+        
+        with patch('apps.billing.scheduling.enqueue_bulk') as enqueue_bulk, \
+                patch('apps.billing.admin.publish_status') as publish, \
+                patch.object(BillAdmin, 'message_user'):
+            BillAdmin(Bill, site).reprocess_bills(None, Bill.objects.all())
+        
+        self.assertEqual(sorted(call[0][0].id for call in publish.call_args_list), sorted([failed.id, stuck.id]))
+        self.assertTrue(all(call[0][0].status == Bill.Status.UPLOADED for call in publish.call_args_list))
+        enqueue_bulk.assert_called_once()
+        self.assertEqual(sorted(enqueue_bulk.call_args[0][1]), [failed.id, stuck.id])
+        self.assertEqual(
+            dict(Bill.objects.values_list('id', 'status')),
+            {failed.id: Bill.Status.UPLOADED, stuck.id: Bill.Status.UPLOADED, running.id: Bill.Status.PROCESSING}
+        )
+    
+    def test_status_updates_since_watermark(self):
+        """Test long-poll returns only status deltas after the watermark"""
+        bill = Bill.objects.create(user=self.user, file_hash='a' * 64)
+        other = Bill.objects.create(user=self.user, file_hash='b' * 64)
+        
+        with patch('apps.billing.events.get_redis', return_value=None):
+            response = self.client.get('/api/bills/status/updates/', {'since': '2000-01-01T00:00:00Z'})
+            self.assertEqual({change['id'] for change in response.data['changes']}, {bill.id, other.id})
+            self.assertNotIn('fornecedor', response.data['changes'][0])
+            since = response.data['since']
+            
+            response = self.client.get('/api/bills/status/updates/', {'since': since})
+            self.assertEqual(response.data['changes'], [])
+            self.assertEqual(response.data['since'], since)
+            
+            bill.status = Bill.Status.PROCESSED
+            bill.save()
+            other.save()
+            response = self.client.get('/api/bills/status/updates/', {'since': since, 'bill': bill.id})
+            self.assertEqual([change['id'] for change in response.data['changes']], [bill.id])
+            self.assertEqual(response.data['changes'][0]['status'], Bill.Status.PROCESSED)
+        
+        response = self.client.get('/api/bills/status/updates/', {'since': 'ontem'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_status_updates_same_timestamp(self):
+        """Test capped long-poll responses do not skip bills sharing an updated_at"""
+        bills = [Bill.objects.create(user=self.user, file_hash=char * 64) for char in 'abc']
+        updated_at = timezone.now()
+        Bill.objects.filter(user=self.user).update(updated_at=updated_at)
+        
+        seen = []
+        since = (updated_at - timedelta(seconds=1)).isoformat()
+        with patch('apps.billing.events.get_redis', return_value=None), \
+                patch('apps.billing.events.MAX_CHANGES', 2):
+            for _ in range(3):
+                response = self.client.get('/api/bills/status/updates/', {'since': since})
+                seen.extend(change['id'] for change in response.data['changes'])
+                since = response.data['since']
+        self.assertEqual(seen, [bill.id for bill in bills])
+    
+    @override_settings(BILL_STATUS_MAX_WAITERS_PER_USER=1)
+    def test_status_updates_over_waiter_cap_answer_at_once(self):
+        """Test a long-poll over the per-user cap is answered without subscribing"""
+        from . import events
+        
+        bill = Bill.objects.create(user=self.user, file_hash='a' * 64)
+        redis = Mock()
+        events._waiters[self.user.id] += 1
+        try:
+            with patch('apps.billing.events.get_redis', return_value=redis):
+                response = self.client.get('/api/bills/status/updates/', {'since': bill.updated_at.isoformat()})
+        finally:
+            events._release_waiter(self.user.id)
+        
+        self.assertEqual(response.data['changes'], [])
+        redis.pubsub.assert_not_called()
+        self.assertNotIn(self.user.id, events._waiters)
+    
     def test_list_bills(self):
         """Test bill list endpoint"""
         # Create test bills
@@ -163,6 +1645,30 @@ class BillAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
     
+    def test_list_bills_keyset_pages(self):
+        """Test cursor pages walk all bills newest first, without counting"""
+        from django.utils import timezone
+        
+        created_at = timezone.now()
+        for index in range(5):
+            bill = Bill.objects.create(user=self.user, file_hash=f'{index:064d}')
+            # Ties on created_at are broken by id
+            Bill.objects.filter(id=bill.id).update(created_at=created_at - timezone.timedelta(days=index // 2))
+        expected = list(Bill.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True))
+        
+        seen = []
+        url = '/api/bills/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen += [bill['id'] for bill in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+        
+        response = self.client.get('/api/bills/', {'cursor': 'invalido'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
     def test_bill_detail(self):
         """Test bill detail endpoint"""
         bill = Bill.objects.create(
@@ -179,6 +1685,132 @@ class BillAPITest(APITestCase):
         self.assertEqual(response.data['id'], bill.id)
         self.assertEqual(response.data['fornecedor'], 'Enel')
     
+    def test_bill_detail_conditional_get(self):
+        """Test unchanged bills answer 304 to ETag and Last-Modified revalidation"""
+        bill = Bill.objects.create(user=self.user, status=Bill.Status.PROCESSED, fornecedor='Enel')
+        
+        response = self.client.get(f'/api/bills/{bill.id}/')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        
+        response = self.client.get(f'/api/bills/{bill.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(response.content)
+        response = self.client.get(f'/api/bills/{bill.id}/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        bill.fornecedor = 'CPFL'
+        bill.save()
+        response = self.client.get(f'/api/bills/{bill.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['fornecedor'], 'CPFL')
+        
+        response = self.client.get('/api/bills/999999/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_list_loads_only_serialized_columns(self):
+        """Test the list query does not select parsed JSON or OCR output"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        Bill.objects.create(user=self.user, file_hash='a' * 64, parsed_json={'x': 1}, ocr_text='texto')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/bills/')
+        self.assertEqual(len(response.data['results']), 1)
+        bill_queries = [query['sql'] for query in queries if 'FROM "bills"' in query['sql']]
+        self.assertEqual(len(bill_queries), 1)
+        for column in ('parsed_json', 'ocr_text', 'ocr_words', 'endereco', 'error_message'):
+            self.assertNotIn(f'"{column}"', bill_queries[0])
+    
+    def test_delta_sync(self):
+        """Test sync returns created, updated and deleted bills after the watermark"""
+        from django.utils import timezone
+        
+        kept = Bill.objects.create(user=self.user, file_hash='a' * 64)
+        removed = Bill.objects.create(user=self.user, file_hash='b' * 64)
+        
+        response = self.client.get('/api/bills/sync/', {'limit': 1})
+        self.assertEqual([bill['id'] for bill in response.data['created']], [kept.id])
+        self.assertTrue(response.data['has_more'])
+        response = self.client.get('/api/bills/sync/', {'since': response.data['since'], 'limit': 1})
+        self.assertEqual([bill['id'] for bill in response.data['created']], [removed.id])
+        self.assertFalse(response.data['has_more'])
+        
+        # Caught up: age the rows past the settle window, then change them
+        Bill.objects.filter(user=self.user).update(
+            created_at=timezone.now() - timezone.timedelta(minutes=5),
+            updated_at=timezone.now() - timezone.timedelta(minutes=5)
+        )
+        since = self.client.get('/api/bills/sync/').data['since']
+        
+        kept.refresh_from_db()
+        kept.status = Bill.Status.PROCESSED
+        kept.save()
+        removed_id = removed.id
+        removed.delete()
+        added = Bill.objects.create(user=self.user, file_hash='c' * 64)
+        
+        response = self.client.get('/api/bills/sync/', {'since': since})
+        self.assertEqual([bill['id'] for bill in response.data['created']], [added.id])
+        self.assertEqual([bill['id'] for bill in response.data['updated']], [kept.id])
+        self.assertEqual(response.data['updated'][0]['status'], Bill.Status.PROCESSED)
+        self.assertEqual(response.data['deleted'], [removed_id])
+        self.assertFalse(response.data['reset'])
+        
+        response = self.client.get('/api/bills/sync/', {'since': 'invalido'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_delta_sync_pages_classify_by_issue_time(self):
+        """Test bills on later pages count as created only if new since the client's sync"""
+        from .sync import encode_sync_position
+        
+        synced = timezone.now() - timedelta(minutes=10)
+        old = Bill.objects.create(user=self.user, file_hash='a' * 64)
+        new = Bill.objects.create(user=self.user, file_hash='b' * 64)
+        # Created after the sync, then updated after the old bill changed
+        Bill.objects.filter(id=old.id).update(created_at=synced - timedelta(days=1),
+                                              updated_at=synced + timedelta(minutes=2))
+        Bill.objects.filter(id=new.id).update(created_at=synced + timedelta(minutes=1),
+                                              updated_at=synced + timedelta(minutes=3))
+        
+        since = encode_sync_position((synced, 0, synced))
+        response = self.client.get('/api/bills/sync/', {'since': since, 'limit': 1})
+        self.assertEqual([bill['id'] for bill in response.data['updated']], [old.id])
+        response = self.client.get('/api/bills/sync/', {'since': response.data['since'], 'limit': 1})
+        self.assertEqual([bill['id'] for bill in response.data['created']], [new.id])
+        self.assertEqual(response.data['updated'], [])
+    
+    def test_delta_sync_old_bills(self):
+        """Test paging through bills older than tombstone retention never resets"""
+        from .sync import encode_sync_position
+        
+        bills = [Bill.objects.create(user=self.user, file_hash=char * 64) for char in 'abc']
+        aged = timezone.now() - timedelta(days=200)
+        Bill.objects.filter(user=self.user).update(created_at=aged, updated_at=aged)
+        
+        seen = []
+        response = self.client.get('/api/bills/sync/', {'limit': 1})
+        seen += [bill['id'] for bill in response.data['created']]
+        while response.data['has_more']:
+            response = self.client.get('/api/bills/sync/', {'since': response.data['since'], 'limit': 1})
+            self.assertFalse(response.data['reset'])
+            seen += [bill['id'] for bill in response.data['created'] + response.data['updated']]
+        self.assertEqual(seen, [bill.id for bill in bills])
+        
+        # Caught up, then away longer than tombstones are kept
+        since = encode_sync_position((aged, 0, aged))
+        response = self.client.get('/api/bills/sync/', {'since': since})
+        self.assertTrue(response.data['reset'])
+        self.assertEqual(len(response.data['created']), 3)
+    
+    def test_user_deletion_leaves_no_tombstones(self):
+        """Test bills deleted together with their user are not tombstoned"""
+        from .models import BillTombstone
+        
+        Bill.objects.create(user=self.user, file_hash='a' * 64)
+        self.user.delete()
+        self.assertFalse(BillTombstone.objects.exists())
+    
     def test_unauthorized_access(self):
         """Test unauthorized access to bills"""
         self.client.force_authenticate(user=None)
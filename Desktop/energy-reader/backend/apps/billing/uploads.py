@@ -0,0 +1,43 @@
+import hashlib
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class HashingUploadHandlerMixin:
+    """Hash upload chunks as they arrive and attach the hex digest as ``file.sha256``"""
+
+    def new_file(self, *args, **kwargs):
+        self._sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # An inactive memory handler only passes chunks on to the next handler
+        if getattr(self, 'activated', True):
+            self._sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self._sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def file_sha256(file) -> str:
+    """SHA-256 of a file: the digest from the upload handler, else hashed in chunks"""
+    # A FieldFile wraps the uploaded file the handler annotated
+    digest = getattr(file, 'sha256', None) or getattr(getattr(file, '_file', None), 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
@@ -1,9 +1,17 @@
 from django.urls import path
-from .views import BillUploadView, BillListView, BillDetailView, reprocess_bill
+from .views import (
+    BillUploadView, BillListView, BillDetailView, BillStatusView,
+    bill_batch_progress, bill_status_updates, reprocess_bill, sync_bills, upload_bill_batch
+)
 
 urlpatterns = [
     path('upload/', BillUploadView.as_view(), name='bill-upload'),
+    path('batches/', upload_bill_batch, name='bill-batch-upload'),
+    path('batches/<int:pk>/', bill_batch_progress, name='bill-batch'),
     path('', BillListView.as_view(), name='bill-list'),
+    path('sync/', sync_bills, name='bill-sync'),
+    path('status/updates/', bill_status_updates, name='bill-status-updates'),
     path('<int:pk>/', BillDetailView.as_view(), name='bill-detail'),
+    path('<int:pk>/status/', BillStatusView.as_view(), name='bill-status'),
     path('<int:pk>/reprocess/', reprocess_bill, name='bill-reprocess'),
 ]
\ No newline at end of file
@@ -1,17 +1,35 @@
 import os
+from datetime import timedelta
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.dateparse import parse_datetime
 from django.utils._os import safe_join
 from rest_framework import generics, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-from .models import Bill
-from .serializers import BillUploadSerializer, BillSerializer, BillListSerializer
+from .batch import create_batch
+from .events import next_position, publish_status, wait_for_changes
+from .models import Bill, BillBatch
+from .serializers import (
+    BillUploadSerializer, BillSerializer, BillListSerializer, BillStatusSerializer, BillSyncSerializer
+)
 from .filters import BillFilter
-# from .tasks import process_bill_task
+from .pagination import BillCursorPagination, decode_position, encode_position
+from .sync import bill_changes, decode_sync_position, encode_sync_position
+from .scheduling import bulk_pending, enqueue_bulk, enqueue_interactive
+from .uploads import file_sha256
+
+# Statuses a client should keep polling on
+PENDING_STATUSES = (Bill.Status.UPLOADED, Bill.Status.PROCESSING)
 
 
 class BillUploadView(generics.CreateAPIView):
@@ -26,55 +44,111 @@ class BillUploadView(generics.CreateAPIView):
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        bill = serializer.save()
         
-        # Processar arquivo imediatamente
+        # Digest computed while the upload streamed in; checked before anything is stored
+        file_hash = file_sha256(serializer.validated_data['raw_file'])
+        existing = Bill.objects.filter(user=request.user, file_hash=file_hash).first()
+        if existing is not None:
+            if self._requeue(existing):
+                return self._accepted(request, existing, status.HTTP_202_ACCEPTED,
+                                      'Arquivo já enviado anteriormente, processamento reiniciado')
+            return self._accepted(request, existing, status.HTTP_200_OK, 'Arquivo já enviado anteriormente')
+        
+        if settings.BILL_DEDUP_ACROSS_USERS:
+            source = Bill.objects.filter(file_hash=file_hash, status=Bill.Status.PROCESSED).first()
+            if source is not None:
+                bill = Bill(user=request.user)
+                bill.copy_results_from(source)
+                try:
+                    with transaction.atomic():
+                        bill.save()
+                except IntegrityError:
+                    # Concurrent upload of the same file by the same user won the race
+                    existing = Bill.objects.get(user=request.user, file_hash=file_hash)
+                    return self._accepted(request, existing, status.HTTP_200_OK, 'Arquivo já enviado anteriormente')
+                return self._accepted(request, bill, status.HTTP_201_CREATED, 'Arquivo já processado')
+        
+        upload = serializer.validated_data['raw_file']
+        bill = Bill(user=request.user, file_hash=file_hash)
+        bill.raw_file.save(upload.name, upload, save=False)
         try:
-            from .simple_processor import SimpleProcessor
-            processor = SimpleProcessor()
-            
-            # Processar arquivo
-            bill.status = Bill.Status.PROCESSING
-            bill.save()
-            
-            ocr_data = processor.process_bill(bill.raw_file.path)
-            
-            if 'error' not in ocr_data:
-                # Atualizar bill com dados extraídos
-                for key, value in ocr_data.items():
-                    if hasattr(bill, key) and value:
-                        setattr(bill, key, value)
-                
-                bill.status = Bill.Status.PROCESSED
-                bill.processed_at = timezone.now()
-            else:
-                bill.status = Bill.Status.FAILED
-                bill.error_message = ocr_data['error']
-            
-            bill.save()
-            
-        except Exception as e:
-            bill.status = Bill.Status.FAILED
-            bill.error_message = str(e)
-            bill.save()
+            with transaction.atomic():
+                bill.save()
+        except IntegrityError:
+            # Concurrent upload of the same file by the same user won the race
+            bill.raw_file.delete(save=False)
+            existing = Bill.objects.get(user=request.user, file_hash=file_hash)
+            return self._accepted(request, existing, status.HTTP_200_OK, 'Arquivo já enviado anteriormente')
+        
+        # OCR runs in the worker; enqueue only once the bill row is committed
+        transaction.on_commit(lambda: enqueue_interactive(bill.id))
+        
+        return self._accepted(request, bill, status.HTTP_202_ACCEPTED, 'Arquivo recebido, processamento iniciado')
+    
+    def _requeue(self, bill) -> bool:
+        """Queue an earlier upload again if it failed or its enqueue was lost.
+        
+        Bills waiting on the bulk lane (batch members, admin reprocessing) are
+        queued by the fair scheduler and only wait longer, so they are left
+        there rather than queued a second time.
+        """
+        if bill.status == Bill.Status.UPLOADED and (bill.batch_id or bulk_pending(bill.user_id, bill.id)):
+            return False
+        now = timezone.now()
+        stale = now - timedelta(seconds=settings.BILL_PROCESSING_LEASE_SECONDS)
+        requeued = Bill.objects.filter(pk=bill.pk).filter(
+            Q(status=Bill.Status.FAILED) |
+            Q(status=Bill.Status.UPLOADED, updated_at__lt=stale, batch__isnull=True)
+        ).update(status=Bill.Status.UPLOADED, error_message='', updated_at=now)
+        if not requeued:
+            return False
         
+        bill.status = Bill.Status.UPLOADED
+        bill.error_message = ''
+        bill.updated_at = now
+        publish_status(bill)
+        transaction.on_commit(lambda: enqueue_interactive(bill.id))
+        return True
+    
+    def _accepted(self, request, bill, status_code, message):
         return Response({
             'bill_id': bill.id,
             'status': bill.status,
-            'message': 'Arquivo processado com sucesso!' if bill.status == 'PROCESSED' else 'Erro no processamento',
-            'data': BillSerializer(bill).data
-        }, status=status.HTTP_201_CREATED)
+            'status_url': request.build_absolute_uri(reverse('bill-status', args=[bill.id])),
+            'message': message
+        }, status=status_code)
+
+
+class BillStatusView(generics.RetrieveAPIView):
+    """Processing status of an uploaded bill"""
+    serializer_class = BillStatusSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return Bill.objects.filter(user=self.request.user).only(*BillStatusSerializer.Meta.fields)
+    
+    @extend_schema(
+        summary="Status do processamento",
+        description="Retorna o status do processamento da conta; dados completos em /api/bills/{id}/ quando processada"
+    )
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        if response.data['status'] in PENDING_STATUSES:
+            response['Retry-After'] = str(settings.BILL_STATUS_POLL_INTERVAL)
+        return response
 
 
 class BillListView(generics.ListAPIView):
     """List user's bills with filtering"""
     serializer_class = BillListSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = BillCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = BillFilter
     
     def get_queryset(self):
-        return Bill.objects.filter(user=self.request.user)
+        # Only the serialized columns: parsed JSON and OCR output stay in the table
+        return Bill.objects.filter(user=self.request.user).only(*BillListSerializer.Meta.fields)
     
     @extend_schema(
         summary="Listar contas do usuário",
@@ -83,6 +157,8 @@ class BillListView(generics.ListAPIView):
             OpenApiParameter('from_date', str, description='Data inicial (YYYY-MM-DD)'),
             OpenApiParameter('to_date', str, description='Data final (YYYY-MM-DD)'),
             OpenApiParameter('status', str, description='Status da conta'),
+            OpenApiParameter('cursor', str, description='Cursor da próxima página (link `next`)'),
+            OpenApiParameter('page_size', int, description='Contas por página (máx. 100)'),
         ]
     )
     def get(self, request, *args, **kwargs):
@@ -95,14 +171,164 @@ class BillDetailView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Bill.objects.filter(user=self.request.user)
+        # Stored OCR output is never serialized; leave it unloaded
+        return Bill.objects.filter(user=self.request.user).defer(*BillSerializer.Meta.exclude)
     
     @extend_schema(
         summary="Detalhes da conta",
-        description="Retorna detalhes completos da conta incluindo dados extraídos"
+        description="Retorna detalhes completos da conta incluindo dados extraídos. "
+                    "Suporta If-None-Match/If-Modified-Since (304 quando não alterada)"
     )
     def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
+        # Validators come from updated_at alone, so an unchanged bill costs one narrow query
+        updated_at = self.get_queryset().filter(pk=kwargs['pk']).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return super().get(request, *args, **kwargs)
+        
+        etag = quote_etag(f'{kwargs["pk"]}-{int(updated_at.timestamp() * 1000000)}')
+        last_modified = int(updated_at.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+@extend_schema(
+    summary="Upload em lote",
+    description="Envia vários arquivos (campo `files`) e/ou arquivos .zip de uma vez; o processamento é enfileirado em grupo"
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser])
+def upload_bill_batch(request):
+    """Upload many bills in one request"""
+    uploads = request.FILES.getlist('files')
+    if not uploads:
+        return Response({'error': 'Nenhum arquivo enviado'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    result = create_batch(request.user, uploads)
+    bill_ids = [bill.id for bill in result.bills]
+    if bill_ids:
+        # Bulk lane: served round-robin with other users' batches
+        transaction.on_commit(lambda: enqueue_bulk(request.user.id, bill_ids))
+    
+    return Response({
+        'batch_id': result.batch.id,
+        'status_url': request.build_absolute_uri(reverse('bill-batch', args=[result.batch.id])),
+        'bills': [{'bill_id': bill_id, 'name': result.names[bill_id]} for bill_id in bill_ids],
+        'duplicates': [{'bill_id': bill_id, 'name': name} for name, bill_id in result.duplicates],
+        'skipped': [{'name': name, 'reason': reason} for name, reason in result.skipped],
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@extend_schema(
+    summary="Progresso do lote",
+    description="Contagem de contas do lote por status"
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def bill_batch_progress(request, pk):
+    """Aggregate processing progress of a batch"""
+    try:
+        batch = BillBatch.objects.get(pk=pk, user=request.user)
+    except BillBatch.DoesNotExist:
+        return Response(
+            {'error': 'Lote não encontrado'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    counts = {choice: 0 for choice in Bill.Status.values}
+    counts.update(batch.bills.values_list('status').annotate(count=Count('id')).order_by())
+    finished = counts[Bill.Status.PROCESSED] + counts[Bill.Status.FAILED]
+    
+    return Response({
+        'batch_id': batch.id,
+        'total': batch.total,
+        'counts': counts,
+        'progress': round(finished / batch.total, 4) if batch.total else 1.0,
+        'finished': finished >= sum(counts.values()),
+        'created_at': batch.created_at,
+    })
+
+
+@extend_schema(
+    summary="Sincronização incremental",
+    description="Contas criadas, alteradas ou excluídas desde a marca d'água `since` da sincronização anterior",
+    parameters=[
+        OpenApiParameter('since', str, description='Marca d\'água da resposta anterior (vazio na primeira sincronização)'),
+        OpenApiParameter('limit', int, description='Máximo de contas por resposta'),
+    ]
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_bills(request):
+    """Delta sync of the user's bills"""
+    since = None
+    if request.query_params.get('since'):
+        since = decode_sync_position(request.query_params['since'])
+        if since is None:
+            return Response({'error': 'since inválido'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = int(request.query_params.get('limit', settings.BILL_SYNC_PAGE_SIZE))
+    except ValueError:
+        return Response({'error': 'Parâmetro inválido'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = min(max(limit, 1), settings.BILL_SYNC_PAGE_SIZE)
+    
+    delta = bill_changes(request.user, since, limit)
+    
+    return Response({
+        'created': BillSyncSerializer(delta.created, many=True).data,
+        'updated': BillSyncSerializer(delta.updated, many=True).data,
+        'deleted': delta.deleted,
+        'since': encode_sync_position(delta.position),
+        'has_more': delta.has_more,
+        'reset': delta.reset,
+    })
+
+
+@extend_schema(
+    summary="Atualizações de status (long-poll)",
+    description="Aguarda até que alguma conta do usuário mude de status após `since` e retorna apenas os deltas",
+    parameters=[
+        OpenApiParameter('since', str, description='Marca d\'água da resposta anterior ou `updated_at` da conta (ISO 8601)'),
+        OpenApiParameter('bill', int, description='Aguardar apenas esta conta'),
+        OpenApiParameter('timeout', int, description='Segundos máximos de espera'),
+    ]
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def bill_status_updates(request):
+    """Long-poll for bill status transitions"""
+    since = (timezone.now(), None)
+    if request.query_params.get('since'):
+        # Watermark from a previous response, or a bill's updated_at to wait past
+        since = decode_position(request.query_params['since'])
+        if since is None:
+            timestamp = parse_datetime(request.query_params['since'])
+            if timestamp is None:
+                return Response({'error': 'since inválido'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(timestamp):
+                timestamp = timezone.make_aware(timestamp)
+            since = (timestamp, None)
+    try:
+        bill_id = int(request.query_params['bill']) if request.query_params.get('bill') else None
+        timeout = float(request.query_params.get('timeout', settings.BILL_STATUS_LONG_POLL_TIMEOUT))
+    except ValueError:
+        return Response({'error': 'Parâmetro inválido'}, status=status.HTTP_400_BAD_REQUEST)
+    timeout = min(max(timeout, 0), settings.BILL_STATUS_LONG_POLL_TIMEOUT)
+    
+    changes = wait_for_changes(request.user.id, since, bill_id=bill_id, timeout=timeout)
+    
+    # Clients pass the watermark back as `since` on the next call
+    timestamp, pk = next_position(changes, since)
+    return Response({
+        'changes': changes,
+        'since': encode_position(timestamp, pk) if pk is not None else timestamp.isoformat()
+    })
 
 
 @extend_schema(
@@ -113,6 +339,8 @@ class BillDetailView(generics.RetrieveAPIView):
 @permission_classes([IsAuthenticated])
 def reprocess_bill(request, pk):
     """Reprocess a bill"""
+    from .tasks import unclaimed
+    
     try:
         bill = Bill.objects.get(pk=pk, user=request.user)
     except Bill.DoesNotExist:
@@ -121,14 +349,26 @@ def reprocess_bill(request, pk):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Reset status and trigger reprocessing
+    # Reset status and trigger reprocessing, unless a live worker holds the bill right now
     bill.status = Bill.Status.UPLOADED
     bill.error_message = ''
-    bill.save()
+    bill.updated_at = timezone.now()
+    reset = Bill.objects.filter(unclaimed(), pk=bill.pk).update(
+        status=bill.status,
+        error_message=bill.error_message,
+        updated_at=bill.updated_at
+    )
+    if not reset:
+        return Response(
+            {'error': 'Conta já está em processamento'},
+            status=status.HTTP_409_CONFLICT
+        )
+    publish_status(bill)
     
-    # process_bill_task.delay(bill.id)
+    transaction.on_commit(lambda: enqueue_interactive(bill.id))
     
     return Response({
         'message': 'Reprocessamento iniciado',
-        'status': bill.status
-    })
\ No newline at end of file
+        'status': bill.status,
+        'status_url': request.build_absolute_uri(reverse('bill-status', args=[bill.id]))
+    }, status=status.HTTP_202_ACCEPTED)
\ No newline at end of file
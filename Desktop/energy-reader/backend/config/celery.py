@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -14,6 +15,18 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_process_init.connect
+def warm_ocr_engines(**kwargs):
+    """Load OCR engines once per worker process instead of once per bill"""
+    import logging
+    from apps.billing.ocr.pool import get_engine_pool
+    try:
+        get_engine_pool().warm_up()
+    except Exception as exc:
+        # Engines are loaded lazily on the first task if warm-up fails
+        logging.getLogger(__name__).warning(f"OCR warm-up failed: {type(exc).__name__}")
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from celery.schedules import crontab
 from decouple import config
 import dj_database_url
 
@@ -155,14 +156,101 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Uploads are processed by the worker; run tasks inline for local development without a broker
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+# Interactive uploads and bulk work (batches, admin reprocessing) run in separate lanes;
+# give the "interactive" queue its own workers (see docker-compose.yml)
+CELERY_TASK_ROUTES = {
+    'apps.billing.tasks.process_bill_task': {'queue': 'interactive'},
+}
+# Workers reserve one task at a time, so queued work is not hoarded by busy processes
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Periodic maintenance, run by the celery-beat service
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-bulk-bills': {
+        'task': 'apps.billing.tasks.dispatch_bulk_task',
+        'schedule': crontab(),
+    },
+    'evict-stale-ocr-cache': {
+        'task': 'apps.billing.tasks.evict_stale_ocr_cache_task',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'purge-bill-tombstones': {
+        'task': 'apps.billing.tasks.purge_bill_tombstones_task',
+        'schedule': crontab(hour=3, minute=30),
+    },
+}
+# Bulk bills handed to Celery at once across all users (round-robin per user), and
+# seconds after which the slot of a task that never reported back is reclaimed
+BULK_MAX_IN_FLIGHT = config('BULK_MAX_IN_FLIGHT', default=4, cast=int)
+BULK_TASK_LEASE_SECONDS = config('BULK_TASK_LEASE_SECONDS', default=1800, cast=int)
+# Seconds after which a bill left in PROCESSING by a dead worker may be claimed again
+BILL_PROCESSING_LEASE_SECONDS = config('BILL_PROCESSING_LEASE_SECONDS', default=1800, cast=int)
+# Seconds clients should wait between status polls (Retry-After on /api/bills/<id>/status/)
+BILL_STATUS_POLL_INTERVAL = config('BILL_STATUS_POLL_INTERVAL', default=2, cast=int)
+# Status transitions are published on Redis pub/sub; long-polls are held at most this many seconds
+REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
+BILL_STATUS_LONG_POLL_TIMEOUT = config('BILL_STATUS_LONG_POLL_TIMEOUT', default=25, cast=int)
+# Long-polls held at once per web process, and per user within it; requests over
+# either cap are answered at once and the client backs off to polling
+BILL_STATUS_MAX_WAITERS = config('BILL_STATUS_MAX_WAITERS', default=500, cast=int)
+BILL_STATUS_MAX_WAITERS_PER_USER = config('BILL_STATUS_MAX_WAITERS_PER_USER', default=4, cast=int)
 
 # OCR Settings
 TESSERACT_CMD = config('TESSERACT_CMD', default='tesseract')
 PADDLEOCR_USE_GPU = config('PADDLEOCR_USE_GPU', default=False, cast=bool)
+# Warm engine pool: recycle after N bills or when worker RSS exceeds the ceiling (0 disables)
+OCR_POOL_MAX_TASKS = config('OCR_POOL_MAX_TASKS', default=200, cast=int)
+OCR_POOL_MAX_MEMORY_MB = config('OCR_POOL_MAX_MEMORY_MB', default=2048, cast=int)
+# Worker processes whose RSS stays high after an engine recycle are replaced by Celery (KB)
+CELERY_WORKER_MAX_MEMORY_PER_CHILD = config('CELERY_WORKER_MAX_MEMORY_PER_CHILD', default=3 * 1024 * 1024, cast=int)
+# Pages OCR'd in parallel per bill. Keep OCR_PAGE_WORKERS x celery --concurrency close to
+# the core count: raise it for low-concurrency workers handling large multi-page bills.
+# Values > 1 need `celery worker --pool solo`: prefork children cannot start the page pool.
+OCR_PAGE_WORKERS = config('OCR_PAGE_WORKERS', default=1, cast=int)
+# Born-digital PDFs: pages whose text layer has at least this many alphanumerics skip OCR
+OCR_USE_TEXT_LAYER = config('OCR_USE_TEXT_LAYER', default=True, cast=bool)
+OCR_TEXT_LAYER_MIN_CHARS = config('OCR_TEXT_LAYER_MIN_CHARS', default=100, cast=int)
+# 'cascade' runs Tesseract only on pages/lines PaddleOCR is unsure of; 'combined' always runs both
+OCR_ENGINE_MODE = config('OCR_ENGINE_MODE', default='cascade')
+OCR_CASCADE_MIN_CONFIDENCE = config('OCR_CASCADE_MIN_CONFIDENCE', default=0.85, cast=float)
+# 'auto' picks digital/scan/phone_photo per page from noise and lighting estimates
+OCR_PREPROCESSING_PROFILE = config('OCR_PREPROCESSING_PROFILE', default='auto')
+# Keep recognized lines with boxes so the parser can read values next to their labels
+OCR_RETURN_LAYOUT = config('OCR_RETURN_LAYOUT', default=True, cast=bool)
+# OCR only the field regions of a layout template registered with register_template
+# (ocr/templates.py; none ship built in),
+# falling back to full-page OCR when a required field is not read
+OCR_USE_TEMPLATES = config('OCR_USE_TEMPLATES', default=False, cast=bool)
+# Pre-OCR layout identification: page-1 header hashes within this many differing bits
+# (of 64) match a registered layout (manage.py register_layout)
+LAYOUT_FINGERPRINT_MAX_DISTANCE = config('LAYOUT_FINGERPRINT_MAX_DISTANCE', default=10, cast=int)
+# Seconds a known layout stays cached per process; edits reach other workers after this
+LAYOUT_FINGERPRINT_CACHE_TIMEOUT = config('LAYOUT_FINGERPRINT_CACHE_TIMEOUT', default=300, cast=int)
+
+# Bulk re-parse of stored OCR output (manage.py reparse_bills): bills per chunk and parser processes
+REPARSE_CHUNK_SIZE = config('REPARSE_CHUNK_SIZE', default=500, cast=int)
+REPARSE_WORKERS = config('REPARSE_WORKERS', default=2, cast=int)
 
 # File Upload
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+# Uploads are SHA-256 hashed chunk by chunk while they are received (Bill.file_hash)
+FILE_UPLOAD_HANDLERS = [
+    'apps.billing.uploads.HashingMemoryFileUploadHandler',
+    'apps.billing.uploads.HashingTemporaryFileUploadHandler',
+]
+# Reuse another user's processed bill (stored file and OCR result) for identical uploads
+BILL_DEDUP_ACROSS_USERS = config('BILL_DEDUP_ACROSS_USERS', default=False, cast=bool)
+# Batch uploads (/api/bills/batches/): files per batch (zip members included) and sizes after decompression
+BILL_BATCH_MAX_FILES = config('BILL_BATCH_MAX_FILES', default=100, cast=int)
+BILL_BATCH_MAX_FILE_SIZE = config('BILL_BATCH_MAX_FILE_SIZE', default=20 * 1024 * 1024, cast=int)
+BILL_BATCH_MAX_TOTAL_SIZE = config('BILL_BATCH_MAX_TOTAL_SIZE', default=500 * 1024 * 1024, cast=int)
+# Delta sync (/api/bills/sync/): bills per response, seconds re-sent to cover late commits,
+# and how long deletions are remembered (older watermarks get a full resync)
+BILL_SYNC_PAGE_SIZE = config('BILL_SYNC_PAGE_SIZE', default=500, cast=int)
+BILL_SYNC_SETTLE_SECONDS = config('BILL_SYNC_SETTLE_SECONDS', default=5, cast=int)
+BILL_TOMBSTONE_RETENTION_DAYS = config('BILL_TOMBSTONE_RETENTION_DAYS', default=90, cast=int)
 
 # Logging
 LOGGING = {
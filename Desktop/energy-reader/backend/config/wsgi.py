@@ -3,4 +3,14 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+try:
+    from gevent import monkey
+except ImportError:
+    monkey = None
+
+if monkey is not None and monkey.is_module_patched('socket'):
+    # Under gunicorn's gevent worker: let psycopg2 yield while waiting on Postgres
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
 application = get_wsgi_application()
\ No newline at end of file
@@ -1,14 +1,21 @@
 import React from 'react';
 import { View, StyleSheet, FlatList, RefreshControl } from 'react-native';
 import { Card, Text, Chip, ActivityIndicator } from 'react-native-paper';
-import { useQuery } from '@tanstack/react-query';
+import { useInfiniteQuery } from '@tanstack/react-query';
 import { api } from '../../services/api';
 
 export default function HistoryScreen({ navigation }: any) {
-  const { data: bills, isLoading, refetch } = useQuery({
-    queryKey: ['bills'],
-    queryFn: () => api.getBills(),
+  const { data, isLoading, refetch, fetchNextPage, hasNextPage, isFetchingNextPage } = useInfiniteQuery({
+    queryKey: ['bills', 'history'],
+    queryFn: ({ pageParam }) => api.getBills(pageParam),
+    initialPageParam: null as string | null,
+    // The cursor is carried in the `next` link
+    getNextPageParam: (lastPage: any) => {
+      const match = lastPage.next?.match(/[?&]cursor=([^&]+)/);
+      return match ? decodeURIComponent(match[1]) : undefined;
+    },
   });
+  const bills = data?.pages.flatMap((page: any) => page.results) || [];
 
   const getStatusColor = (status: string) => {
     switch (status) {
@@ -88,12 +95,19 @@ export default function HistoryScreen({ navigation }: any) {
   return (
     <View style={styles.container}>
       <FlatList
-        data={bills?.results || []}
+        data={bills}
         renderItem={renderBill}
         keyExtractor={(item) => item.id.toString()}
         refreshControl={
           <RefreshControl refreshing={isLoading} onRefresh={refetch} />
         }
+        onEndReached={() => {
+          if (hasNextPage && !isFetchingNextPage) {
+            fetchNextPage();
+          }
+        }}
+        onEndReachedThreshold={0.5}
+        ListFooterComponent={isFetchingNextPage ? <ActivityIndicator style={styles.footer} /> : null}
         ListEmptyComponent={
           <View style={styles.empty}>
             <Text variant="bodyLarge" style={styles.emptyText}>
@@ -123,6 +137,9 @@ const styles = StyleSheet.create({
   listContainer: {
     padding: 15,
   },
+  footer: {
+    marginVertical: 15,
+  },
   billCard: {
     marginBottom: 15,
   },
@@ -74,16 +74,22 @@ export default function UploadScreen() {
       
       const response = await api.uploadBill(formData);
       
-      setProgress(0.7); // Upload concluído, processando
+      setProgress(0.5); // Upload concluído, processando no servidor
       
-      // Aguardar um pouco para mostrar o processamento
-      await new Promise(resolve => setTimeout(resolve, 1000));
+      const result = await api.waitForBill(response.bill_id);
+      if (result.status === 'FAILED') {
+        throw new Error(result.error_message || 'Erro no processamento');
+      }
       
-      setProgress(1); // Processamento concluído
+      setProgress(1);
       
-      const message = response.data?.fornecedor ? 
-        `Conta processada com sucesso!\n\nFornecedor: ${response.data.fornecedor}\nConsumo: ${response.data.consumo_kwh || 'N/A'} kWh\nValor: R$ ${response.data.valor_total ? parseFloat(response.data.valor_total).toFixed(2) : 'N/A'}` :
-        'Conta enviada com sucesso! Dados extraídos automaticamente.';
+      let message = 'Conta enviada! O processamento continua em segundo plano.';
+      if (result.status === 'PROCESSED') {
+        const bill = await api.getBill(response.bill_id);
+        message = bill.fornecedor ?
+          `Conta processada com sucesso!\n\nFornecedor: ${bill.fornecedor}\nConsumo: ${bill.consumo_kwh || 'N/A'} kWh\nValor: R$ ${bill.valor_total ? parseFloat(bill.valor_total).toFixed(2) : 'N/A'}` :
+          'Conta enviada com sucesso! Dados extraídos automaticamente.';
+      }
       
       Alert.alert(
         'Sucesso!', 
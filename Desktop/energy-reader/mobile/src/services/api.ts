@@ -21,12 +21,34 @@ interface RegisterData {
   last_name?: string;
 }
 
+interface UploadResponse {
+  bill_id: number;
+  status: string;
+  status_url: string;
+  message: string;
+}
+
+interface BillStatus {
+  id: number;
+  status: 'UPLOADED' | 'PROCESSING' | 'PROCESSED' | 'FAILED';
+  error_message: string;
+  processed_at: string | null;
+  updated_at: string;
+}
+
+interface BillUpdates {
+  changes: Array<Pick<BillStatus, 'id' | 'status' | 'error_message' | 'updated_at'>>;
+  since: string;
+}
+
 class ApiService {
   private baseURL = API_BASE_URL;
   private token: string | null = null;
+  private etags = new Map<string, { etag: string; body: any }>();
 
   setToken(token: string) {
     this.token = token;
+    this.etags.clear();
   }
 
   private async request(endpoint: string, options: RequestInit = {}) {
@@ -53,8 +75,36 @@ class ApiService {
     return response.json();
   }
 
+  // Responses with an ETag are revalidated with If-None-Match; a 304 reuses the cached body
   private async get(endpoint: string) {
-    return this.request(endpoint, { method: 'GET' });
+    const cached = this.etags.get(endpoint);
+    const headers: any = {
+      'Content-Type': 'application/json',
+    };
+
+    if (this.token) {
+      headers['Authorization'] = `Bearer ${this.token}`;
+    }
+    if (cached) {
+      headers['If-None-Match'] = cached.etag;
+    }
+
+    const response = await fetch(`${this.baseURL}${endpoint}`, { method: 'GET', headers });
+
+    if (response.status === 304 && cached) {
+      return cached.body;
+    }
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ message: 'Network error' }));
+      throw new Error(error.message || `HTTP ${response.status}`);
+    }
+
+    const body = await response.json();
+    const etag = response.headers.get('ETag');
+    if (etag) {
+      this.etags.set(endpoint, { etag, body });
+    }
+    return body;
   }
 
   private async post(endpoint: string, data: any) {
@@ -107,14 +157,51 @@ class ApiService {
   }
 
   // Bills endpoints
-  async getBills() {
-    return this.get('/bills/');
+  async getBills(cursor?: string | null) {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    return this.get(`/bills/${query}`);
   }
 
-  async uploadBill(formData: FormData) {
+  async uploadBill(formData: FormData): Promise<UploadResponse> {
     return this.postFormData('/bills/upload/', formData);
   }
 
+  async getBill(id: number) {
+    return this.get(`/bills/${id}/`);
+  }
+
+  async getBillStatus(id: number): Promise<BillStatus> {
+    return this.get(`/bills/${id}/status/`);
+  }
+
+  // Long-polls: the server holds the request until a bill changes after `since`
+  async getBillUpdates(since: string, billId?: number): Promise<BillUpdates> {
+    const params = new URLSearchParams({ since });
+    if (billId !== undefined) {
+      params.append('bill', String(billId));
+    }
+    return this.get(`/bills/status/updates/?${params.toString()}`);
+  }
+
+  // Waits for the worker to finish a bill (or gives up after timeoutMs)
+  async waitForBill(id: number, timeoutMs = 120000): Promise<BillStatus> {
+    const deadline = Date.now() + timeoutMs;
+    let bill = await this.getBillStatus(id);
+    let since = bill.updated_at;
+    while ((bill.status === 'UPLOADED' || bill.status === 'PROCESSING') && Date.now() < deadline) {
+      const updates = await this.getBillUpdates(since, id);
+      since = updates.since;
+      for (const change of updates.changes) {
+        bill = { ...bill, ...change };
+      }
+      if (updates.changes.length === 0) {
+        // Server without pub/sub answers at once: back off like a plain poll
+        await new Promise(resolve => setTimeout(resolve, 2000));
+      }
+    }
+    return bill;
+  }
+
   // Analytics endpoints
   async getAnalyticsSummary() {
     return this.get('/analytics/summary/');
@@ -190,6 +190,12 @@ export interface ApiResponse<T> {
   previous: string | null;
 }
 
+// Keyset-paginated lists: follow `next` until it is null
+export interface CursorPage<T> {
+  results: T[];
+  next: string | null;
+}
+
 export interface ApiError {
   message: string;
   status: number;